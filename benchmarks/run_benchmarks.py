@@ -0,0 +1,229 @@
+"""
+Benchmarks of the hot paths: loading and saving workbooks, finding alternatives, generating quizzes and
+updating the learning progress.
+
+Synthetic workbooks are generated for every size, the results are written as JSON so that they can be compared
+between commits:
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vocabulary import alternatives, dataaccess  # noqa: E402
+from vocabulary.distractorworkers import DistractorWorkers  # noqa: E402
+from vocabulary.learningprogress import Progress  # noqa: E402
+from vocabulary.lengthbuckets import LengthBuckets  # noqa: E402
+from vocabulary.minhashindex import MinHashIndex  # noqa: E402
+from vocabulary.models import Flashcard, WordCollection, WordList  # noqa: E402
+from vocabulary.poolregistry import PoolRegistry  # noqa: E402
+from vocabulary.similarityindex import SimilarityIndex  # noqa: E402
+from vocabulary.stateless import Vocabulary, SHORTLIST_COUNT, ALTERNATIVES_COUNT  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_REPEAT = 3
+DEFAULT_ROWS_PER_SHEET = 10000
+DEFAULT_SEED = 12345
+
+_LETTERS = "abcdefghijklmnopqrstuvwxyzäöå"
+
+
+def _random_expression(rng: random.Random) -> str:
+    words = ["".join(rng.choice(_LETTERS) for _ in range(rng.randint(2, 10))) for _ in range(rng.randint(1, 4))]
+    expression = " ".join(words)
+    return expression + rng.choice(["", "", "", "?", "!"])
+
+
+def generate_word_collection(row_count: int, rows_per_sheet: int, seed: int) -> WordCollection:
+    """
+    Word collection with row_count flashcards in sheets of at most rows_per_sheet rows
+    """
+    rng = random.Random(seed)
+    word_lists = {}
+    for sheet_index, start in enumerate(range(0, row_count, rows_per_sheet)):
+        name = f"Sheet {sheet_index + 1}"
+        size = min(rows_per_sheet, row_count - start)
+        # The first row is for language information
+        word_lists[name] = WordList(name, "lang1", "lang2", {
+            row: Flashcard(_random_expression(rng), _random_expression(rng), "", Progress.NEW)
+            for row in range(2, size + 2)})
+    return WordCollection("lang1", "lang2", word_lists)
+
+
+class Benchmark:
+    """
+    Times a function several times, the peak memory is measured in a separate run with tracemalloc
+    """
+
+    def __init__(self, repeat: int):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name: str, rows: int, function, setup=None, iterations: int = 1, ops: int = 1):
+        """
+        :param function: the measured function, called with the result of setup
+        :param setup: called before every run, it isn't measured
+        :param iterations: number of calls of function per run
+        :param ops: number of operations (queries, answers...) per call of function,
+            the time per operation is recorded so that the benchmarks can be compared
+        """
+        times = []
+        for _ in range(self.repeat):
+            argument = setup() if setup is not None else None
+            start = time.perf_counter()
+            for _ in range(iterations):
+                function(argument)
+            times.append((time.perf_counter() - start) / (iterations * ops))
+
+        argument = setup() if setup is not None else None
+        tracemalloc.start()
+        try:
+            function(argument)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            "benchmark": name,
+            "rows": rows,
+            "repeat": self.repeat,
+            "iterations": iterations,
+            "ops": ops,
+            "times": times,
+            "min": min(times),
+            "median": statistics.median(times),
+            "peak_memory_bytes": peak_memory,
+        }
+        self.results.append(result)
+        print(f"{name:<24} {rows:>8} rows  min {result['min']:.6f} s/op  median {result['median']:.6f} s/op  "
+              f"peak {peak_memory / 1024 / 1024:.1f} MiB", flush=True)
+        return result
+
+
+def run_size(benchmark: Benchmark, row_count: int, rows_per_sheet: int, seed: int, directory: str):
+    word_collection = generate_word_collection(row_count, rows_per_sheet, seed)
+    wb_path = os.path.join(directory, f"benchmark_{row_count}.xlsx")
+    dataaccess.save_wordlist_book(wb_path, word_collection, write_only=True)
+
+    benchmark.run("save_wordlist_book", row_count,
+                  lambda _: dataaccess.save_wordlist_book(os.path.join(directory, "saved.xlsx"), word_collection))
+    benchmark.run("load_wordlist_book", row_count,
+                  lambda _: dataaccess.load_wordlist_book(wb_path, max_rows=None))
+
+    pool = [flashcard.lang1 for word_list in word_collection.word_lists.values()
+            for flashcard in word_list.flashcards.values()]
+    rng = random.Random(seed)
+    expressions = [rng.choice(pool) for _ in range(20)]
+    # The scans of the whole pool only run a few of the queries
+    slow_expressions = expressions[:2]
+    benchmark.run("most_similar", row_count,
+                  lambda _: [alternatives.most_similar(expression, pool, SHORTLIST_COUNT, ALTERNATIVES_COUNT,
+                                                       alternatives.calc_similarity)
+                             for expression in slow_expressions], ops=len(slow_expressions))
+    index = SimilarityIndex(pool)
+    benchmark.run("most_similar_index", row_count,
+                  lambda _: [alternatives.most_similar(expression, pool, SHORTLIST_COUNT, ALTERNATIVES_COUNT,
+                                                       alternatives.calc_similarity, index)
+                             for expression in expressions], ops=len(expressions))
+    length_buckets = LengthBuckets(pool)
+    benchmark.run("most_similar_buckets", row_count,
+                  lambda _: [alternatives.most_similar(expression, pool, SHORTLIST_COUNT, ALTERNATIVES_COUNT,
+                                                       alternatives.calc_similarity, length_buckets)
+                             for expression in slow_expressions], ops=len(slow_expressions))
+    minhash_index = MinHashIndex(pool)
+    benchmark.run("most_similar_minhash", row_count,
+                  lambda _: [alternatives.most_similar(expression, pool, SHORTLIST_COUNT, ALTERNATIVES_COUNT,
+                                                       alternatives.calc_similarity, minhash_index)
+                             for expression in expressions], ops=len(expressions))
+
+    # Seeded, so that every run picks the same rows and alternatives
+    vocabulary = Vocabulary(PoolRegistry(), rng=random.Random(seed))
+    vocabulary.load(wb_path, lambda path: dataaccess.load_wordlist_book(path, max_rows=None))
+    word_list_name = next(iter(vocabulary.word_collection.word_lists))
+
+    def cold_vocabulary():
+        # The shortlists cached by the earlier runs are dropped
+        alternatives.shortlist_cache.invalidate()
+        return vocabulary
+
+    benchmark.run("choice_quiz_cold", row_count,
+                  lambda voc: voc.choice_quiz(word_list_name, "adaptive"), setup=cold_vocabulary)
+    # The alternatives of the questions are calculated by worker processes, the workers are started before
+    vocabulary.distractor_workers = DistractorWorkers()
+    try:
+        vocabulary.distractor_workers.start(vocabulary.word_pool_lang1, vocabulary.shared_pool.key)
+        benchmark.run("choice_quiz_cold_workers", row_count,
+                      lambda voc: voc.choice_quiz(word_list_name, "adaptive"), setup=cold_vocabulary)
+    finally:
+        vocabulary.distractor_workers.close()
+        vocabulary.distractor_workers = None
+    benchmark.run("choice_quiz_warm", row_count,
+                  lambda voc: voc.choice_quiz(word_list_name, "adaptive"), setup=lambda: vocabulary, iterations=10)
+
+    row_keys = list(vocabulary.word_collection.word_lists[word_list_name].flashcards)
+    answers = [(rng.choice(row_keys), rng.random() < 0.8) for _ in range(1000)]
+
+    def update_progress(voc):
+        for row_key, correct in answers:
+            voc.update_progress(word_list_name, row_key, correct)
+
+    benchmark.run("update_progress", row_count, update_progress, setup=lambda: vocabulary, ops=len(answers))
+    benchmark.run("get_progress", row_count,
+                  lambda voc: voc.get_progress(word_list_name), setup=lambda: vocabulary, iterations=100)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="number of rows of the generated workbooks (e. g. 1000 10000 100000 500000)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="number of timed runs per benchmark")
+    parser.add_argument("--rows-per-sheet", type=int, default=DEFAULT_ROWS_PER_SHEET)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default="benchmark_results.json", help="path of the JSON results")
+    args = parser.parse_args(argv)
+
+    benchmark = Benchmark(args.repeat)
+    with tempfile.TemporaryDirectory() as directory:
+        for row_count in args.sizes:
+            run_size(benchmark, row_count, args.rows_per_sheet, args.seed, directory)
+
+    report = {
+        "metadata": {
+            "commit": _git_commit(),
+            "date": datetime.now().isoformat(),
+            "python": sys.version,
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "rows_per_sheet": args.rows_per_sheet,
+            "seed": args.seed,
+        },
+        "results": benchmark.results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
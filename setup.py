@@ -12,6 +12,6 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     classifiers=[
     ],
-    install_requires=['et-xmlfile==1.0.1', 'jdcal==1.4.1', "ngram==3.3.2", "openpyxl==3.0.5"],
+    install_requires=['et-xmlfile==1.0.1', 'jdcal==1.4.1', "ngram==3.3.2", "openpyxl==3.0.5", "numpy>=1.19"],
     python_requires='>=3.6'
 )
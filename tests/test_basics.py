@@ -1,14 +1,25 @@
+import os
+import random
+import tracemalloc
 import unittest
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
 import openpyxl
 import pickle
 from copy import deepcopy
 
-from vocabulary import dataaccess, alternatives
+from vocabulary import dataaccess, alternatives, loadcache
 from vocabulary import learningprogress
 from vocabulary import vocabulary
 
-from tests.utils import TEST_DICT_PATH, reset_test_env
-from vocabulary.models import Flashcard, Question, WordList, WordCollection
+from tests.utils import TEST_DICT_PATH, TEST_DICT_OUT_PATH, reset_test_env
+from vocabulary.models import Flashcard, Question, WordList, WordCollection, LearningProgress, ProgressOverlay
+from vocabulary.similarityindex import SimilarityIndex
+from vocabulary.batchscoring import BatchScorer
+from vocabulary.lengthbuckets import LengthBuckets
+from vocabulary.minhashindex import MinHashIndex
+from vocabulary.instrumentation import Metrics, set_instrumentation
 from typing import Dict
 
 import logging
@@ -67,6 +78,194 @@ class TestFileMgr(unittest.TestCase):
         assert wb["shorttest"]["D5"].value == 5
         assert int(wb["shorttest"]["D8"].value) == 8
 
+    def test_save_write_only(self):
+        # Verify that the streaming export writes the same rows and the language header
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        word_list = word_collection.word_lists["shorttest"]
+        # Skipped rows must stay empty
+        del word_list.flashcards[4]
+        dataaccess.save_wordlist_book(wb_path=TEST_DICT_OUT_PATH, word_collection=word_collection, write_only=True)
+
+        wb = openpyxl.load_workbook(TEST_DICT_OUT_PATH)
+        assert wb["shorttest"]["A1"].value == "Finnish"
+        assert wb["shorttest"]["B1"].value == "English"
+        assert wb["shorttest"]["A2"].value == "talo"
+        assert wb["shorttest"]["A4"].value is None
+        assert wb["shorttest"]["C6"].value == "uusi naapuri"
+        assert wb["shorttest"]["D8"].value == 8
+
+        word_collection_2 = dataaccess.load_wordlist_book(wb_path=TEST_DICT_OUT_PATH)
+        for sheet_name, word_list in word_collection.word_lists.items():
+            word_list_2 = word_collection_2.word_lists[sheet_name]
+            assert (word_list_2.lang1, word_list_2.lang2) == (word_list.lang1, word_list.lang2)
+            assert word_list_2.flashcards == word_list.flashcards
+
+    def test_save_learning_progress(self):
+        # Verify that only the changed learning statuses are saved, next to the workbook
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        word_list = word_collection.word_lists["shorttest"]
+        learning_progress = vocabulary._get_learning_progress(word_list)
+        learning_progress[3] = learningprogress.Progress.RECENT
+        vocabulary._update_learning_progress(word_list, learning_progress)
+        assert word_list.dirty_rows == {3}
+
+        dataaccess.save_learning_progress(TEST_DICT_PATH, word_collection)
+        assert word_list.dirty_rows == set()
+        progress_path = TEST_DICT_PATH + dataaccess.PROGRESS_FILE_SUFFIX
+        with open(progress_path) as f:
+            assert len(f.readlines()) == 1
+        assert openpyxl.load_workbook(TEST_DICT_PATH)["shorttest"]["D3"].value == 8
+
+        # The progress file is merged when the workbook is loaded
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        assert word_collection.word_lists["shorttest"].flashcards[3].learning_status == learningprogress.Progress.RECENT
+
+        # The workbook is rewritten when the progress file is too large
+        dataaccess.save_learning_progress(TEST_DICT_PATH, word_collection, max_size=0)
+        assert not os.path.exists(progress_path)
+        assert openpyxl.load_workbook(TEST_DICT_PATH)["shorttest"]["D3"].value == learningprogress.Progress.RECENT
+
+        # The rows written to the workbook aren't saved to the progress file again,
+        # unless they were exported to another workbook
+        word_list = word_collection.word_lists["shorttest"]
+        word_list.learning_progress[4] = learningprogress.Progress.NEW
+        dataaccess.save_wordlist_book(TEST_DICT_OUT_PATH, word_collection, write_only=True)
+        assert word_list.dirty_rows == {4}
+        dataaccess.save_wordlist_book(TEST_DICT_PATH, word_collection)
+        assert word_list.dirty_rows == set()
+
+        # The saved statuses of the rows that were edited in the workbook since are skipped
+        word_list.learning_progress[3] = learningprogress.Progress.LEARNED
+        word_list.learning_progress[4] = learningprogress.Progress.RECENT
+        dataaccess.save_learning_progress(TEST_DICT_PATH, word_collection)
+        workbook = openpyxl.load_workbook(TEST_DICT_PATH)
+        workbook["shorttest"]["A3"] = "edited row"
+        workbook.save(TEST_DICT_PATH)
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        assert word_collection.word_lists["shorttest"].flashcards[3].learning_status == learningprogress.Progress.RECENT
+        assert word_collection.word_lists["shorttest"].flashcards[4].learning_status == learningprogress.Progress.RECENT
+
+        # Verify that the invalid entries of the progress file are skipped
+        with open(progress_path, mode="a") as f:
+            f.write('5\n["shorttest", 3]\n{"sheet": "shorttest", "row": 3}\n{"sheet": "shorttest", "row": "3", '
+                    '"lang1": "katu", "status": 2}\n')
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        assert word_collection.word_lists["shorttest"].flashcards[4].learning_status == learningprogress.Progress.RECENT
+
+    def test_load_row_limit(self):
+        # Verify that the row limit of the worksheets can be configured
+        with self.assertRaises(ValueError):
+            dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH, max_rows=100)
+
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH, max_rows=None)
+        assert len(word_collection.word_lists["Vocabulary 1"].flashcards) == 1087
+
+    def test_load_parallel(self):
+        # Verify that parsing the worksheets in parallel gives the same word collection
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH, max_rows=None)
+        with ProcessPoolExecutor(2) as executor:
+            word_collection2 = dataaccess.load_wordlist_book_parallel(wb_path=TEST_DICT_PATH, max_rows=None,
+                                                                      executor=executor, max_workers=2)
+        assert list(word_collection2.word_lists.keys()) == list(word_collection.word_lists.keys())
+        for name, word_list in word_collection.word_lists.items():
+            assert dict(word_collection2.word_lists[name].flashcards) == dict(word_list.flashcards)
+
+        with self.assertRaises(ValueError):
+            dataaccess.load_wordlist_book_parallel(wb_path=TEST_DICT_PATH, max_rows=100, max_workers=1)
+
+
+    def test_load_cached(self):
+        cache_dir = "testdata_temp/cache"
+        word_collection = dataaccess.load_wordlist_book(wb_path=TEST_DICT_PATH)
+        word_collection2 = loadcache.load_wordlist_book_cached(TEST_DICT_PATH, cache_dir)
+        assert list(word_collection2.word_lists.keys()) == list(word_collection.word_lists.keys())
+        for name, word_list in word_collection.word_lists.items():
+            assert dict(word_collection2.word_lists[name].flashcards) == dict(word_list.flashcards)
+
+        # Verify that the unchanged workbook isn't parsed again
+        with patch.object(loadcache, "_load_workbook_by_path", side_effect=AssertionError):
+            word_collection3 = loadcache.load_wordlist_book_cached(TEST_DICT_PATH, cache_dir)
+        assert dict(word_collection3.word_lists["shorttest"].flashcards) == \
+            dict(word_collection.word_lists["shorttest"].flashcards)
+
+        # Verify that only the changed worksheet is parsed again
+        with zipfile.ZipFile(TEST_DICT_PATH) as archive:
+            parts = {info: archive.read(info.filename) for info in archive.infolist()}
+            changed_part = dataaccess._worksheet_parts(archive)["Grammar 1"]
+        with zipfile.ZipFile(TEST_DICT_PATH, "w") as archive:
+            for info, data in parts.items():
+                archive.writestr(info, data + b" " if info.filename == changed_part else data)
+        with patch.object(loadcache, "_excel_worksheet_to_wordlist",
+                          wraps=dataaccess._excel_worksheet_to_wordlist) as parse:
+            word_collection4 = loadcache.load_wordlist_book_cached(TEST_DICT_PATH, cache_dir)
+        assert [call[0][1] for call in parse.call_args_list] == ["Grammar 1"]
+        for name, word_list in word_collection.word_lists.items():
+            assert dict(word_collection4.word_lists[name].flashcards) == dict(word_list.flashcards)
+
+
+class TestModels(unittest.TestCase):
+
+    def test_flashcard_columns(self):
+        word_list = WordList(name="test", lang1="Finnish", lang2="English", flashcards={
+            3: Flashcard(lang1="katu", lang2="street", remarks="", learning_status=None),
+            2: Flashcard(lang1="talo", lang2="house", remarks="", learning_status=8)})
+        word_list.flashcards[4] = Flashcard(lang1="huone", lang2="room", remarks="", learning_status=0.6)
+
+        # Verify that the flashcards are returned in the order of the row keys with their original values
+        assert list(word_list.flashcards.keys()) == [2, 3, 4]
+        assert [f.learning_status for f in word_list.flashcards.values()] == [8, None, 0.6]
+
+        # Verify that the returned flashcards write to the word list
+        word_list.flashcards[3].lang2 = "road"
+        word_list.flashcards[4].learning_status = 5
+        assert word_list.flashcards[3] == Flashcard(lang1="katu", lang2="road", remarks="", learning_status=None)
+        assert word_list.learning_progress[4] == 5
+
+        # Verify that the changes made through the flashcards keep the status index and dirty_rows up to date
+        word_list.dirty_rows.clear()
+        assert word_list.learning_progress.rows_with_status(8) == [2]
+        word_list.flashcards[2].learning_status = 5
+        assert sorted(word_list.learning_progress.rows_with_status(5)) == [2, 4]
+        assert word_list.learning_progress.count_with_status(8) == 0
+        word_list.flashcards[3] = Flashcard(lang1="katu", lang2="road", remarks="", learning_status=5)
+        word_list.flashcards[6] = Flashcard(lang1="ovi", lang2="door", remarks="", learning_status=8)
+        assert sorted(word_list.learning_progress.rows_with_status(5)) == [2, 3, 4]
+        assert word_list.learning_progress.rows_with_status(8) == [6]
+        assert word_list.dirty_rows == {2, 3, 6}
+        del word_list.flashcards[3]
+        assert 3 not in word_list.flashcards
+        assert sorted(word_list.learning_progress.rows_with_status(5)) == [2, 4]
+        assert word_list.dirty_rows == {2, 6}
+        with self.assertRaises(KeyError):
+            word_list.flashcards[3]
+
+    def test_memory_per_flashcard(self):
+        # Verify that a flashcard takes much less memory than a Flashcard object in a dictionary (~190 bytes)
+        words = [f"word {i}" for i in range(10000)]
+        tracemalloc.start()
+        word_list = WordList(name="test", lang1="lang1", lang2="lang2", flashcards={})
+        for row, word in enumerate(words, start=2):
+            word_list.flashcards[row] = Flashcard(lang1=word, lang2=word, remarks="", learning_status=1)
+        # The added rows are tracked until the word list is saved
+        word_list.dirty_rows.clear()
+        memory_per_flashcard = tracemalloc.get_traced_memory()[0] / len(words)
+        tracemalloc.stop()
+        assert memory_per_flashcard < 64
+
+    def test_load_old_pickle(self):
+        # testdict_v0.pickle was saved by the version whose models had no __slots__ and stored the flashcards in a dict
+        word_collection = dataaccess.word_collection_from_pickle("testdata/testdict_v0.pickle")
+        word_list = word_collection.word_lists["shorttest"]
+        assert (word_list.lang1, word_list.lang2) == ("Finnish", "English")
+        assert word_list.flashcards[2] == Flashcard(lang1="talo", lang2="house", remarks="", learning_status=8)
+        assert word_list.learning_progress[3] == learningprogress.Progress.RECENT
+        assert word_list.learning_progress[4] == learningprogress.Progress.LEARNED
+        assert word_list.dirty_rows == set()
+
+        # Verify that the collection can be pickled again in the current format
+        reloaded = pickle.loads(pickle.dumps(word_collection))
+        assert dict(reloaded.word_lists["shorttest"].flashcards) == dict(word_list.flashcards)
+
 
 class TestLearningProgress(unittest.TestCase):
 
@@ -106,6 +305,49 @@ class TestLearningProgress(unittest.TestCase):
             str(f"Learning progress is above the expected {expected_learning_progress} with the value of"
                 f" {average_learning_progress2}")
 
+    def test_status_index(self):
+        # Verify that the status index of LearningProgress follows the changes of the learning statuses
+        learning_progress = LearningProgress({key: None for key in range(1, 101)})
+        learningprogress.reset_progress(learning_progress)
+        for i in range(300):
+            learning_progress, selected_key, show_flashcard = learningprogress.pick_word(learning_progress, 5, 25)
+            learningprogress.submit_answer(learning_progress, selected_key, i % 4 != 0)
+
+            groups = learningprogress._group_status(learning_progress.progress)
+            for status in groups.keys() | set(learning_progress.statuses()):
+                assert sorted(learning_progress.rows_with_status(status)) == sorted(groups.get(status, []))
+                assert learning_progress.first_rows_with_status(status, 3) == sorted(groups.get(status, []))[:3]
+
+        assert learningprogress.calculate_learning_progress(learning_progress) == \
+            learningprogress.calculate_learning_progress(dict(learning_progress))
+        assert learningprogress.pick_words_with_status(learning_progress, learningprogress.Progress.NEW,
+                                                       learningprogress.PickOrder.ORIGINAL, lambda v: 5) == \
+            learningprogress.pick_words(dict(learning_progress), lambda p: p == learningprogress.Progress.NEW,
+                                        learningprogress.PickOrder.ORIGINAL, lambda v: 5)
+
+    def test_progress_overlay(self):
+        # Verify that the overlay behaves like the learning progress of a copy of the word list
+        word_list = WordList("test", "lang1", "lang2",
+                             {key: Flashcard("a", "b", None, learningprogress.Progress.NEW) for key in range(1, 101)})
+        overlay = ProgressOverlay(word_list.learning_progress)
+        learning_progress = LearningProgress(dict(word_list.learning_progress))
+        for i in range(300):
+            overlay, selected_key, show_flashcard = learningprogress.pick_word(overlay, 5, 25)
+            learningprogress.submit_answer(overlay, selected_key, i % 4 != 0)
+            learningprogress.submit_answer(learning_progress, selected_key, i % 4 != 0)
+            for status in set(learning_progress.statuses()) | set(overlay.statuses()):
+                rows = learning_progress.rows_with_status(status)
+                assert sorted(overlay.rows_with_status(status)) == sorted(rows)
+                assert overlay.count_with_status(status) == len(rows)
+                assert overlay.first_rows_with_status(status, 3) == sorted(rows)[:3]
+                sample = overlay.sample_rows_with_status(status, 3, random)
+                assert len(set(sample)) == min(3, len(rows)) and set(sample) <= set(rows)
+
+        assert dict(overlay) == dict(learning_progress)
+        assert len(overlay.progress) == sum(status != learningprogress.Progress.NEW
+                                            for status in learning_progress.values())
+        assert set(word_list.learning_progress.values()) == {learningprogress.Progress.NEW}
+
 
 class TestVocabulary(unittest.TestCase):
     def setUp(self) -> None:
@@ -172,12 +414,51 @@ class TestVocabulary(unittest.TestCase):
         learning_progress_2 = voc.get_progress()
         assert learning_progress == learning_progress_2, "Learning progress changed after reopening the workbook."
 
+    def test_seeded_vocabulary(self):
+        # Verify that the instances with the same seed replay the same quizzes
+        quiz_sessions = []
+        for _ in range(2):
+            reset_test_env()
+            voc = vocabulary.Vocabulary(rng=random.Random(42))
+            voc.load(TEST_DICT_PATH)
+            voc.set_current_word_sheet("shorttest")
+            session = []
+            for question_number in range(30):
+                show_flashcard, question, flashcard = voc.choice_quiz()
+                session.append((show_flashcard, question.row_key, question.options))
+                voc.answer_choice_quiz(flashcard.lang1 if question_number % 3 else "BAD ANSWER")
+            quiz_sessions.append(session)
+            # The global generator doesn't change the quizzes
+            random.seed(len(quiz_sessions))
+        assert quiz_sessions[0] == quiz_sessions[1]
+
 
 class TestAlternatives(unittest.TestCase):
 
     def setUp(self):
         self.pool1 = ["aaa", "aab", "aac", "aad", "aae", "abb", "acc", "add", "aee", "aab"]
 
+    def _workbook_pool(self):
+        """
+        The lang1 pool of the test workbook and self.pool1, and the exact calc_similarity scores of some
+        of its expressions: (expression, {alternative: score}) without the expression and the duplicates
+        """
+        reset_test_env()
+        word_collection = dataaccess.load_wordlist_book(TEST_DICT_PATH)
+        pool, _ = vocabulary._build_word_pool(word_collection)
+        pool = pool + self.pool1
+        cases = []
+        for expression in pool[::40] + ["aaa", "not in the pool?"]:
+            pool_without_duplicates = list(set(pool) - {expression})
+            similarity = alternatives.calc_similarity(expression, pool_without_duplicates)
+            cases.append((expression, dict(zip(pool_without_duplicates, similarity))))
+        return pool, cases
+
+    def _assert_exact_shortlist(self, expression, shortlist, scores, shortlist_count):
+        assert expression not in shortlist
+        assert len(shortlist) == len(set(shortlist))
+        assert [scores[word] for word in shortlist] == sorted(scores.values(), reverse=True)[:shortlist_count]
+
     def test_duplicates(self):
 
         # Verify that in case there are fewer elements in the list than the given
@@ -215,4 +496,90 @@ class TestAlternatives(unittest.TestCase):
                                                         shortlist_count=shortlist_count,
                                                         picked_count= 3,
                                                         similarity_func=alternatives.calc_similarity)))
-        assert len(similar_options) == shortlist_count
\ No newline at end of file
+        assert len(similar_options) == shortlist_count
+
+    def test_similarity_index(self):
+        # Verify that the index gives the same shortlist as scoring the whole pool with calc_similarity
+        pool, cases = self._workbook_pool()
+        index = SimilarityIndex(pool)
+        for expression, scores in cases:
+            self._assert_exact_shortlist(expression, index.shortlist(expression, 50), scores, 50)
+
+    def test_batch_scorer(self):
+        # Verify that the batch scorer gives the same scores and shortlists as calc_similarity
+        pool, cases = self._workbook_pool()
+        scorer = BatchScorer(pool)
+        expressions = [expression for expression, _ in cases]
+
+        scores = scorer.score_many(expressions)
+        shortlists = scorer.shortlist_many(expressions, 50)
+        for row, (expression, expected_scores) in enumerate(cases):
+            assert list(scores[row]) == alternatives.calc_similarity(expression, scorer.words)
+            self._assert_exact_shortlist(expression, shortlists[row], expected_scores, 50)
+
+    def test_length_buckets(self):
+        # Verify that the pruned scan gives the same shortlist scores as scoring the whole pool, without scoring it
+        pool, cases = self._workbook_pool()
+        buckets = LengthBuckets(pool)
+        metrics = Metrics()
+
+        for expression, scores in cases:
+            set_instrumentation(metrics)
+            try:
+                shortlist = buckets.shortlist(expression, 50)
+            finally:
+                set_instrumentation(None)
+            self._assert_exact_shortlist(expression, shortlist, scores, 50)
+        # Less than 60% of the pool is scored on average (about 45% with the test workbook)
+        scored_share = metrics.counters["calc_similarity"] / (len(buckets) * len(cases))
+        assert scored_share < 0.6
+
+    def test_minhash_index(self):
+        # Verify that the approximate shortlists are ranked like calc_similarity and that they find most of the
+        # exact shortlists (recall@50)
+        pool, cases = self._workbook_pool()
+        index = MinHashIndex(pool)
+        shortlist_count = 50
+
+        recalls = []
+        for expression, scores in cases:
+            min_expected_score = sorted(scores.values(), reverse=True)[shortlist_count - 1]
+
+            shortlist = index.shortlist(expression, shortlist_count)
+            assert expression not in shortlist
+            assert len(shortlist) == shortlist_count == len(set(shortlist))
+            assert [scores[word] for word in shortlist] == sorted([scores[word] for word in shortlist], reverse=True)
+            # Expressions tied with the last one of the exact shortlist are as good as the ones in it
+            recalls.append(len([word for word in shortlist if scores[word] >= min_expected_score]) / shortlist_count)
+        recall = sum(recalls) / len(recalls)
+        assert recall >= 0.9
+
+    def test_shortlist_cache(self):
+        # Verify that the shortlists are cached by pool version and only reshuffled
+        cache = alternatives.shortlist_cache
+        cache.invalidate()
+        hits, misses = cache.hits, cache.misses
+        for _ in range(10):
+            similar_options = alternatives.most_similar(expression="aaa", pool=self.pool1, shortlist_count=3,
+                                                        picked_count=3,
+                                                        similarity_func=alternatives.calc_similarity,
+                                                        pool_version="pool1")
+            assert set(similar_options) == set(cache.get("pool1", "aaa", 3))
+        # Only the first call of most_similar calculates the shortlist (the asserts above are hits as well)
+        assert cache.misses - misses == 1
+        assert cache.hits - hits == 19
+
+        cache.invalidate("pool1")
+        assert cache.get("pool1", "aaa", 3) is None
+
+    def test_top_k_shortlist(self):
+        # Verify that the heap-based selection gives the same shortlist as sorting the whole list
+        for seed in range(20):
+            rng = random.Random(seed)
+            expr_list = [f"expr {i}" for i in range(500)]
+            # Few distinct values so that there are many ties
+            ranking = [rng.randint(0, 20) / 7 for _ in expr_list]
+            exclude_list = rng.sample(expr_list, 30)
+            for pool_count in [1, 5, 50, 600]:
+                assert alternatives._shortlist_highest_ranking(expr_list, ranking, pool_count, exclude_list) == \
+                    alternatives._shortlist_highest_ranking(expr_list, ranking, pool_count, exclude_list, top_k=False)
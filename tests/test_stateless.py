@@ -1,10 +1,26 @@
+import asyncio
+import os
+import random
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
-from tests.utils import reset_test_env, TEST_DICT_PATH, TEST_DICT_PARQUET_PATH
-from vocabulary.models import Question, Flashcard, QuizPackage
-from vocabulary.stateless import Vocabulary
-from vocabulary.dataaccess import load_wordlist_book, \
-    word_collection_to_pickle, word_collection_from_pickle
+from openpyxl import load_workbook
+from tests.utils import reset_test_env, TEST_DICT_PATH, TEST_DICT_PARQUET_PATH, TEST_DICT_SNAPSHOT_PATH, \
+    TEST_DICT_OUT_PATH
+from vocabulary.models import Question, Flashcard, QuizPackage, WordCollection
+from vocabulary.poolregistry import PoolRegistry
+from vocabulary.stateless import Vocabulary, SharedDeck, choice_quiz_batch, SHORTLIST_COUNT
+from vocabulary.asyncvocabulary import AsyncVocabulary
+from vocabulary import alternatives, batchscoring, dataaccess, snapshot, vocabulary
+from vocabulary.distractorworkers import DistractorWorkers
+from vocabulary.instrumentation import Metrics, set_instrumentation
+from vocabulary.dataaccess import load_wordlist_book, load_wordlist_book_lazy, \
+    word_collection_to_pickle, word_collection_from_pickle, word_collection_to_snapshot, \
+    word_collection_from_snapshot, map_word_collection, SnapshotFormatError, NoValidWordListsError, \
+    save_learning_progress
+from vocabulary.learningprogress import Progress
 from typing import List
 
 
@@ -67,3 +83,422 @@ class TestVocabulary(unittest.TestCase):
         voc2 = Vocabulary()
         voc2.load(TEST_DICT_PARQUET_PATH, word_collection_from_pickle)
         assert learning_progress2 == voc2.get_progress(word_list_name)
+
+    def test_snapshot(self):
+        voc = Vocabulary()
+        voc.load(TEST_DICT_PATH, load_wordlist_book)
+        word_list_name = "shorttest"
+        voc.reset_progress(word_list_name)
+        for row_key in list(voc.word_collection.word_lists[word_list_name].flashcards)[:3]:
+            voc.update_progress(word_list_name, row_key, True)
+        voc.save(TEST_DICT_SNAPSHOT_PATH, word_collection_to_snapshot)
+
+        # Verify that every flashcard and learning status is restored
+        voc2 = Vocabulary()
+        voc2.load(TEST_DICT_SNAPSHOT_PATH, word_collection_from_snapshot)
+        assert voc2.word_collection.lang1 == voc.word_collection.lang1
+        assert voc2.word_collection.word_lists.keys() == voc.word_collection.word_lists.keys()
+        for name, word_list in voc.word_collection.word_lists.items():
+            word_list2 = voc2.word_collection.word_lists[name]
+            assert (word_list2.lang1, word_list2.lang2) == (word_list.lang1, word_list.lang2)
+            assert dict(word_list2.flashcards) == dict(word_list.flashcards)
+        assert voc2.get_progress(word_list_name) == voc.get_progress(word_list_name)
+
+        # Verify that other files are rejected
+        with self.assertRaises(SnapshotFormatError):
+            word_collection_from_snapshot(TEST_DICT_PATH)
+
+        # Verify that a failed save reports its own error and leaves the snapshot and no temporary file behind
+        files = sorted(os.listdir(os.path.dirname(TEST_DICT_SNAPSHOT_PATH)))
+        with patch.object(snapshot.os, "replace", side_effect=PermissionError):
+            with self.assertRaises(PermissionError):
+                word_collection_to_snapshot(TEST_DICT_SNAPSHOT_PATH, voc.word_collection)
+        assert sorted(os.listdir(os.path.dirname(TEST_DICT_SNAPSHOT_PATH))) == files
+
+    def test_mapped_word_collection(self):
+        voc = Vocabulary()
+        voc.load(TEST_DICT_PATH, load_wordlist_book)
+        voc.save(TEST_DICT_SNAPSHOT_PATH, word_collection_to_snapshot)
+        word_list_name = "shorttest"
+
+        voc2 = Vocabulary()
+        voc2.load(TEST_DICT_SNAPSHOT_PATH, map_word_collection)
+        for name, word_list in voc.word_collection.word_lists.items():
+            assert dict(voc2.word_collection.word_lists[name].flashcards) == dict(word_list.flashcards)
+
+        # Verify that only the learning statuses can be changed, and only in the loaded collection
+        flashcards = voc2.word_collection.word_lists[word_list_name].flashcards
+        row_key = next(iter(flashcards))
+        with self.assertRaises(TypeError):
+            flashcards[row_key].lang1 = "changed"
+        with self.assertRaises(TypeError):
+            del flashcards[row_key]
+        voc2.reset_progress(word_list_name)
+        voc2.update_progress(word_list_name, row_key, True)
+        # Verify that the pools are found by hashing the mapped file, without decoding the texts
+        voc3 = Vocabulary()
+        with patch.object(snapshot._TextColumn, "__getitem__", side_effect=AssertionError):
+            voc3.load(TEST_DICT_SNAPSHOT_PATH, map_word_collection)
+        assert voc3.shared_pool is voc2.shared_pool
+        assert voc3.get_progress(word_list_name) == voc.get_progress(word_list_name)
+
+        # Verify that the mapped collection can be saved over its own file
+        voc2.save(TEST_DICT_SNAPSHOT_PATH, word_collection_to_snapshot)
+        assert flashcards[row_key].lang1 == voc.word_collection.word_lists[word_list_name].flashcards[row_key].lang1
+        voc4 = Vocabulary()
+        voc4.load(TEST_DICT_SNAPSHOT_PATH, word_collection_from_snapshot)
+        assert voc4.get_progress(word_list_name) == voc2.get_progress(word_list_name)
+        assert voc2.choice_quiz(word_list_name, "adaptive")
+
+    def test_shared_deck(self):
+        word_list_name = "shorttest"
+        deck = SharedDeck(load_wordlist_book(TEST_DICT_PATH))
+        flashcards = deck.word_collection.word_lists[word_list_name].flashcards
+        deck_statuses = {row_key: flashcards[row_key].learning_status for row_key in flashcards}
+
+        progress1 = {}
+        voc1 = Vocabulary()
+        voc1.use_deck(deck, progress1)
+        voc1.reset_progress(word_list_name)
+        reset_rows = len(progress1[word_list_name])
+        quiz_list = voc1.choice_quiz(word_list_name, "adaptive")
+        answered = [package.question.row_key for package in quiz_list if package.question is not None]
+        for row_key in answered:
+            voc1.update_progress(word_list_name, row_key, True)
+
+        # Verify that only the changed statuses are stored for the user and the deck isn't changed
+        assert 0 < len(progress1[word_list_name]) <= reset_rows + len(answered)
+        assert {row_key: flashcards[row_key].learning_status for row_key in flashcards} == deck_statuses
+        assert voc1.choice_quiz(word_list_name, "adaptive")[-1].flashcard.learning_status != Progress.NEW
+
+        # Verify that the progress of the users is separate and it can be restored
+        voc2 = Vocabulary()
+        voc2.use_deck(deck)
+        voc2.reset_progress(word_list_name)
+        assert voc2.get_progress(word_list_name) == 0
+        assert voc1.get_progress(word_list_name) > 0
+        voc3 = Vocabulary()
+        voc3.use_deck(deck, progress1)
+        assert voc3.get_progress(word_list_name) == voc1.get_progress(word_list_name)
+
+    def test_async_vocabulary(self):
+        word_list_name = "shorttest"
+        load_calls = []
+
+        def load_function(path):
+            load_calls.append(path)
+            return load_wordlist_book(path)
+
+        async def run():
+            with ThreadPoolExecutor(2) as executor:
+                vocs = [AsyncVocabulary(executor) for _ in range(3)]
+                await asyncio.gather(*[voc.load(TEST_DICT_PATH, load_function) for voc in vocs])
+                await vocs[0].reset_progress(word_list_name)
+                quiz_list = await vocs[0].choice_quiz(word_list_name, "adaptive")
+                for package in quiz_list:
+                    if package.question is not None:
+                        await vocs[0].update_progress(word_list_name, package.question.row_key, True)
+                await vocs[0].save(TEST_DICT_SNAPSHOT_PATH, word_collection_to_snapshot)
+
+                # The worksheets of a lazily loaded collection are parsed off the event loop
+                lazy_voc = AsyncVocabulary(executor)
+                await lazy_voc.load(TEST_DICT_PATH, load_wordlist_book_lazy)
+                with patch.object(dataaccess, "_excel_worksheet_to_wordlist", side_effect=parse):
+                    await lazy_voc.reset_progress(word_list_name)
+                    await lazy_voc.update_progress("Vocabulary 1", 2, True)
+                    assert await lazy_voc.get_progress("Grammar 1") == 0
+                return vocs, [await voc.get_progress(word_list_name) for voc in vocs]
+
+        parse_threads = []
+        original_parse = dataaccess._excel_worksheet_to_wordlist
+
+        def parse(*args):
+            parse_threads.append(threading.current_thread())
+            return original_parse(*args)
+
+        loop = asyncio.new_event_loop()
+        try:
+            vocs, progress = loop.run_until_complete(run())
+        finally:
+            loop.close()
+        assert len(parse_threads) == 3 and threading.main_thread() not in parse_threads
+
+        # Verify that the concurrent loads were run once and every object got its own word collection
+        assert len(load_calls) == 1
+        assert len({id(voc.word_collection) for voc in vocs}) == 3
+        assert progress[0] > 0 and progress[1] == progress[2]
+        voc = Vocabulary()
+        voc.load(TEST_DICT_SNAPSHOT_PATH, word_collection_from_snapshot)
+        assert voc.get_progress(word_list_name) == progress[0]
+
+    def test_lazy_word_collection(self):
+        word_list_name = "shorttest"
+        voc = Vocabulary()
+        voc.load(TEST_DICT_PATH, load_wordlist_book_lazy)
+        word_lists = voc.word_collection.word_lists
+
+        # Verify that the worksheets are only loaded when they're used
+        assert voc.get_word_sheet_list() == list(load_wordlist_book(TEST_DICT_PATH).word_lists.keys())
+        assert len(word_lists.loaded()) == 0 and len(voc.word_pool_lang1) == 0
+        voc.reset_progress(word_list_name)
+        assert list(word_lists.loaded().keys()) == [word_list_name]
+        assert voc.choice_quiz(word_list_name, "adaptive")
+
+        # Verify that the word pools and the index are extended in place with the loaded worksheets
+        pool_size = len(voc.word_pool_lang1)
+        assert pool_size > 0
+        shared_pool = voc.shared_pool
+        index = voc.word_pool_lang1_index
+        voc.reset_progress("Vocabulary 1")
+        assert len(voc.word_pool_lang1) > pool_size
+        assert voc.shared_pool is shared_pool and voc.word_pool_lang1_index is index
+        assert voc.shared_pool.key == PoolRegistry().acquire(voc.word_collection).key
+        assert index.words == voc.word_pool_lang1
+        assert voc.get_progress(word_list_name) == 0
+
+        # Verify that saving the learning progress doesn't load the other worksheets
+        voc.update_progress(word_list_name, 2, True)
+        save_learning_progress(TEST_DICT_PATH, voc.word_collection)
+        assert list(word_lists.loaded().keys()) == [word_list_name, "Vocabulary 1"]
+
+        # Verify that a worksheet that can't be loaded is removed after raising its error
+        with patch("vocabulary.dataaccess._excel_worksheet_to_wordlist", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                voc.reset_progress("Grammar 1")
+        assert "Grammar 1" not in voc.get_word_sheet_list()
+
+        # Verify that the worksheets without 5 flashcards aren't listed, even if they have enough rows
+        workbook = load_workbook(TEST_DICT_PATH)
+        for row in range(2, workbook["Vocabulary 2"].max_row + 1):
+            workbook["Vocabulary 2"].cell(row=row, column=2).value = None
+        workbook.save(TEST_DICT_OUT_PATH)
+        names = list(load_wordlist_book_lazy(TEST_DICT_OUT_PATH).word_lists)
+        assert names == [name for name in load_wordlist_book(TEST_DICT_PATH).word_lists if name != "Vocabulary 2"]
+        for worksheet in workbook.worksheets:
+            for row in range(2, worksheet.max_row + 1):
+                worksheet.cell(row=row, column=2).value = None
+        workbook.save(TEST_DICT_OUT_PATH)
+        with self.assertRaises(NoValidWordListsError):
+            load_wordlist_book_lazy(TEST_DICT_OUT_PATH)
+
+    def test_update_progress_in_place(self):
+        voc = Vocabulary()
+        voc.load(TEST_DICT_PATH, load_wordlist_book)
+        word_list_name = "shorttest"
+        voc.reset_progress(word_list_name)
+        word_list = voc.word_collection.word_lists[word_list_name]
+        flashcards = word_list.flashcards
+        flashcard = flashcards[2]
+
+        # Verify that answering a question only changes the answered row, without copying the flashcards
+        word_list.dirty_rows.clear()
+        voc.update_progress(word_list_name, 2, True)
+        assert word_list.flashcards is flashcards
+        assert flashcard.learning_status == Progress.RECENT
+        assert word_list.learning_progress[2] == Progress.RECENT
+        assert word_list.dirty_rows == {2}
+
+    def test_approximate_alternatives(self):
+        voc = Vocabulary(approximate_alternatives=True)
+        voc.load(TEST_DICT_PATH, load_wordlist_book)
+        voc.reset_progress("shorttest")
+        for row_key in [2, 3, 4, 5, 6, 7]:
+            voc.update_progress("shorttest", row_key, True)
+
+        # Verify that the questions get alternatives from the MinHash index
+        quiz_list = voc.choice_quiz("shorttest", "adaptive")
+        questions = [quiz_package.question for quiz_package in quiz_list if quiz_package.question is not None]
+        assert len(questions) > 0
+        for question in questions:
+            assert len(question.options) == 5 and len(set(question.options)) == 5
+        assert voc.shared_pool._word_pool_lang1_minhash is not None
+
+    def test_distractor_workers(self):
+        quiz_lists = []
+        for _ in range(2):
+            alternatives.shortlist_cache.invalidate()
+            workers = DistractorWorkers(max_workers=2)
+            try:
+                voc = Vocabulary(distractor_workers=workers, rng=random.Random(5))
+                voc.load(TEST_DICT_PATH, load_wordlist_book)
+                # Only new words, they are picked in their original order
+                voc.reset_progress("shorttest")
+                quiz_lists.append(voc.choice_quiz("shorttest", "adaptive"))
+                assert workers.pool_version == voc.shared_pool.key
+            finally:
+                workers.close()
+
+            # Verify that the workers give the same shortlists as the similarity index of the process
+            for quiz_package in quiz_lists[-1]:
+                expression = quiz_package.flashcard.lang1
+                assert list(alternatives.shortlist_cache.get(voc.shared_pool.key, expression, SHORTLIST_COUNT)) == \
+                    voc.word_pool_lang1_index.shortlist(expression, SHORTLIST_COUNT)
+
+        # Verify that the quizzes are reproducible with the same seed
+        options = [[quiz_package.question.options for quiz_package in quiz_list if quiz_package.question is not None]
+                   for quiz_list in quiz_lists]
+        assert len(options[0]) > 0
+        assert options[0] == options[1]
+
+    def test_seeded_vocabulary(self):
+        # Verify that the instances with the same seed replay the same quizzes
+        quiz_sessions = []
+        for _ in range(2):
+            voc = Vocabulary(rng=random.Random(42))
+            voc.load(TEST_DICT_PATH, load_wordlist_book)
+            voc.reset_progress("shorttest")
+            session = []
+            for _ in range(5):
+                quiz_list = voc.choice_quiz("shorttest", "adaptive")
+                session.append([(quiz_package.flashcard.lang1,
+                                 quiz_package.question.options if quiz_package.question is not None else None)
+                                for quiz_package in quiz_list])
+                for quiz_package in quiz_list:
+                    if quiz_package.question is not None:
+                        voc.update_progress("shorttest", quiz_package.question.row_key,
+                                            quiz_package.question.options[0] == quiz_package.flashcard.lang1)
+            quiz_sessions.append(session)
+            # The global generator doesn't change the quizzes
+            random.seed(len(quiz_sessions))
+        assert quiz_sessions[0] == quiz_sessions[1]
+
+    def test_shared_pools(self):
+        registry = PoolRegistry(max_unused=1)
+
+        # Verify that the instances loading the same word collection share the pools
+        voc1 = Vocabulary(pool_registry=registry)
+        voc1.load(TEST_DICT_PATH, load_wordlist_book)
+        voc2 = Vocabulary(pool_registry=registry)
+        voc2.load(TEST_DICT_PATH, load_wordlist_book)
+        assert voc1.shared_pool is voc2.shared_pool
+        assert voc1.word_pool_lang1_index is voc2.word_pool_lang1_index
+        assert voc1.shared_pool.ref_count == 2
+        assert len(voc1.word_pool_lang1) == len(set(voc1.word_pool_lang1))
+
+        # Verify that unused pools are kept until they are evicted
+        key = voc1.shared_pool.key
+        voc1.close()
+        del voc2
+        assert key in registry
+        voc3 = Vocabulary(pool_registry=registry)
+        voc3.load(TEST_DICT_PARQUET_PATH, _load_other_collection)
+        voc3.close()
+        voc4 = Vocabulary(pool_registry=registry)
+        voc4.load(TEST_DICT_PARQUET_PATH, _load_other_collection)
+        assert key not in registry
+        assert len(registry) == 1
+
+        # Verify that a pool is built outside the lock of the registry: the pools of other collections can be
+        # acquired meanwhile, the callers acquiring the same collection wait for the build
+        registry = PoolRegistry()
+        word_collection = load_wordlist_book(TEST_DICT_PATH)
+        other_collection = _load_other_collection(TEST_DICT_PATH)
+        building = threading.Event()
+        finish = threading.Event()
+        original_build_word_pool = vocabulary._build_word_pool
+
+        def build_word_pool(collection):
+            if collection is word_collection:
+                building.set()
+                assert finish.wait(10)
+            return original_build_word_pool(collection)
+
+        with patch("vocabulary.vocabulary._build_word_pool", side_effect=build_word_pool) as build, \
+                ThreadPoolExecutor(2) as executor:
+            pools = [executor.submit(registry.acquire, word_collection)]
+            assert building.wait(10)
+            pools.append(executor.submit(registry.acquire, word_collection))
+            other_pool = registry.acquire(other_collection)
+            assert not pools[0].done() and not pools[1].done()
+            finish.set()
+            assert pools[0].result() is pools[1].result() is not other_pool
+        assert pools[0].result().ref_count == 2
+        assert build.call_count == 2
+
+
+    def test_choice_quiz_batch(self):
+        voc1 = Vocabulary()
+        voc1.load(TEST_DICT_PATH, load_wordlist_book)
+        voc2 = Vocabulary()
+        voc2.load(TEST_DICT_PATH, _load_other_collection)
+        voc1.reset_progress("shorttest")
+        for row_key in [2, 3, 4, 5, 6, 7]:
+            voc1.update_progress("shorttest", row_key, True)
+
+        # Verify that the batch gives the same kind of quiz packages as choice_quiz
+        requests = [(voc1, "shorttest", "adaptive"), (voc2, "Vocabulary 1", "adaptive"),
+                    (voc1, "Vocabulary 2", "adaptive"), (voc1, "shorttest", "adaptive")]
+        quiz_lists = choice_quiz_batch(requests)
+        assert len(quiz_lists) == len(requests)
+        for (voc, word_list_name, quiz_strategy), quiz_list in zip(requests, quiz_lists):
+            assert len(quiz_list) == len(voc.choice_quiz(word_list_name, quiz_strategy))
+            for quiz_package in quiz_list:
+                if quiz_package.directives["showFlashcard"]:
+                    continue
+                options = quiz_package.question.options
+                assert len(options) == 5
+                assert options.count(quiz_package.flashcard.lang1) == 1
+                assert len(set(options)) == len(options)
+
+        assert len(voc1.choice_quiz_batch([("shorttest", "adaptive")])[0]) == len(quiz_lists[0])
+
+        # Verify that every cache lookup is counted once and that large pools are scored in smaller chunks
+        alternatives.shortlist_cache.invalidate()
+        metrics = Metrics()
+        set_instrumentation(metrics)
+        try:
+            with patch.object(batchscoring, "SHORTLIST_MAX_SCORES", 2 * len(voc1.word_pool_lang1)), \
+                    patch.object(batchscoring.BatchScorer, "score_many", autospec=True,
+                                 side_effect=batchscoring.BatchScorer.score_many) as score_many:
+                choice_quiz_batch(requests)
+        finally:
+            set_instrumentation(None)
+        assert metrics.counters["shortlist_cache_misses"] == len(alternatives.shortlist_cache)
+        assert "shortlist_cache_hits" not in metrics.counters
+        assert max(len(call[0][1]) for call in score_many.call_args_list) == 2
+
+        # Verify that the scoring options of the Vocabulary are followed
+        voc3 = Vocabulary(approximate_alternatives=True)
+        voc3.load(TEST_DICT_PATH, load_wordlist_book)
+        with patch.object(batchscoring.BatchScorer, "shortlist_many", side_effect=AssertionError):
+            quiz_list = choice_quiz_batch([(voc3, "shorttest", "adaptive")])[0]
+        assert any(not quiz_package.directives["showFlashcard"] for quiz_package in quiz_list)
+
+    def test_instrumentation(self):
+        events = []
+        metrics = Metrics(callback=lambda kind, name, value: events.append((kind, name)))
+        set_instrumentation(metrics)
+        alternatives.shortlist_cache.invalidate()
+        try:
+            voc = Vocabulary()
+            voc.load(TEST_DICT_PATH, load_wordlist_book)
+            voc.reset_progress("shorttest")
+            quiz_list = voc.choice_quiz("shorttest", "adaptive")
+            voc.update_progress("shorttest", 2, True)
+            # The shortlists of the quiz are calculated by the index of the pool
+            index_candidates = list(metrics.values["candidate_count"])
+            alternatives.most_similar("test", voc.word_pool_lang1, 50, 4, alternatives.calc_similarity)
+        finally:
+            set_instrumentation(None)
+
+        # Verify that the hot paths are timed and counted
+        for name in ["load", "choice_quiz", "pick_rows", "most_similar", "calc_similarity", "update_progress"]:
+            assert metrics.timers[name][0] >= 1
+        assert metrics.timers["build_quiz"][0] == len(quiz_list)
+        assert index_candidates[0] >= 1
+        assert metrics.values["candidate_count"][0] == index_candidates[0] + 1
+        assert metrics.values["candidate_count"][1] - index_candidates[1] == metrics.counters["calc_similarity"]
+        assert ("timer", "load") in events
+        text = metrics.prometheus_text()
+        assert "# TYPE vocabulary_choice_quiz_seconds summary" in text
+        assert "vocabulary_load_seconds_count 1\n" in text
+
+        # Verify that nothing is collected with the default hooks
+        voc.choice_quiz("shorttest", "adaptive")
+        assert metrics.timers["choice_quiz"][0] == 1
+
+
+def _load_other_collection(path: str) -> WordCollection:
+    word_collection = load_wordlist_book(TEST_DICT_PATH)
+    del word_collection.word_lists["shorttest"]
+    return word_collection
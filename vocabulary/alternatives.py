@@ -2,13 +2,75 @@
 Algorithms for generating similar but incorrect alternatives to the correct answer.
 """
 
+import random
+import threading
+from collections import OrderedDict
+from heapq import nlargest
 from ngram import NGram
-from random import shuffle
-from typing import List, Callable
+from typing import List, Callable, Tuple
+from .instrumentation import get_instrumentation
+from .learningprogress import _random
+from .similarityindex import SimilarityIndex
+
+# Default number of shortlists kept in the cache
+SHORTLIST_CACHE_SIZE = 10000
+
+
+class ShortlistCache:
+    """
+    LRU cache of the shortlists of most_similar, keyed by (pool version, expression, shortlist count).
+    Only shuffling the shortlist and picking from it is random, so the shortlist can be reused.
+    """
+
+    def __init__(self, max_size: int = SHORTLIST_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._shortlists: "OrderedDict[tuple, Tuple[str, ...]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pool_version, expression: str, shortlist_count: int) -> Tuple[str, ...]:
+        """
+        :return: the cached shortlist in decreasing order of similarity, None if it's not cached
+        """
+        key = (pool_version, expression, shortlist_count)
+        with self._lock:
+            shortlist = self._shortlists.get(key)
+            if shortlist is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._shortlists.move_to_end(key)
+            return shortlist
+
+    def put(self, pool_version, expression: str, shortlist_count: int, shortlist: List[str]):
+        with self._lock:
+            self._shortlists[(pool_version, expression, shortlist_count)] = tuple(shortlist)
+            while len(self._shortlists) > self.max_size:
+                self._shortlists.popitem(last=False)
+
+    def invalidate(self, pool_version=None):
+        """
+        Remove the shortlists of the given pool version, or every shortlist if it's None
+        """
+        with self._lock:
+            if pool_version is None:
+                self._shortlists.clear()
+            else:
+                for key in [key for key in self._shortlists if key[0] == pool_version]:
+                    del self._shortlists[key]
+
+    def __len__(self):
+        return len(self._shortlists)
+
+
+# Cache used by most_similar when a pool version is given
+shortlist_cache = ShortlistCache()
 
 
 def most_similar(expression: str, pool: List[str], shortlist_count: int,
-                 picked_count: int, similarity_func: Callable[[str, List[str]], List[int]]) -> List[str]:
+                 picked_count: int, similarity_func: Callable[[str, List[str]], List[int]],
+                 index: SimilarityIndex = None, pool_version=None, rng: random.Random = None) -> List[str]:
     """
     Find how_many other words that are similar to the correct answer so that the choice quiz will be harder
     :param expression:
@@ -16,14 +78,37 @@ def most_similar(expression: str, pool: List[str], shortlist_count: int,
     :param shortlist_count:
     :param picked_count:
     :param similarity_func: function to calculate the similarity of expressions
+    :param index: SimilarityIndex, BatchScorer, LengthBuckets or MinHashIndex built from pool,
+        if given, it's used instead of similarity_func
+    :param pool_version: identifier of the content of pool, if given, the shortlists are cached in shortlist_cache
+    :param rng: random generator picking from the shortlist, the one of the random module by default
     :return: List of the most similar expressions
     """
-    # Removing duplicates
-    pool_without_duplicates = list(set(pool) - set([expression]))
-    similarity = similarity_func(expression, pool_without_duplicates)
-    similar_options = _pick_highest_ranking(pool_without_duplicates, similarity, shortlist_count,
-                                            picked_count, exclude_list=[])
-    return similar_options
+    instrumentation = get_instrumentation()
+    if instrumentation.enabled:
+        instrumentation.observe("pool_size", len(pool))
+    with instrumentation.timer("most_similar"):
+        shortlist = None
+        if pool_version is not None:
+            shortlist = shortlist_cache.get(pool_version, expression, shortlist_count)
+            if instrumentation.enabled:
+                instrumentation.count("shortlist_cache_hits" if shortlist is not None else "shortlist_cache_misses")
+
+        if shortlist is None:
+            if index is not None:
+                shortlist = index.shortlist(expression, shortlist_count)
+            else:
+                # Removing duplicates
+                pool_without_duplicates = list(set(pool) - set([expression]))
+                if instrumentation.enabled:
+                    instrumentation.observe("candidate_count", len(pool_without_duplicates))
+                similarity = similarity_func(expression, pool_without_duplicates)
+                shortlist = _shortlist_highest_ranking(pool_without_duplicates, similarity, shortlist_count,
+                                                       exclude_list=[])
+            if pool_version is not None:
+                shortlist_cache.put(pool_version, expression, shortlist_count, shortlist)
+
+        return _pick_from_shortlist(list(shortlist), picked_count, rng)
 
 
 def calc_similarity(expression_str: str, alternative_list: List[str]) -> List[int]:
@@ -33,6 +118,14 @@ def calc_similarity(expression_str: str, alternative_list: List[str]) -> List[in
     :param alternative_list:
     :return:
     """
+    instrumentation = get_instrumentation()
+    if instrumentation.enabled:
+        instrumentation.count("calc_similarity", len(alternative_list))
+    with instrumentation.timer("calc_similarity"):
+        return _calc_similarity(expression_str, alternative_list)
+
+
+def _calc_similarity(expression_str: str, alternative_list: List[str]) -> List[int]:
     expr = str(expression_str)  # Sometimes the type is unicode
     similarity = []  # key: alternative expression, val: similarity index
 
@@ -56,7 +149,23 @@ def calc_similarity(expression_str: str, alternative_list: List[str]) -> List[in
     return similarity
 
 
-def _pick_highest_ranking(expr_list, ranking, pool_count, picked_count, exclude_list=None):
+def _pick_highest_ranking(expr_list, ranking, pool_count, picked_count, exclude_list=None, top_k=True,
+                          rng: random.Random = None):
+    return _pick_from_shortlist(_shortlist_highest_ranking(expr_list, ranking, pool_count, exclude_list, top_k),
+                                picked_count, rng)
+
+
+def _shortlist_highest_ranking(expr_list, ranking, pool_count, exclude_list=None, top_k=True):
+    """
+    Get the pool_count expressions with the highest ranking, in decreasing order of ranking
+    :param top_k: select the expressions with a heap instead of sorting the whole list, the result is the same
+    """
+    if top_k:
+        excluded = set(exclude_list) if exclude_list else set()
+        candidates = ((expr, rank) for expr, rank in zip(expr_list, ranking) if expr not in excluded)
+        # Same as sorting by ranking value (stable) and taking the first pool_count elements
+        return [expr for expr, rank in nlargest(pool_count, candidates, key=lambda v: v[1])]
+
     if exclude_list is None:
         exclude_list = []
     zipped_list = list(zip(expr_list, ranking))
@@ -72,8 +181,12 @@ def _pick_highest_ranking(expr_list, ranking, pool_count, picked_count, exclude_
         if len(pool) >= pool_count:
             break
 
-    shuffle(pool)
+    return pool
+
+
+def _pick_from_shortlist(shortlist, picked_count, rng: random.Random = None):
+    _random(rng).shuffle(shortlist)
 
     # Pick <pick_count words from pool>
-    picked_list = pool[:picked_count]
+    picked_list = shortlist[:picked_count]
     return picked_list
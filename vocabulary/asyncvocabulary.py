@@ -0,0 +1,138 @@
+"""
+asyncio facade of stateless.Vocabulary.
+
+Loading, saving and generating quizzes run on an executor, so they don't block the event loop. The load and save
+functions can run on a thread pool or on a process pool, everything that uses the state of the Vocabulary object
+(building the word pools, scoring the alternatives, updating the progress) runs on a thread pool.
+"""
+
+import asyncio
+import os
+import random
+from concurrent.futures import Executor, ProcessPoolExecutor
+from copy import deepcopy
+from typing import Callable, Dict, List, Tuple
+
+from .models import QuizPackage, WordCollection
+from .poolregistry import PoolRegistry
+from .stateless import Vocabulary
+
+
+class _PendingLoad:
+    """Load shared by the concurrent callers loading the same path with the same function"""
+
+    def __init__(self):
+        self.caller_count = 0
+        self.task: asyncio.Future = None
+
+
+# Loads in progress: (event loop, absolute path, load function) -> _PendingLoad
+_pending_loads: Dict[tuple, _PendingLoad] = {}
+
+
+async def _run_load(key: tuple, pending: _PendingLoad, executor: Executor, path: str,
+                    load_function: Callable[[str], WordCollection]) -> List[WordCollection]:
+    loop = asyncio.get_event_loop()
+    try:
+        word_collection = await loop.run_in_executor(executor, load_function, path)
+    finally:
+        # The callers arriving from now on start a new load
+        del _pending_loads[key]
+    # Every caller changes the learning statuses of its own word collection
+    copies = await loop.run_in_executor(None, _copy_word_collection, word_collection, pending.caller_count - 1)
+    return [word_collection] + copies
+
+
+def _copy_word_collection(word_collection: WordCollection, count: int) -> List[WordCollection]:
+    return [deepcopy(word_collection) for _ in range(count)]
+
+
+async def _load_once(executor: Executor, path: str, load_function: Callable[[str], WordCollection]) \
+        -> WordCollection:
+    """
+    Load the word collection on the executor. Concurrent loads of the same path with the same function are
+    only run once, the other callers get copies of the word collection.
+    """
+    key = (asyncio.get_event_loop(), os.path.abspath(path), load_function)
+    pending = _pending_loads.get(key)
+    if pending is None:
+        pending = _PendingLoad()
+        _pending_loads[key] = pending
+        pending.task = asyncio.ensure_future(_run_load(key, pending, executor, path, load_function))
+    pending.caller_count += 1
+    # A cancelled caller doesn't cancel the load of the others
+    word_collections = await asyncio.shield(pending.task)
+    return word_collections.pop()
+
+
+class AsyncVocabulary:
+    """
+    Same functionalities as stateless.Vocabulary with awaitable methods.
+    The calls are serialized per object, so the progress isn't updated while a quiz is generated.
+    """
+
+    def __init__(self, executor: Executor = None, pool_registry: PoolRegistry = None, rng: random.Random = None):
+        """
+        :param executor: thread pool or process pool for the load and save functions,
+            the default executor of the event loop is used if it's None
+        :param pool_registry: see stateless.Vocabulary
+        :param rng: see stateless.Vocabulary
+        """
+        self.vocabulary = Vocabulary(pool_registry, rng=rng)
+        self.executor = executor
+        # The Vocabulary object can't be sent to other processes, its own work always runs on threads
+        self._thread_executor = None if isinstance(executor, ProcessPoolExecutor) else executor
+        self._lock: asyncio.Lock = None
+
+    @property
+    def word_collection(self) -> WordCollection:
+        return self.vocabulary.word_collection
+
+    async def load(self, path: str, load_function: Callable[[str], WordCollection]):
+        word_collection = await _load_once(self.executor, path, load_function)
+        # The word pools and the similarity index of a new word collection are built on a thread
+        shared_pool = await self._run_in_thread(self.vocabulary.pool_registry.acquire, word_collection)
+        async with self._get_lock():
+            self.vocabulary.word_collection = word_collection
+            self.vocabulary._set_shared_pool(shared_pool)
+
+    async def save(self, path: str, save_function: Callable[[str, WordCollection], None]):
+        async with self._get_lock():
+            await asyncio.get_event_loop().run_in_executor(self.executor, save_function, path,
+                                                           self.vocabulary.word_collection)
+
+    def close(self):
+        self.vocabulary.close()
+
+    def get_word_sheet_list(self) -> list:
+        return self.vocabulary.get_word_sheet_list()
+
+    async def choice_quiz(self, word_list_name: str, quiz_strategy: str) -> List[QuizPackage]:
+        async with self._get_lock():
+            return await self._run_in_thread(self.vocabulary.choice_quiz, word_list_name, quiz_strategy)
+
+    async def choice_quiz_batch(self, requests: List[Tuple[str, str]]) -> List[List[QuizPackage]]:
+        async with self._get_lock():
+            return await self._run_in_thread(self.vocabulary.choice_quiz_batch, requests)
+
+    async def update_progress(self, word_list_name: str, row_key, q_correctly_answered: bool):
+        async with self._get_lock():
+            # A lazily loaded word list may be loaded (and its words added to the pools) by any of these calls
+            await self._run_in_thread(self.vocabulary.update_progress, word_list_name, row_key, q_correctly_answered)
+
+    async def get_progress(self, word_list_name: str) -> float:
+        async with self._get_lock():
+            return await self._run_in_thread(self.vocabulary.get_progress, word_list_name)
+
+    async def reset_progress(self, word_list_name: str):
+        async with self._get_lock():
+            await self._run_in_thread(self.vocabulary.reset_progress, word_list_name)
+
+    def _get_lock(self) -> asyncio.Lock:
+        # Created in the event loop that uses the object
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    async def _run_in_thread(self, function, *args):
+        return await asyncio.get_event_loop().run_in_executor(self._thread_executor, function, *args)
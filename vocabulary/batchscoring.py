@@ -0,0 +1,154 @@
+"""
+Vectorized scoring of expressions against a whole pool with NumPy.
+
+The pool is stored as arrays (character counts, word counts, '?' and '!' flags) and as sparse n-gram count vectors
+(one list of (pool position, count) entries per n-gram), the scores are the same as the ones of
+alternatives.calc_similarity.
+"""
+
+import numpy as np
+from collections import Counter
+from ngram import NGram
+from typing import List, Tuple
+
+from .instrumentation import get_instrumentation
+from .similarityindex import _unique
+
+_SPLITTER = NGram()
+
+# Default number of expressions scored at once by BatchScorer.shortlist_many
+SHORTLIST_CHUNK_SIZE = 64
+# Maximum number of scores of a chunk (8 MB per array of scores), the chunks are smaller for large pools
+SHORTLIST_MAX_SCORES = 1 << 20
+
+
+def _feature_arrays(word_strs: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Character counts, word counts, '?' and '!' flags of the expressions (see similarityindex._features)"""
+    return (np.array([len(word) for word in word_strs], dtype=np.int64),
+            np.array([len(word.split()) for word in word_strs], dtype=np.int64),
+            np.array(["?" in word for word in word_strs], dtype=bool),
+            np.array(["!" in word for word in word_strs], dtype=bool))
+
+
+def _length_term_arrays(expr_features, alt_features) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The wordcount, charcount and specchars terms of alternatives.calc_similarity for arrays of features
+    (see similarityindex._length_terms), the arrays are broadcast against each other
+    """
+    expr_chars, expr_words, expr_question, expr_exclamation = expr_features
+    alt_chars, alt_words, alt_question, alt_exclamation = alt_features
+    wordcount = 1 - np.abs(alt_words - expr_words) / (expr_words + alt_words)
+    charcount = 1 - np.abs(alt_chars - expr_chars) / (expr_chars + alt_chars)
+    specchars = (expr_question & alt_question).astype(np.int64) + (expr_exclamation & alt_exclamation).astype(np.int64)
+    return wordcount, charcount, specchars
+
+
+class BatchScorer:
+    """
+    Score one or many expressions against every expression of a pool in a few array operations.
+    """
+
+    def __init__(self, pool: List[str]):
+        self.words: List[str] = _unique(pool)
+        self._positions = {word: position for position, word in enumerate(self.words)}
+        word_strs = [str(word) for word in self.words]
+
+        self.char_counts, self.word_counts, self.question_marks, self.exclamation_marks = _feature_arrays(word_strs)
+
+        # Sparse n-gram vectors, stored column-wise: the entries of n-gram g are
+        # _entry_positions[_gram_starts[g]:_gram_starts[g + 1]] and _entry_counts[...]
+        postings = {}
+        for position, word in enumerate(word_strs):
+            for gram, count in Counter(_SPLITTER.split(word)).items():
+                postings.setdefault(gram, []).append((position, count))
+        self._gram_ids = {gram: gram_id for gram_id, gram in enumerate(postings)}
+        sizes = np.array([len(entries) for entries in postings.values()], dtype=np.int64)
+        self._gram_starts = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+        entries = [entry for gram_entries in postings.values() for entry in gram_entries]
+        self._entry_positions = np.array([position for position, _ in entries], dtype=np.int64)
+        self._entry_counts = np.array([count for _, count in entries], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.words)
+
+    def score(self, expression: str) -> np.ndarray:
+        """
+        Calculate the similarity between expression and every expression of the pool
+        :return: scores in the order of self.words
+        """
+        return self.score_many([expression])[0]
+
+    def score_many(self, expressions: List[str]) -> np.ndarray:
+        """
+        Calculate the similarity between every expression and every expression of the pool
+        :return: array of shape (len(expressions), len(self.words))
+        """
+        exprs = [str(expression) for expression in expressions]
+        pool_size = len(self.words)
+
+        # Shared n-gram counts: the minimum of the counts of every n-gram, summed up
+        flat_positions = []
+        shared_counts = []
+        for row, expr in enumerate(exprs):
+            for gram, count in Counter(_SPLITTER.split(expr)).items():
+                gram_id = self._gram_ids.get(gram)
+                if gram_id is None:
+                    continue
+                start, end = self._gram_starts[gram_id], self._gram_starts[gram_id + 1]
+                flat_positions.append(self._entry_positions[start:end] + row * pool_size)
+                shared_counts.append(np.minimum(self._entry_counts[start:end], count))
+        samegrams = np.bincount(np.concatenate(flat_positions) if flat_positions else np.zeros(0, dtype=np.int64),
+                                weights=np.concatenate(shared_counts) if shared_counts else None,
+                                minlength=len(exprs) * pool_size).reshape(len(exprs), pool_size)
+
+        # One row per expression, one column per expression of the pool
+        expr_features = [features[:, np.newaxis] for features in _feature_arrays(exprs)]
+        pool_features = (self.char_counts, self.word_counts, self.question_marks, self.exclamation_marks)
+
+        ngram = samegrams / (expr_features[0] + self.char_counts + 4 - samegrams)
+        wordcount, charcount, specchars = _length_term_arrays(expr_features, pool_features)
+        return ngram + wordcount + charcount + specchars
+
+    def shortlist(self, expression: str, shortlist_count: int) -> List[str]:
+        """
+        Find the shortlist_count expressions of the pool that are the most similar to expression
+        :return: expressions in decreasing order of similarity
+        """
+        return self.shortlist_many([expression], shortlist_count)[0]
+
+    def shortlist_many(self, expressions: List[str], shortlist_count: int,
+                       chunk_size: int = SHORTLIST_CHUNK_SIZE) -> List[List[str]]:
+        """
+        Find the shortlist_count most similar expressions for every expression,
+        scoring chunk_size expressions at once (the scores take chunk_size * len(self.words) floats),
+        or fewer if the scores of a chunk would exceed SHORTLIST_MAX_SCORES
+        """
+        chunk_size = max(1, min(chunk_size, SHORTLIST_MAX_SCORES // max(1, len(self.words))))
+        shortlists = []
+        for start in range(0, len(expressions), chunk_size):
+            chunk = expressions[start:start + chunk_size]
+            shortlists.extend(self._shortlist_chunk(chunk, shortlist_count))
+        return shortlists
+
+    def _shortlist_chunk(self, expressions: List[str], shortlist_count: int) -> List[List[str]]:
+        scores = self.score_many(expressions)
+        instrumentation = get_instrumentation()
+        shortlists = []
+        for row, expression in enumerate(expressions):
+            row_scores = scores[row]
+            candidate_count = len(self.words)
+            # The expression itself is never an alternative
+            position = self._positions.get(expression)
+            if position is not None:
+                row_scores[position] = -np.inf
+                candidate_count -= 1
+            if instrumentation.enabled:
+                instrumentation.observe("candidate_count", candidate_count)
+            count = min(shortlist_count, candidate_count)
+            if count <= 0:
+                shortlists.append([])
+                continue
+            top = np.argpartition(-row_scores, count - 1)[:count]
+            top = top[np.argsort(-row_scores[top], kind="stable")]
+            shortlists.append([self.words[word_position] for word_position in top])
+        return shortlists
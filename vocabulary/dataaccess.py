@@ -1,8 +1,20 @@
 import logging
-from .models import Flashcard, WordList, WordCollection
-from typing import Dict, Tuple
+from .models import Flashcard, WordList, WordCollection, LazyWordLists, loaded_word_lists, _FlashcardColumns
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Tuple
 from openpyxl import Workbook
+import json
+import os
 import pickle
+import posixpath
+import threading
+import weakref
+import zipfile
+from xml.etree import ElementTree
+
+# Binary columnar snapshots, an alternative to the pickled word collections
+from .snapshot import SnapshotFormatError, map_word_collection, word_collection_from_snapshot, \
+    word_collection_to_snapshot
 
 mpl_logger = logging.getLogger('matplotlib')
 mpl_logger.setLevel(logging.WARNING)
@@ -13,31 +25,298 @@ LANG2_COL = 2
 REMARKS_COL = 3
 LEARNING_STATUS_COL = 4
 
+# Namespaces of the elements of the workbook and worksheet parts in an Excel file
+_SPREADSHEETML_NAMESPACE = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_RELATIONSHIPS_NAMESPACE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PACKAGE_RELATIONSHIPS_NAMESPACE = "http://schemas.openxmlformats.org/package/2006/relationships"
+
+# Default limit for the number of rows in a worksheet
+MAX_ROWS = 10000
+
+# The changed learning statuses are appended to this file next to the workbook (<workbook path><suffix>)
+PROGRESS_FILE_SUFFIX = ".progress"
+# The workbook is rewritten and the progress file is removed when the progress file grows larger (bytes)
+PROGRESS_FILE_MAX_SIZE = 1024 * 1024
 
-def load_wordlist_book(wb_path: str) -> WordCollection:
+
+def load_wordlist_book(wb_path: str, max_rows: int = MAX_ROWS) -> WordCollection:
     """
     Load the wordlist_book dictionary from an Excel file.
+    The workbook is opened in read-only mode and its rows are streamed.
     :param wb_path: Path of Excel file
+    :param max_rows: Maximum number of rows in a worksheet, None for no limit
     """
     workbook = _load_workbook_by_path(wb_path)
 
-    wordlist_book = _excel_wb_to_word_collection(
-        workbook=workbook,
-        lang1_col=LANG1_COL,
-        lang2_col=LANG2_COL,
-        remarks_col=REMARKS_COL,
-        learning_status_col=LEARNING_STATUS_COL
-    )
+    try:
+        wordlist_book = _excel_wb_to_word_collection(
+            workbook=workbook,
+            lang1_col=LANG1_COL,
+            lang2_col=LANG2_COL,
+            remarks_col=REMARKS_COL,
+            learning_status_col=LEARNING_STATUS_COL,
+            max_rows=max_rows
+        )
+    finally:
+        # Read-only workbooks keep the file open until they are closed
+        workbook.close()
+
+    wordlist_book.source_path = wb_path
+    _merge_learning_progress(wb_path + PROGRESS_FILE_SUFFIX, wordlist_book)
+    return wordlist_book
+
+
+def load_wordlist_book_parallel(wb_path: str, max_rows: int = MAX_ROWS, executor: Executor = None,
+                                max_workers: int = None) -> WordCollection:
+    """
+    Load the wordlist_book dictionary from an Excel file, parsing the worksheets in parallel.
+    The worksheets are split into one group per worker, every worker opens the workbook in read-only mode
+    and sends back the word lists of its group, so no openpyxl object is sent between the processes.
+    Only the parsing is parallel: the word pools are built from the loaded word collection by the pool registry
+    (stateless.Vocabulary.load), where they're shared with the other instances loading the same content.
+    :param wb_path: Path of Excel file
+    :param max_rows: Maximum number of rows in a worksheet, None for no limit
+    :param executor: Process pool (or thread pool) parsing the worksheets,
+        a process pool is created for the call if it's None
+    :param max_workers: Number of worksheet groups (and of the workers of the created process pool),
+        the number of CPU cores by default
+    """
+    sheet_names = _worksheet_names(wb_path)
+    worker_count = max(1, min(len(sheet_names), max_workers or os.cpu_count() or 1))
+    groups = [sheet_names[i::worker_count] for i in range(worker_count)]
+    if executor is None and worker_count == 1:
+        word_lists = _load_worksheets(wb_path, sheet_names, max_rows)
+    elif executor is None:
+        with ProcessPoolExecutor(worker_count) as process_pool:
+            word_lists = _load_worksheet_groups(process_pool, wb_path, groups, max_rows)
+    else:
+        word_lists = _load_worksheet_groups(executor, wb_path, groups, max_rows)
+
+    # The word lists are kept in the order of the worksheets
+    wordlist_book = _valid_word_collection([word_lists[sheet_name] for sheet_name in sheet_names])
+    wordlist_book.source_path = wb_path
+    _merge_learning_progress(wb_path + PROGRESS_FILE_SUFFIX, wordlist_book)
     return wordlist_book
 
 
-def save_wordlist_book(wb_path: str, word_collection: WordCollection):
+def _worksheet_names(wb_path: str) -> List[str]:
+    """
+    Read the names of the worksheets from the workbook part of the file,
+    opening the workbook with openpyxl would parse the shared strings of all the worksheets as well
+    """
+    with zipfile.ZipFile(wb_path) as archive:
+        root = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    return [sheet.get("name") for sheet in root.iter("{%s}sheet" % _SPREADSHEETML_NAMESPACE)]
+
+
+def _worksheet_sizes(wb_path: str) -> Dict[str, int]:
+    """
+    Read the number of rows of the worksheets (worksheet name -> last row or None if it's unknown)
+    from the dimension element at the beginning of the worksheet parts, without reading the rows
+    """
+    with zipfile.ZipFile(wb_path) as archive:
+        return {sheet_name: _worksheet_size(archive, part)
+                for sheet_name, part in _worksheet_parts(archive).items()}
+
+
+def _worksheet_parts(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """
+    Get the names of the worksheets and the paths of their parts in the Excel file (in the order of the worksheets)
+    """
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {relationship.get("Id"): relationship.get("Target") for relationship in
+               relationships.iter("{%s}Relationship" % _PACKAGE_RELATIONSHIPS_NAMESPACE)}
+    parts = {}
+    for sheet in workbook.iter("{%s}sheet" % _SPREADSHEETML_NAMESPACE):
+        target = targets.get(sheet.get("{%s}id" % _RELATIONSHIPS_NAMESPACE), "")
+        parts[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else \
+            posixpath.normpath(posixpath.join("xl", target))
+    return parts
+
+
+def _worksheet_size(archive: zipfile.ZipFile, part: str):
+    try:
+        with archive.open(part) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag == "{%s}dimension" % _SPREADSHEETML_NAMESPACE:
+                    # E. g. A1:D1088 or A1
+                    last_cell = element.get("ref", "").split(":")[-1]
+                    digits = last_cell.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ$").replace("$", "")
+                    return int(digits) if digits.isdigit() else None
+                if element.tag == "{%s}sheetData" % _SPREADSHEETML_NAMESPACE or \
+                        element.tag == "{%s}row" % _SPREADSHEETML_NAMESPACE:
+                    return None
+    except (KeyError, ElementTree.ParseError):
+        return None
+    return None
+
+
+def _worksheet_valid_rows(wb_path: str, sheet_names: List[str], enough: int) -> Dict[str, int]:
+    """
+    Count the rows of the worksheets that have both language cells filled in (the first row isn't counted),
+    only reading the worksheet parts until enough rows are found
+    """
+    with zipfile.ZipFile(wb_path) as archive:
+        parts = _worksheet_parts(archive)
+        return {sheet_name: _worksheet_valid_row_count(archive, parts[sheet_name], enough)
+                for sheet_name in sheet_names}
+
+
+def _worksheet_valid_row_count(archive: zipfile.ZipFile, part: str, enough: int) -> int:
+    count = 0
+    row = 0
+    try:
+        with archive.open(part) as f:
+            for _, element in ElementTree.iterparse(f):
+                if element.tag != "{%s}row" % _SPREADSHEETML_NAMESPACE:
+                    continue
+                row = int(element.get("r", row + 1))
+                if row > 1 and {LANG1_COL, LANG2_COL} <= _filled_columns(element):
+                    count += 1
+                    if count >= enough:
+                        break
+                element.clear()
+    except (KeyError, ElementTree.ParseError):
+        # The worksheet is left to openpyxl, which reports the error when it's loaded
+        return enough
+    return count
+
+
+def _filled_columns(row_element) -> set:
+    """
+    Get the columns (A -> 1, B -> 2, ...) of the cells of a row element that have a value
+    (the shared strings aren't read, a cell referring to an empty shared string is counted as filled in)
+    """
+    columns = set()
+    column = 0
+    for cell in row_element.iter("{%s}c" % _SPREADSHEETML_NAMESPACE):
+        letters = "".join(char for char in cell.get("r", "") if char.isalpha())
+        if letters:
+            column = 0
+            for letter in letters.upper():
+                column = column * 26 + ord(letter) - ord("A") + 1
+        else:
+            column += 1
+        value = cell.find("{%s}v" % _SPREADSHEETML_NAMESPACE)
+        inline_string = cell.find("{%s}is" % _SPREADSHEETML_NAMESPACE)  # <is><t>text</t></is>
+        text = value.text if value is not None else \
+            "".join(inline_string.itertext()) if inline_string is not None else ""
+        if text:
+            columns.add(column)
+    return columns
+
+
+def _load_worksheet_groups(executor: Executor, wb_path: str, groups: List[List[str]],
+                           max_rows: int) -> Dict[str, WordList]:
+    futures = [executor.submit(_load_worksheets, wb_path, group, max_rows) for group in groups]
+    word_lists = {}
+    for future in futures:
+        word_lists.update(future.result())
+    return word_lists
+
+
+def _load_worksheets(wb_path: str, sheet_names: List[str], max_rows: int) -> Dict[str, WordList]:
+    """
+    Convert the given worksheets of an Excel file to word lists (run by the workers of load_wordlist_book_parallel)
+    """
+    workbook = _load_workbook_by_path(wb_path)
+    try:
+        return {sheet_name: _excel_worksheet_to_wordlist(workbook, sheet_name, LANG1_COL, LANG2_COL, REMARKS_COL,
+                                                         LEARNING_STATUS_COL, max_rows)
+                for sheet_name in sheet_names}
+    finally:
+        workbook.close()
+
+
+def load_wordlist_book_lazy(wb_path: str, max_rows: int = MAX_ROWS) -> WordCollection:
+    """
+    Load the wordlist_book dictionary from an Excel file lazily: only the names and the sizes of the worksheets
+    are read, a worksheet is converted to a word list when it's first accessed.
+    The worksheets that don't have 5 flashcards are left out at once: the filled in language cells of their
+    first rows are counted without loading them.
+    :param wb_path: Path of Excel file
+    :param max_rows: Maximum number of rows in a worksheet, None for no limit
+    """
+    names = []
+    for sheet_name, size in _worksheet_sizes(wb_path).items():
+        if size is not None and max_rows is not None and size > max_rows:
+            raise ValueError(f"Error: number of rows > {max_rows}")
+        # The first row is for language information
+        if size is None or size - 1 >= 5:
+            names.append(sheet_name)
+    valid_rows = _worksheet_valid_rows(wb_path, names, 5)
+    names = [sheet_name for sheet_name in names if valid_rows[sheet_name] >= 5]
+    if len(names) == 0:
+        raise NoValidWordListsError("The selected file doesn't contain any valid word lists.")
+
+    workbook = _LazyWorkbook(wb_path, max_rows, len(names))
+    return WordCollection(
+        lang1="lang1_placeholder",
+        lang2="lang2_placeholder",
+        word_lists=LazyWordLists(names, workbook.load_word_list),
+        source_path=wb_path
+    )
+
+
+class _LazyWorkbook:
+    """
+    Workbook whose worksheets are converted to word lists one by one.
+    The workbook is kept open until all the worksheets are loaded.
+    """
+
+    def __init__(self, wb_path: str, max_rows: int, sheet_count: int):
+        self.wb_path = wb_path
+        self.max_rows = max_rows
+        self._remaining = sheet_count
+        self._workbook = None
+        self._close = None
+        self._lock = threading.Lock()
+        # The learning statuses saved since the workbook was saved, by worksheet
+        self._progress = _read_learning_progress(wb_path + PROGRESS_FILE_SUFFIX)
+
+    def load_word_list(self, sheet_name: str) -> WordList:
+        """
+        Convert a worksheet to a word list, None is returned if it has fewer than 5 flashcards
+        """
+        with self._lock:
+            if self._workbook is None:
+                self._workbook = _load_workbook_by_path(self.wb_path)
+                self._close = weakref.finalize(self, self._workbook.close)
+            try:
+                word_list = _excel_worksheet_to_wordlist(self._workbook, sheet_name, LANG1_COL, LANG2_COL,
+                                                         REMARKS_COL, LEARNING_STATUS_COL, self.max_rows)
+            finally:
+                # A worksheet that can't be loaded isn't loaded again either (see LazyWordLists)
+                self._remaining -= 1
+                if self._remaining == 0:
+                    self._close()
+                    self._workbook = None
+
+        _apply_learning_progress(word_list, self._progress.pop(sheet_name, {}))
+        return word_list if len(word_list.flashcards) >= 5 else None
+
+
+def save_wordlist_book(wb_path: str, word_collection: WordCollection, write_only: bool = False):
     """Save the word collection.
+    The changed learning statuses are only marked as saved if the workbook is the one the collection was loaded
+    from (or the collection wasn't loaded from a workbook, then the saved workbook becomes its workbook),
+    so exporting to another file doesn't drop them from the next save_learning_progress.
     :param wb_path: Path of the Excel workbook to be created
     :param word_collection: Object to be saved as Excel workbook
+    :param write_only: Stream the rows to a write-only workbook instead of building the whole workbook in memory
     """
     columns = {"lang1": LANG1_COL, "lang2": LANG2_COL, "remarks": REMARKS_COL, "learning status": LEARNING_STATUS_COL}
 
+    if write_only:
+        workbook_new = Workbook(write_only=True)
+        for sheet_name in word_collection.word_lists.keys():
+            worksheet = workbook_new.create_sheet(sheet_name)
+            _word_list_to_ws_rows(worksheet, word_collection.word_lists[sheet_name], columns)
+        _save_workbook(wb_path, workbook_new)
+        _remove_learning_progress(wb_path + PROGRESS_FILE_SUFFIX)
+        _saved_to_workbook(wb_path, word_collection)
+        return
 
     workbook_new = Workbook()
 
@@ -49,26 +328,137 @@ def save_wordlist_book(wb_path: str, word_collection: WordCollection):
         _word_collection_to_wb(workbook_new, word_collection.word_lists[sheet_name], columns)
 
     _save_workbook(wb_path, workbook_new)
+    _remove_learning_progress(wb_path + PROGRESS_FILE_SUFFIX)
+    _saved_to_workbook(wb_path, word_collection)
+
+
+def _saved_to_workbook(wb_path: str, word_collection: WordCollection):
+    source_path = word_collection.source_path
+    if source_path is None:
+        word_collection.source_path = wb_path
+    elif os.path.normcase(os.path.abspath(source_path)) != os.path.normcase(os.path.abspath(wb_path)):
+        # Exported to another file, the changes aren't saved in the workbook of the collection
+        return
+    _clear_dirty_rows(word_collection)
+
+
+def _clear_dirty_rows(word_collection: WordCollection):
+    # The saved workbook contains the changed learning statuses
+    for word_list in loaded_word_lists(word_collection):
+        word_list.dirty_rows.clear()
+
+
+def save_learning_progress(wb_path: str, word_collection: WordCollection,
+                           max_size: int = PROGRESS_FILE_MAX_SIZE):
+    """Save the learning statuses that changed since the last save.
+    The changed rows are appended to the progress file of the workbook, load_wordlist_book merges them
+    into the loaded word collection. Every entry holds the lang1 expression of its row, the entries whose row
+    holds another expression when the workbook is loaded (e. g. the worksheet was edited) are skipped.
+    If the progress file grows larger than max_size, the whole workbook is saved.
+    :param wb_path: Path of the Excel workbook the word collection was loaded from
+    :param word_collection: Object with the changed learning statuses
+    :param max_size: Maximum size of the progress file in bytes
+    """
+    progress_path = wb_path + PROGRESS_FILE_SUFFIX
+
+    word_lists = word_collection.word_lists
+    if isinstance(word_lists, LazyWordLists):
+        # The word lists that aren't loaded yet have no changed rows
+        word_lists = word_lists.loaded()
+    entries = []
+    for sheet_name, word_list in word_lists.items():
+        for row in sorted(word_list.dirty_rows):
+            flashcard = word_list.flashcards[row]
+            entries.append(json.dumps({"sheet": sheet_name, "row": row, "lang1": str(flashcard.lang1),
+                                       "status": flashcard.learning_status}))
+    if len(entries) > 0:
+        with open(progress_path, mode='a', encoding='utf-8') as f:
+            f.write("\n".join(entries) + "\n")
+
+    _clear_dirty_rows(word_collection)
+
+    if os.path.exists(progress_path) and os.path.getsize(progress_path) > max_size:
+        save_wordlist_book(wb_path, word_collection, write_only=True)
 
 
 def _load_workbook_by_path(pathname: str):
     # Loading dictionary from file
     from openpyxl import load_workbook  # TODO revise this
-    return load_workbook(pathname)
+    return load_workbook(pathname, read_only=True)
 
 
 def _save_workbook(wb_path: str, altered_workbook):
     altered_workbook.save(filename=wb_path)
 
 
+def _merge_learning_progress(progress_path: str, word_collection: WordCollection):
+    """
+    Apply the learning statuses from the progress file, the later entries override the earlier ones
+    """
+    for sheet_name, statuses in _read_learning_progress(progress_path).items():
+        word_list = word_collection.word_lists.get(sheet_name)
+        if word_list is not None:
+            _apply_learning_progress(word_list, statuses)
+
+
+def _read_learning_progress(progress_path: str) -> Dict[str, Dict[int, Tuple[str, int]]]:
+    """
+    Read the progress file (worksheet name -> row -> (lang1 expression, learning status)),
+    the later entries override the earlier ones
+    """
+    progress = {}
+    if not os.path.exists(progress_path):
+        return progress
+    with open(progress_path, mode='r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                sheet, row, lang1, status = entry["sheet"], entry["row"], entry.get("lang1"), entry["status"]
+                if not isinstance(sheet, str) or type(row) is not int or not isinstance(lang1, (str, type(None))):
+                    raise TypeError("Invalid entry")
+            except (ValueError, TypeError, KeyError, AttributeError):
+                # E. g. the last line is incomplete because saving was interrupted
+                logging.warning("Skipping invalid line in {}: {}".format(progress_path, line))
+                continue
+            progress.setdefault(sheet, {})[row] = (lang1, status)
+    return progress
+
+
+def _apply_learning_progress(word_list: WordList, statuses: Dict[int, Tuple[str, int]]):
+    for row, (lang1, learning_status) in statuses.items():
+        if row not in word_list.flashcards:
+            continue
+        # The row was changed or moved since the entry was saved
+        if str(word_list.flashcards[row].lang1) != lang1:
+            logging.warning("Skipping the saved learning status of {} row {}: the row has changed".format(
+                word_list.name, row))
+            continue
+        # The saved statuses aren't changes since the last save
+        word_list.flashcards.set_status(row, learning_status)
+    word_list.learning_progress.invalidate_index()
+
+
+def _remove_learning_progress(progress_path: str):
+    # The saved workbook contains all the learning statuses, the progress file is outdated
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
+
 def _excel_wb_to_word_collection(workbook, lang1_col, lang2_col,
-                                 remarks_col, learning_status_col) -> WordCollection:
+                                 remarks_col, learning_status_col, max_rows=MAX_ROWS) -> WordCollection:
+    return _valid_word_collection([_excel_worksheet_to_wordlist(workbook, sheet_name, lang1_col, lang2_col,
+                                                                remarks_col, learning_status_col, max_rows)
+                                   for sheet_name in workbook.sheetnames])
+
+
+def _valid_word_collection(word_lists: List[WordList]) -> WordCollection:
+    """
+    Create the word collection from the word lists that have at least 5 flashcards
+    """
     wordlist_book = {}
-    for sheet_name in workbook.sheetnames:
-        wordlist_frame = _excel_worksheet_to_wordlist(workbook, sheet_name, lang1_col, lang2_col,
-                                                      remarks_col, learning_status_col)
+    for wordlist_frame in word_lists:
         if len(wordlist_frame.flashcards) >= 5:
-            wordlist_book[sheet_name] = wordlist_frame
+            wordlist_book[wordlist_frame.name] = wordlist_frame
     if len(wordlist_book) == 0:
         raise NoValidWordListsError("The selected file doesn't contain any valid word lists.")
     return WordCollection(
@@ -79,28 +469,38 @@ def _excel_wb_to_word_collection(workbook, lang1_col, lang2_col,
 
 
 def _excel_worksheet_to_wordlist(workbook, sheet_name, lang1_col, lang2_col, remarks_col,
-                                 learning_status_col) -> WordList:
+                                 learning_status_col, max_rows=MAX_ROWS) -> WordList:
     """
-    Create a WordList object from a worksheet
+    Create a WordList object from a worksheet, reading its rows as tuples of cell values
     """
-    flashcards: Dict[int, Flashcard] = {}
+    worksheet = workbook[sheet_name]
 
     # Avoiding overly large word lists
-    if workbook[sheet_name].max_row > 10000:
-        raise ValueError("Error: number of rows > 10000")
+    # (the dimensions of the sheet may be unknown in read-only mode, the rows are counted as well)
+    if max_rows is not None and worksheet.max_row is not None and worksheet.max_row > max_rows:
+        raise ValueError(f"Error: number of rows > {max_rows}")
+
+    rows = worksheet.iter_rows(min_row=1, max_col=max(lang1_col, lang2_col, remarks_col, learning_status_col),
+                               values_only=True)
 
     # First line is for language information
-    lang1 = workbook[sheet_name].cell(row=1, column=lang1_col).value
-    lang2 = workbook[sheet_name].cell(row=1, column=lang2_col).value
+    header = next(rows, None)
+    lang1 = header[lang1_col-1] if header is not None else None
+    lang2 = header[lang2_col-1] if header is not None else None
+    # The rows are appended to the columns one by one, before they're given to the word list
+    flashcards = _FlashcardColumns()
 
     # Getting information from all the rows one by one
-    for row in range(2, workbook[sheet_name].max_row+1):
+    for row, values in enumerate(rows, start=2):
+        if max_rows is not None and row > max_rows:
+            raise ValueError(f"Error: number of rows > {max_rows}")
+
         # Loading the proper cells to the function
-        lang1_word = workbook[sheet_name].cell(row=row, column=lang1_col).value
-        lang2_word = workbook[sheet_name].cell(row=row, column=lang2_col).value
-        remarks = workbook[sheet_name].cell(row=row, column=remarks_col).value
+        lang1_word = values[lang1_col-1]
+        lang2_word = values[lang2_col-1]
+        remarks = values[remarks_col-1]
         # Using learning status if there's a number between 0 and 1 in that column
-        learning_status = workbook[sheet_name].cell(row=row, column=learning_status_col).value
+        learning_status = values[learning_status_col-1]
 
         # Checking the content of the selected cells
         # Language cells must be filled in
@@ -124,6 +524,11 @@ def _excel_worksheet_to_wordlist(workbook, sheet_name, lang1_col, lang2_col, rem
 def _word_collection_to_wb(workbook, word_list: WordList, columns):
 
     vocab_name = word_list.name
+    # First line is for language information
+    if 1 not in word_list.flashcards:
+        workbook[vocab_name].cell(row=1, column=LANG1_COL).value = word_list.lang1
+        workbook[vocab_name].cell(row=1, column=LANG2_COL).value = word_list.lang2
+
     for row, flashcard in word_list.flashcards.items():
         # Iterate through rows in a worksheet
         workbook[vocab_name].cell(row=row, column=LANG1_COL).value = flashcard.lang1
@@ -132,6 +537,37 @@ def _word_collection_to_wb(workbook, word_list: WordList, columns):
         workbook[vocab_name].cell(row=row, column=LEARNING_STATUS_COL).value = flashcard.learning_status
 
 
+def _word_list_to_ws_rows(worksheet, word_list: WordList, columns):
+    """
+    Append the rows of a word list to a write-only worksheet in the order of the row keys
+    """
+    row_length = max(columns.values())
+
+    # First line is for language information
+    next_row = 1
+    if 1 not in word_list.flashcards:
+        header = [None] * row_length
+        header[columns["lang1"]-1] = word_list.lang1
+        header[columns["lang2"]-1] = word_list.lang2
+        worksheet.append(header)
+        next_row = 2
+
+    for row in sorted(word_list.flashcards.keys()):
+        # Rows can only be appended, the skipped rows are filled with empty rows
+        while next_row < row:
+            worksheet.append([])
+            next_row += 1
+
+        flashcard = word_list.flashcards[row]
+        values = [None] * row_length
+        values[columns["lang1"]-1] = flashcard.lang1
+        values[columns["lang2"]-1] = flashcard.lang2
+        values[columns["remarks"]-1] = flashcard.remarks
+        values[columns["learning status"]-1] = flashcard.learning_status
+        worksheet.append(values)
+        next_row += 1
+
+
 def save_string(file_path, data):
     with open(file_path, mode='w+') as f:
         f.write(data)
@@ -0,0 +1,72 @@
+"""
+Worker processes computing the shortlists of the alternatives, so that the CPU-bound scoring of the questions of a
+quiz runs in parallel instead of under the GIL of one process.
+
+The word pool is sent to every worker once, when the worker starts, and every worker builds its own similarity
+index from it. Only the expressions and the shortlists are sent afterwards.
+"""
+
+import multiprocessing
+from typing import List
+
+from .similarityindex import SimilarityIndex
+
+# Index of the word pool in a worker process, built by _init_worker
+_worker_index: SimilarityIndex = None
+
+
+def _init_worker(pool: List[str]):
+    global _worker_index
+    _worker_index = SimilarityIndex(pool)
+
+
+def _worker_shortlists(expressions: List[str], shortlist_count: int) -> List[List[str]]:
+    return [_worker_index.shortlist(expression, shortlist_count) for expression in expressions]
+
+
+class DistractorWorkers:
+    """
+    Process pool computing the shortlists of one word pool at a time (see stateless.Vocabulary).
+    The shortlists don't depend on how the expressions are split between the workers, the distractors are picked
+    from them with the random generator of the Vocabulary.
+    """
+
+    def __init__(self, max_workers: int = None):
+        """
+        :param max_workers: number of worker processes, the number of CPUs by default
+        """
+        self.max_workers = max_workers if max_workers is not None else multiprocessing.cpu_count()
+        self.pool_version = None
+        self._process_pool = None
+
+    def start(self, pool: List[str], pool_version):
+        """
+        Start the workers for the given word pool, unless they're already running with the same version of it
+        """
+        if self._process_pool is not None and self.pool_version == pool_version:
+            return
+        self.close()
+        self._process_pool = multiprocessing.Pool(self.max_workers, initializer=_init_worker, initargs=(pool,))
+        self.pool_version = pool_version
+
+    def shortlist_many(self, expressions: List[str], shortlist_count: int) -> List[List[str]]:
+        """
+        Find the shortlist_count most similar expressions of the word pool for every expression
+        :return: the shortlists in the order of expressions
+        """
+        if self._process_pool is None:
+            raise RuntimeError("The workers aren't started")
+        chunk_size = -(-len(expressions) // self.max_workers)
+        chunks = [expressions[start:start + chunk_size] for start in range(0, len(expressions), chunk_size)]
+        results = self._process_pool.starmap(_worker_shortlists, [(chunk, shortlist_count) for chunk in chunks])
+        return [shortlist for chunk_shortlists in results for shortlist in chunk_shortlists]
+
+    def close(self):
+        """
+        Stop the worker processes
+        """
+        if self._process_pool is not None:
+            self._process_pool.terminate()
+            self._process_pool.join()
+            self._process_pool = None
+            self.pool_version = None
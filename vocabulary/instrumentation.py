@@ -0,0 +1,155 @@
+"""
+Instrumentation hooks of the hot paths: timers, counters and observed values (e. g. pool sizes).
+
+The default hooks do nothing, set a Metrics object with set_instrumentation to collect the metrics:
+    metrics = Metrics()
+    set_instrumentation(metrics)
+    ...
+    print(metrics.prometheus_text())
+
+Metrics used by the library:
+    timers: load, choice_quiz, pick_rows, build_quiz, most_similar, calc_similarity, update_progress
+    counters: shortlist_cache_hits, shortlist_cache_misses, calc_similarity (number of compared expressions)
+    observed values: pool_size, candidate_count (expressions scored for a shortlist, by most_similar without an
+        index or by the index: SimilarityIndex, BatchScorer, LengthBuckets, MinHashIndex)
+"""
+
+import threading
+import time
+from typing import Callable, Dict
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class Instrumentation:
+    """
+    Hooks that do nothing, the base class of the other hooks
+    """
+    enabled = False
+
+    def timer(self, name: str):
+        """
+        Context manager measuring the time of the block
+        """
+        return _NULL_TIMER
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def observe(self, name: str, value: float):
+        pass
+
+
+class _Timer:
+    __slots__ = ("_metrics", "_name", "_start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._metrics.observe_time(self._name, time.perf_counter() - self._start)
+        return False
+
+
+class Metrics(Instrumentation):
+    """
+    Hooks collecting the metrics in memory. Every event is also passed to the callback if it's given.
+    """
+    enabled = True
+
+    def __init__(self, callback: Callable[[str, str, float], None] = None, prefix: str = "vocabulary"):
+        """
+        :param callback: called with the kind of the event ("timer", "counter" or "value"), the name and the value
+        :param prefix: prefix of the metric names in the exported text
+        """
+        self.callback = callback
+        self.prefix = prefix
+        # Name -> [count, sum]
+        self.timers: Dict[str, list] = {}
+        self.values: Dict[str, list] = {}
+        # Name -> total
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def timer(self, name: str):
+        return _Timer(self, name)
+
+    def observe_time(self, name: str, seconds: float):
+        self._add(self.timers, name, seconds)
+        if self.callback is not None:
+            self.callback("timer", name, seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        if self.callback is not None:
+            self.callback("counter", name, value)
+
+    def observe(self, name: str, value: float):
+        self._add(self.values, name, value)
+        if self.callback is not None:
+            self.callback("value", name, value)
+
+    def reset(self):
+        with self._lock:
+            self.timers.clear()
+            self.values.clear()
+            self.counters.clear()
+
+    def prometheus_text(self) -> str:
+        """
+        Export the metrics in the Prometheus text format:
+        the timers and the observed values as summaries (count and sum), the counters as counters
+        """
+        lines = []
+        with self._lock:
+            for name, (count, total) in sorted(self.timers.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.extend([f"# TYPE {metric} summary", f"{metric}_count {count}", f"{metric}_sum {total!r}"])
+            for name, (count, total) in sorted(self.values.items()):
+                metric = f"{self.prefix}_{name}"
+                lines.extend([f"# TYPE {metric} summary", f"{metric}_count {count}", f"{metric}_sum {total!r}"])
+            for name, total in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                lines.extend([f"# TYPE {metric} counter", f"{metric} {total!r}"])
+        return "\n".join(lines) + "\n"
+
+    def _add(self, summaries: Dict[str, list], name: str, value: float):
+        with self._lock:
+            summary = summaries.get(name)
+            if summary is None:
+                summaries[name] = [1, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Instrumentation = None):
+    """
+    Set the hooks used by the library, the hooks that do nothing are restored if it's None
+    """
+    global _instrumentation
+    _instrumentation = instrumentation if instrumentation is not None else Instrumentation()
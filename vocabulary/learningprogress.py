@@ -55,6 +55,7 @@ __docformat__ = 'reStructuredText'
 import logging
 from typing import Dict, Callable, List
 import random
+from .models import LearningProgress
 
 # Constants for the groups
 QUEUE = 0
@@ -77,38 +78,57 @@ class Progress:
 
 DEFAULT_LEARNING_STATUS = FLASHCARD
 
+# The groups pick_word picks from and the statuses of their rows
+_PICKED_GROUP_STATUSES = {FLASHCARD: (FLASHCARD,), ACTIVE1: (ACTIVE1, ACTIVE2), RECENT1: (RECENT1, RECENT2),
+                          LEARNED: (LEARNED,)}
+
 _CHANGEMAP_CORRECT = {Progress.NEW: Progress.RECENT, Progress.RECENT: Progress.LEARNED,
                       Progress.LEARNED: Progress.LEARNED}
 _CHANGEMAP_INCORRECT = {Progress.NEW: Progress.NEW, Progress.RECENT: Progress.NEW,
                         Progress.LEARNED: Progress.RECENT}
 
 
-def pick_word(learning_progress_dict: Dict[int, str], active_limit: int, recent_limit: int) -> (Dict[int, str], int):
+def pick_word(learning_progress_dict: Dict[int, str], active_limit: int, recent_limit: int,
+              rng: random.Random = None) -> (Dict[int, str], int):
     """Pick a random word based on current learning status
+    A LearningProgress is validated in place and its status index is used for picking,
+    otherwise a new learning progress dictionary is created.
+    :param rng: random generator of the picking, the one of the random module by default
     :return: new learning progress dictionary, key of the picked word
     """
-
-    progress_dict_mod = _fill_groups2(
-        _validate(learning_progress_dict),
-        None,
-        active_limit,
-        recent_limit
-    )
-    # word_dict = _set_learning_status_dict(word_dict, progress_dict_mod)
-
-    # Word that's being actively learned,
-    # recently learned word or revise a learned word
-    # Words from the not seen group are automatically moved to the being actively learned group
-    sc = _group_status(progress_dict_mod)
-    # At first, the same word in the active group should be asked 10% of the times
-    # In the recently learned group, it should be about 1%
-    # The recently learned group is in essence a dynamically changing "buffer"
-    # Its size can be influenced only in an indirect way, by setting probabilities
-    queue_rows = sc.get(QUEUE, [])
-    flashcard_rows = sc.get(FLASHCARD, [])
-    active_rows = sc.get(ACTIVE1, []) + sc.get(ACTIVE2, [])
-    recent_rows = sc.get(RECENT1, []) + sc.get(RECENT2, [])
-    learned_rows = sc.get(LEARNED, [])
+    rng = _random(rng)
+
+    if isinstance(learning_progress_dict, LearningProgress):
+        progress_dict_mod = _validate_in_place(learning_progress_dict)
+        # Only the sizes of the groups are needed, the row is picked from the status index
+        group_rows = None
+        group_sizes = {group: sum(progress_dict_mod.count_with_status(status) for status in statuses)
+                       for group, statuses in _PICKED_GROUP_STATUSES.items()}
+    else:
+        progress_dict_mod = _fill_groups2(
+            _validate(learning_progress_dict),
+            None,
+            active_limit,
+            recent_limit,
+            rng
+        )
+        # word_dict = _set_learning_status_dict(word_dict, progress_dict_mod)
+
+        # Word that's being actively learned,
+        # recently learned word or revise a learned word
+        # Words from the not seen group are automatically moved to the being actively learned group
+        sc = _group_status(progress_dict_mod, rng)
+        # At first, the same word in the active group should be asked 10% of the times
+        # In the recently learned group, it should be about 1%
+        # The recently learned group is in essence a dynamically changing "buffer"
+        # Its size can be influenced only in an indirect way, by setting probabilities
+        queue_rows = sc.get(QUEUE, [])
+        flashcard_rows = sc.get(FLASHCARD, [])
+        active_rows = sc.get(ACTIVE1, []) + sc.get(ACTIVE2, [])
+        recent_rows = sc.get(RECENT1, []) + sc.get(RECENT2, [])
+        learned_rows = sc.get(LEARNED, [])
+        group_rows = {FLASHCARD: flashcard_rows, ACTIVE1: active_rows, RECENT1: recent_rows, LEARNED: learned_rows}
+        group_sizes = {group: len(rows) for group, rows in group_rows.items()}
 
     # Deciding what kind of question should be shown to the user
     # A new word? A recently learned one?
@@ -117,35 +137,29 @@ def pick_word(learning_progress_dict: Dict[int, str], active_limit: int, recent_
     # adding one group several times.
     hat = []
 
-    if len(flashcard_rows) > 0:
+    if group_sizes[FLASHCARD] > 0:
         hat.extend([FLASHCARD, FLASHCARD])
 
-    if len(active_rows) > 0:
+    if group_sizes[ACTIVE1] > 0:
         hat.extend([ACTIVE1, ACTIVE1])
 
-    if len(recent_rows) > 0:
+    if group_sizes[RECENT1] > 0:
         hat.extend([RECENT1, RECENT1])
 
-    if len(learned_rows) > 10:
+    if group_sizes[LEARNED] > 10:
         hat.extend([LEARNED])
 
     # Drawing
-    chosen_group = random.choice(hat)
-
-    if chosen_group == FLASHCARD:
-        selected_key = random.choice(flashcard_rows)
-        logging.debug("Flashcard group - picked {} from {}".format(selected_key, flashcard_rows))
-    elif chosen_group == ACTIVE1:
-        selected_key = random.choice(active_rows)
-        logging.debug("Active group - picked {} from {}".format(selected_key, active_rows))
-    elif chosen_group == RECENT1:
-        selected_key = random.choice(recent_rows)
-        logging.debug("Recent group - picked {} from {}".format(selected_key, active_rows))
-    elif chosen_group == LEARNED:
-        selected_key = random.choice(learned_rows)
-        logging.debug("Learned group - picked {} from {}".format(selected_key, active_rows))
-    else:
+    chosen_group = rng.choice(hat)
+
+    if chosen_group not in _PICKED_GROUP_STATUSES:
         raise Exception(f"Drawing hat has an unexpected value during picking questions: {hat}")
+    if group_rows is None:
+        selected_key = _choice_with_status(progress_dict_mod, _PICKED_GROUP_STATUSES[chosen_group],
+                                           group_sizes[chosen_group], rng)
+    else:
+        selected_key = rng.choice(group_rows[chosen_group])
+    logging.debug("Group %s - picked %s", chosen_group, selected_key)
 
     show_flashcard = (chosen_group == FLASHCARD)
     return progress_dict_mod, selected_key, show_flashcard
@@ -153,12 +167,12 @@ def pick_word(learning_progress_dict: Dict[int, str], active_limit: int, recent_
 
 def pick_words(learning_progress_dict: Dict[int, str],
                filter_by_progress: Callable[[str], bool],
-               order: str, max_count_from_size: Callable[[int], int]) -> List[int]:
+               order: str, max_count_from_size: Callable[[int], int], rng: random.Random = None) -> List[int]:
 
     filtered_row_ids: List[int] = _get_row_ids(learning_progress_dict, filter_by_progress)
 
     if order == PickOrder.SHUFFLED:
-        random.shuffle(filtered_row_ids)
+        _random(rng).shuffle(filtered_row_ids)
     elif order == PickOrder.ORIGINAL:
         pass
     else:
@@ -167,6 +181,28 @@ def pick_words(learning_progress_dict: Dict[int, str],
     return filtered_row_ids[0:min(len(filtered_row_ids), max_count_from_size(len(filtered_row_ids)))]
 
 
+def pick_words_with_status(learning_progress: LearningProgress, learning_status,
+                           order: str, max_count_from_size: Callable[[int], int],
+                           rng: random.Random = None) -> List[int]:
+    """Same as pick_words for a single learning status, but the rows are taken from the status index
+    of learning_progress instead of filtering every row.
+    """
+    size = learning_progress.count_with_status(learning_status)
+    count = min(size, max_count_from_size(size))
+
+    if order == PickOrder.SHUFFLED:
+        return learning_progress.sample_rows_with_status(learning_status, count, _random(rng))
+    elif order == PickOrder.ORIGINAL:
+        return learning_progress.first_rows_with_status(learning_status, count)
+    else:
+        raise Exception(f"Incorrect directive for order: {order}")
+
+
+def _random(rng: random.Random):
+    """The given random generator, or the random module if it's None (it has the same methods)"""
+    return rng if rng is not None else random
+
+
 def _get_row_ids(learning_progress_dict: Dict[int, str],
                  filter_fcn: Callable[[str], bool]) -> List[int]:
     return [k for k, v in learning_progress_dict.items() if filter_fcn(v)]
@@ -207,21 +243,52 @@ def calculate_learning_progress(learning_status_dict: Dict[int, str]) -> float:
     :return:
 
     """
-    all_count = len(_get_row_ids(learning_status_dict, lambda group: True))
-    recent_count = len(_get_row_ids(learning_status_dict, lambda group: group == Progress.RECENT))
-    learned_count = len(_get_row_ids(learning_status_dict, lambda group: group == Progress.LEARNED))
+    if isinstance(learning_status_dict, LearningProgress):
+        all_count = len(learning_status_dict)
+        recent_count = learning_status_dict.count_with_status(Progress.RECENT)
+        learned_count = learning_status_dict.count_with_status(Progress.LEARNED)
+    else:
+        all_count = len(_get_row_ids(learning_status_dict, lambda group: True))
+        recent_count = len(_get_row_ids(learning_status_dict, lambda group: group == Progress.RECENT))
+        learned_count = len(_get_row_ids(learning_status_dict, lambda group: group == Progress.LEARNED))
 
     return (1*learned_count + 0.5*recent_count)/float(all_count)
 
 
 def reset_progress(learning_status_dict: Dict[int, str]):
-    return {row: Progress.NEW for row, value in learning_status_dict.items()}
+    """Reset the learning status of every row in place.
+    :return: the reset learning status dictionary
+    """
+    for row in learning_status_dict.keys():
+        learning_status_dict[row] = Progress.NEW
+    return learning_status_dict
 
 
 def _validate(learning_progress: Dict[int, str]):
     return {key: _validate_learning_status(status) for key, status in learning_progress.items()}
 
 
+def _validate_in_place(learning_progress: LearningProgress):
+    """Validate only the rows whose learning status isn't valid, they are found with the status index
+    """
+    for status in learning_progress.statuses():
+        if type(status) is not int or _validate_learning_status(status) != status:
+            for row in list(learning_progress.rows_with_status(status)):
+                learning_progress[row] = _validate_learning_status(status)
+    return learning_progress
+
+
+def _choice_with_status(learning_progress: LearningProgress, statuses, size: int, rng) -> int:
+    """Pick a random row having any of the statuses, size is the number of these rows"""
+    position = rng.randrange(size)
+    for status in statuses:
+        count = learning_progress.count_with_status(status)
+        if position < count:
+            return learning_progress.sample_rows_with_status(status, 1, rng)[0]
+        position -= count
+    raise ValueError("size is larger than the number of rows having the statuses")
+
+
 def _validate_learning_status(learning_status, raise_exc=False):
     """Validate the learning progress field, return default if not defined or invalid.
     It needs to be executed only once, after importing the rows from an editable file.
@@ -252,12 +319,13 @@ def _validate_learning_status(learning_status, raise_exc=False):
         return learning_status
 
 
-def _group_status(learning_status_dict):
+def _group_status(learning_status_dict, rng: random.Random = None):
     """Divide the row ids in status_list to groups based on learning status
     and shuffle the list elements so that when elements are chosen from the lists,
     then simply the first element can be chosen as a random element, it'll not be ordered)
 
     :param learning_status_dict:
+    :param rng: random generator of the shuffling, the one of the random module by default
     :return: {status1: [id1, id2, id3], status2: [id4, id5, id6]}
 
     """
@@ -266,8 +334,9 @@ def _group_status(learning_status_dict):
         # Append row id to an existing list or create a new list
         # if this status appears for the first time
         groups.setdefault(status, []).append(rowkey)
+    rng = _random(rng)
     for status in groups.keys():
-        random.shuffle(groups[status])
+        rng.shuffle(groups[status])
     return groups
 
 
@@ -283,19 +352,20 @@ def _get_learning_groups_size(learning_status_dict):
     return {key: len(val) for key, val in learning_status_dict.items()}
 
 
-def _fill_groups(status_dict, progress_marks, active_limit, recent_limit):
+def _fill_groups(status_dict, progress_marks, active_limit, recent_limit, rng: random.Random = None):
     """Regroup rows so that certain groups contain the specified number of items.
 
     :param status_dict:
     :param progress_marks:
     :param active_limit:
     :param recent_limit:
+    :param rng: random generator of the grouping
     :return: Move map {row_id: new_group} (??)
 
     """
 
     # Group rows
-    groups = _group_status(status_dict)
+    groups = _group_status(status_dict, rng)
 
     # Check group counts
     def active_size(_groups):
@@ -344,11 +414,11 @@ def _fill_groups(status_dict, progress_marks, active_limit, recent_limit):
     return learning_status_mod
 
 
-def _fill_groups2(status_dict, progress_marks, flashcard_limit, recent_limit):
+def _fill_groups2(status_dict, progress_marks, flashcard_limit, recent_limit, rng: random.Random = None):
     """Regroup rows so that certain groups contain the specified number of items."""
 
     # Group rows
-    groups = _group_status(status_dict)
+    groups = _group_status(status_dict, rng)
 
     # Check group counts
     def flashcard_size(_groups):
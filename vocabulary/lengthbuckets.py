@@ -0,0 +1,80 @@
+"""
+Alternative pool bucketed by character count, word count and special characters, for finding the expressions that
+are the most similar to the correct answer without scoring the whole pool.
+
+The length terms of alternatives.calc_similarity only depend on the bucket, and the n-gram term can't be higher than
+(shorter n-gram count) / (longer n-gram count). The buckets are scanned in decreasing order of this upper bound of
+their scores, and the scan stops when no remaining bucket can get into the shortlist. The shortlist has the same
+scores as the one of scoring the whole pool.
+
+It's only used directly (alternatives.most_similar(..., index=LengthBuckets(pool))): the word pools of the Vocabulary
+classes always have a SimilarityIndex, which finds the same shortlists faster. The buckets are meant for the pools
+whose inverted n-gram index would take too much memory, they only store the pool once more.
+"""
+
+from heapq import heappush, heappushpop
+from typing import Dict, List
+
+from .alternatives import calc_similarity
+from .instrumentation import get_instrumentation
+from .similarityindex import _features, _length_terms, _score, _unique
+
+# The bounds are compared with scores calculated in a different order of floating point operations
+_BOUND_TOLERANCE = 1e-9
+
+
+def _score_bound(expr_features, bucket_features) -> float:
+    """Upper bound of the calc_similarity score of the expressions of a bucket"""
+    # The padded expressions have (character count + 2) n-grams, at most all the n-grams of the shorter one are shared
+    shorter, longer = sorted((expr_features[0], bucket_features[0]))
+    return _score((shorter + 2) / (longer + 2), _length_terms(expr_features, bucket_features)) + _BOUND_TOLERANCE
+
+
+class LengthBuckets:
+    """
+    Pool of expressions grouped by their length features, with the same interface as SimilarityIndex.
+    It only stores the pool once more, so it's cheap to build and to keep.
+    """
+
+    def __init__(self, pool: List[str]):
+        self.words: List[str] = _unique(pool)
+        self._buckets: Dict[tuple, List[str]] = {}
+        for word in self.words:
+            self._buckets.setdefault(_features(str(word)), []).append(word)
+
+    def __len__(self):
+        return len(self.words)
+
+    def shortlist(self, expression: str, shortlist_count: int) -> List[str]:
+        """
+        Find the shortlist_count expressions of the pool that are the most similar to expression
+        :param expression: correct answer, it's never part of the shortlist
+        :param shortlist_count:
+        :return: expressions in decreasing order of similarity
+        """
+        if shortlist_count <= 0:
+            return []
+        expr_features = _features(str(expression))
+        bounds = sorted(((_score_bound(expr_features, features), features) for features in self._buckets),
+                        key=lambda v: v[0], reverse=True)
+
+        # Min-heap of the best (score, position, expression) so far, the position breaks the ties
+        best = []
+        position = 0
+        candidate_count = 0
+        for bound, features in bounds:
+            if len(best) == shortlist_count and bound < best[0][0]:
+                break
+            bucket = [word for word in self._buckets[features] if word != expression]
+            candidate_count += len(bucket)
+            for word, score in zip(bucket, calc_similarity(expression, bucket)):
+                position -= 1
+                if len(best) < shortlist_count:
+                    heappush(best, (score, position, word))
+                elif score > best[0][0]:
+                    heappushpop(best, (score, position, word))
+
+        instrumentation = get_instrumentation()
+        if instrumentation.enabled:
+            instrumentation.observe("candidate_count", candidate_count)
+        return [word for score, position, word in sorted(best, reverse=True)]
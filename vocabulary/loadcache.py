@@ -0,0 +1,150 @@
+"""
+On-disk cache of the word lists parsed from an Excel workbook.
+
+The cache of a workbook is reused as a whole if the content of the workbook is the same (SHA-256 and size),
+otherwise the worksheets whose parts in the Excel file didn't change are taken from the cache and only the others
+are parsed. The parts shared by the worksheets (shared strings, styles) are part of the key of every worksheet,
+so changing them causes every worksheet to be parsed again.
+
+Only the parsing is cached: the word pools and their similarity index are built by the pool registry when the word
+collection is used (stateless.Vocabulary.load), which takes about as long as reading them from a file would.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import zipfile
+from typing import Dict
+
+from .dataaccess import MAX_ROWS, PROGRESS_FILE_SUFFIX, LANG1_COL, LANG2_COL, REMARKS_COL, LEARNING_STATUS_COL
+from .dataaccess import _excel_worksheet_to_wordlist, _load_workbook_by_path, _merge_learning_progress, \
+    _valid_word_collection, _worksheet_parts
+from .models import WordCollection, WordList
+from .snapshot import SnapshotFormatError, _replace_file, word_collection_from_snapshot, word_collection_to_snapshot
+
+CACHE_VERSION = 3
+
+# Parts of the Excel file that the content of every worksheet depends on
+_SHARED_PARTS = ("xl/sharedStrings.xml", "xl/styles.xml")
+
+
+class _CachePaths:
+    """Files of the cache of a workbook"""
+
+    def __init__(self, wb_path: str, cache_dir: str = None):
+        wb_path = os.path.abspath(wb_path)
+        directory = cache_dir if cache_dir is not None else os.path.dirname(wb_path)
+        # Workbooks with the same name in different directories can share the cache directory
+        path_hash = hashlib.sha1(wb_path.encode("utf-8")).hexdigest()[:12]
+        prefix = os.path.join(directory, f"{os.path.basename(wb_path)}-{path_hash}.cache")
+        self.metadata = prefix + ".json"
+        self.word_lists = prefix + ".snapshot"
+
+
+def load_wordlist_book_cached(wb_path: str, cache_dir: str = None, max_rows: int = MAX_ROWS) -> WordCollection:
+    """
+    Load the wordlist_book dictionary from an Excel file, reusing the cache of the earlier loads.
+    :param wb_path: Path of Excel file
+    :param cache_dir: Directory of the cache files, the directory of the workbook by default
+    :param max_rows: Maximum number of rows in a worksheet, None for no limit
+    """
+    paths = _CachePaths(wb_path, cache_dir)
+
+    with open(wb_path, "rb") as f:
+        content = f.read()
+    file_key = {"size": len(content), "sha256": hashlib.sha256(content).hexdigest(), "max_rows": max_rows}
+    metadata = _read_metadata(paths)
+    word_lists = _read_cached_word_lists(paths) if file_key == metadata.get("file") else None
+    if word_lists is None:
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            sheet_keys = _sheet_keys(archive, max_rows)
+        word_lists = _parse_missing_worksheets(wb_path, list(sheet_keys.keys()),
+                                               _reuse_word_lists(paths, metadata, sheet_keys), max_rows)
+        _write_cache(paths, WordCollection("lang1_placeholder", "lang2_placeholder", word_lists),
+                     {"version": CACHE_VERSION, "file": file_key, "sheets": sheet_keys})
+
+    wordlist_book = _valid_word_collection(list(word_lists.values()))
+    wordlist_book.source_path = wb_path
+    _merge_learning_progress(wb_path + PROGRESS_FILE_SUFFIX, wordlist_book)
+    return wordlist_book
+
+
+def _sheet_keys(archive: zipfile.ZipFile, max_rows: int) -> Dict[str, list]:
+    """
+    The key of every worksheet in the order of the worksheets:
+    CRC-32 and size of the worksheet part and of the shared parts, and the row limit
+    """
+    shared = []
+    for part in _SHARED_PARTS:
+        try:
+            info = archive.getinfo(part)
+            shared.append([info.CRC, info.file_size])
+        except KeyError:
+            shared.append(None)
+    keys = {}
+    for sheet_name, part in _worksheet_parts(archive).items():
+        info = archive.getinfo(part)
+        keys[sheet_name] = [info.CRC, info.file_size, shared, max_rows]
+    return keys
+
+
+def _read_metadata(paths: _CachePaths) -> dict:
+    try:
+        with open(paths.metadata, mode="r", encoding="utf-8") as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return metadata if isinstance(metadata, dict) and metadata.get("version") == CACHE_VERSION else {}
+
+
+def _read_cached_word_lists(paths: _CachePaths) -> Dict[str, WordList]:
+    """All the word lists parsed from the cached version of the workbook, or None if the cache can't be read"""
+    try:
+        return dict(word_collection_from_snapshot(paths.word_lists).word_lists)
+    except (OSError, SnapshotFormatError) as e:
+        logging.warning("Ignoring the cache {}: {}".format(paths.word_lists, e))
+        return None
+
+
+def _reuse_word_lists(paths: _CachePaths, metadata: dict, sheet_keys: Dict[str, list]) -> Dict[str, WordList]:
+    """The cached word lists of the worksheets whose key didn't change"""
+    cached_keys = metadata.get("sheets", {})
+    reusable = [sheet_name for sheet_name, key in sheet_keys.items() if cached_keys.get(sheet_name) == key]
+    if len(reusable) == 0:
+        return {}
+    cached = _read_cached_word_lists(paths) or {}
+    return {sheet_name: cached[sheet_name] for sheet_name in reusable if sheet_name in cached}
+
+
+def _parse_missing_worksheets(wb_path: str, sheet_names, word_lists: Dict[str, WordList],
+                              max_rows: int) -> Dict[str, WordList]:
+    """
+    Parse the worksheets that aren't in word_lists
+    :return: the word lists of all the worksheets in the order of the worksheets
+    """
+    missing = [sheet_name for sheet_name in sheet_names if sheet_name not in word_lists]
+    if len(missing) > 0:
+        workbook = _load_workbook_by_path(wb_path)
+        try:
+            for sheet_name in missing:
+                word_lists[sheet_name] = _excel_worksheet_to_wordlist(workbook, sheet_name, LANG1_COL, LANG2_COL,
+                                                                      REMARKS_COL, LEARNING_STATUS_COL, max_rows)
+        finally:
+            workbook.close()
+    return {sheet_name: word_lists[sheet_name] for sheet_name in sheet_names}
+
+
+def _write_cache(paths: _CachePaths, word_collection: WordCollection, metadata: dict):
+    # Failing to write the cache doesn't fail the load
+    try:
+        os.makedirs(os.path.dirname(paths.metadata), exist_ok=True)
+        # Without metadata the word lists aren't used, even if writing them is interrupted
+        if os.path.exists(paths.metadata):
+            os.remove(paths.metadata)
+        word_collection_to_snapshot(paths.word_lists, word_collection)
+        _replace_file(paths.metadata, [json.dumps(metadata).encode("utf-8")])
+    except (OSError, ValueError) as e:
+        logging.warning("Couldn't write the cache {}: {}".format(paths.metadata, e))
+
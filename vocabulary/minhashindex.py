@@ -0,0 +1,171 @@
+"""
+Approximate index of the alternative pool for very large pools: MinHash signatures of the n-gram sets of the
+expressions with locality-sensitive hashing (LSH) buckets.
+
+The expressions that share buckets with the correct answer are likely to share many n-grams with it. The ones
+sharing the most buckets are re-ranked with the scoring formula of alternatives.calc_similarity, together with the
+expressions whose length terms are the highest (these score high even without shared n-grams). The shortlist is
+usually the same as the exact one, but expressions may be missed, see the recall test of the index.
+"""
+
+import zlib
+from collections import Counter
+from heapq import nlargest
+from typing import Dict, List
+
+import numpy as np
+from ngram import NGram
+
+from .batchscoring import _feature_arrays, _length_term_arrays
+from .instrumentation import get_instrumentation
+from .similarityindex import _features, _length_terms, _ngram_term, _score, _unique
+
+_SPLITTER = NGram()
+
+# Mersenne prime of the hash functions (a * x + b) mod _PRIME, the products fit in 64 bits
+_PRIME = (1 << 31) - 1
+
+# Default number of hash functions, bands, expressions re-ranked per query and size of the buckets used
+PERMUTATION_COUNT = 32
+BAND_COUNT = 32
+CANDIDATE_COUNT = 200
+MAX_BUCKET_SIZE = 5000
+
+
+def _gram_hashes(expression: str) -> np.ndarray:
+    """Hashes of the distinct n-grams of the expression, they don't depend on the process (unlike hash)"""
+    grams = set(_SPLITTER.split(expression))
+    return np.array([zlib.crc32(gram.encode("utf-8")) & _PRIME for gram in grams] or [0], dtype=np.uint64)
+
+
+class MinHashIndex:
+    """
+    MinHash LSH index of a pool of expressions, with the same interface as SimilarityIndex.
+    Build it once per pool and use it for every question.
+    """
+
+    def __init__(self, pool: List[str], permutation_count: int = PERMUTATION_COUNT, band_count: int = BAND_COUNT,
+                 candidate_count: int = CANDIDATE_COUNT, max_bucket_size: int = MAX_BUCKET_SIZE, seed: int = 1):
+        """
+        :param permutation_count: number of hash functions, a multiple of band_count
+        :param band_count: fewer hash functions per band find more candidates (higher recall) with slower queries
+        :param candidate_count: maximum number of LSH candidates re-ranked per query
+        :param max_bucket_size: buckets with more expressions are skipped, it bounds the query time of large pools
+        :param seed: seed of the hash functions
+        """
+        if permutation_count % band_count != 0:
+            raise ValueError("permutation_count must be a multiple of band_count")
+        self.words: List[str] = _unique(pool)
+        self.candidate_count = candidate_count
+        self.max_bucket_size = max_bucket_size
+        self._band_size = permutation_count // band_count
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=permutation_count).astype(np.uint64)
+        self._b = rng.randint(0, _PRIME, size=permutation_count).astype(np.uint64)
+
+        word_strs = [str(word) for word in self.words]
+        self._groups: Dict[tuple, List[int]] = {}
+        for word_id, word_str in enumerate(word_strs):
+            self._groups.setdefault(_features(word_str), []).append(word_id)
+        self._feature_arrays = _feature_arrays(word_strs)
+
+        # Signatures of all the expressions, one hash function at a time over the concatenated n-gram hashes
+        signatures = np.empty((len(self.words), permutation_count), dtype=np.uint64)
+        if len(self.words) > 0:
+            word_hashes = [_gram_hashes(word_str) for word_str in word_strs]
+            hashes = np.concatenate(word_hashes)
+            starts = np.cumsum([0] + [len(h) for h in word_hashes[:-1]])
+            for i in range(permutation_count):
+                signatures[:, i] = np.minimum.reduceat((self._a[i] * hashes + self._b[i]) % _PRIME, starts)
+
+        # Buckets of every band: the sorted band keys and the word ids in the same order
+        self._band_keys: List[np.ndarray] = []
+        self._band_word_ids: List[np.ndarray] = []
+        for band_keys in self._band_key_columns(signatures).T:
+            order = np.argsort(band_keys, kind="stable")
+            self._band_keys.append(band_keys[order])
+            self._band_word_ids.append(order.astype(np.int32))
+
+    def __len__(self):
+        return len(self.words)
+
+    def shortlist(self, expression: str, shortlist_count: int) -> List[str]:
+        """
+        Find approximately the shortlist_count expressions of the pool that are the most similar to expression
+        :param expression: correct answer, it's never part of the shortlist
+        :param shortlist_count:
+        :return: expressions in decreasing order of similarity
+        """
+        expr = str(expression)
+        expr_features = _features(expr)
+        candidates = set(self._lsh_candidates(expr))
+
+        # The expressions with the highest length terms, they may not share any n-gram with expression
+        terms = {features: _length_terms(expr_features, features) for features in self._groups}
+        remaining = shortlist_count
+        for features in sorted(terms, key=lambda features: _score(0.0, terms[features]), reverse=True):
+            if remaining <= 0:
+                break
+            group = self._groups[features][:remaining + 1]
+            candidates.update(group)
+            remaining -= len(group)
+
+        # Re-ranking with the exact score
+        expr_grams = Counter(_SPLITTER.split(expr))
+        scored = []
+        for word_id in candidates:
+            word = self.words[word_id]
+            if word == expression:
+                continue
+            word_str = str(word)
+            features = _features(word_str)
+            # Number of shared n-grams, the size of the intersection of the Counter objects without building them
+            unmatched = dict(expr_grams)
+            samegrams = 0
+            for gram in _SPLITTER.split(word_str):
+                count = unmatched.get(gram)
+                if count:
+                    unmatched[gram] = count - 1
+                    samegrams += 1
+            scored.append((_score(_ngram_term(samegrams, expr_features, features), terms[features]), word_id))
+
+        instrumentation = get_instrumentation()
+        if instrumentation.enabled:
+            instrumentation.observe("candidate_count", len(scored))
+        return [self.words[word_id] for score, word_id in nlargest(shortlist_count, scored, key=lambda v: v[0])]
+
+    def _lsh_candidates(self, expr: str) -> np.ndarray:
+        """Ids of the expressions sharing the most LSH buckets with expr"""
+        hashes = _gram_hashes(expr)
+        signature = ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+        keys = self._band_key_columns(signature[None, :])[0]
+        matches = []
+        for band, key in enumerate(keys):
+            band_keys = self._band_keys[band]
+            start = np.searchsorted(band_keys, key, side="left")
+            end = np.searchsorted(band_keys, key, side="right")
+            # Huge buckets (e. g. n-grams at the start of many expressions) hardly tell anything about similarity
+            if end - start > self.max_bucket_size:
+                continue
+            matches.append(self._band_word_ids[band][start:end])
+        if len(matches) == 0:
+            return np.empty(0, dtype=np.int32)
+        word_ids, counts = np.unique(np.concatenate(matches), return_counts=True)
+        if len(word_ids) > self.candidate_count:
+            # Estimated score: the Jaccard similarity estimated from the shared buckets and the exact length terms
+            band_count = len(self._band_keys)
+            wordcount, charcount, specchars = _length_term_arrays(
+                _features(expr), [features[word_ids] for features in self._feature_arrays])
+            estimate = (counts / band_count) ** (1 / self._band_size) + wordcount + charcount + specchars
+            word_ids = word_ids[np.argpartition(-estimate, self.candidate_count - 1)[:self.candidate_count]]
+        return word_ids
+
+    def _band_key_columns(self, signatures: np.ndarray) -> np.ndarray:
+        """Bucket keys of the signatures (one row per signature, one column per band)"""
+        band_count = signatures.shape[1] // self._band_size
+        bands = signatures.reshape(signatures.shape[0], band_count, self._band_size)
+        keys = np.zeros((signatures.shape[0], band_count), dtype=np.uint64)
+        for i in range(self._band_size):
+            # The key of a band mixes its hash values, it wraps around at 2**64
+            keys = keys * np.uint64(0x9E3779B97F4A7C15) + bands[:, :, i]
+        return keys
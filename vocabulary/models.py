@@ -1,14 +1,45 @@
-from typing import Dict, List
+from array import array
+from bisect import bisect_left
+from collections.abc import MutableMapping
+from heapq import heappop, heappush, merge
+from itertools import islice
+import threading
+from typing import Callable, Dict, Iterator, List, Set
+
+
+def _pickled_attributes(state) -> dict:
+    """
+    Attributes of a pickled object: (__dict__, slot values) for the classes with __slots__, a plain __dict__ for the
+    objects pickled before the classes got __slots__
+    """
+    if isinstance(state, tuple):
+        dict_state, slot_state = state
+        attributes = dict(dict_state or {})
+        attributes.update(slot_state or {})
+        return attributes
+    return state
+
+
+def _set_attributes(obj, state):
+    for name, value in _pickled_attributes(state).items():
+        setattr(obj, name, value)
 
 
 class Question:
+    __slots__ = ("row_key", "text", "options")
+
     def __init__(self, row_key, text: str, options: list):
         self.row_key = row_key
         self.text = text
         self.options = options
 
+    def __setstate__(self, state):
+        _set_attributes(self, state)
+
 
 class Flashcard:
+    __slots__ = ("lang1", "lang2", "remarks", "learning_status")
+
     def __init__(self, lang1: str, lang2: str, remarks: str, learning_status: int):
         self.lang1 = lang1
         self.lang2 = lang2
@@ -21,30 +52,600 @@ class Flashcard:
         return self.lang1 == other.lang1 and self.lang2 == other.lang2 and self.remarks == other.remarks and \
             self.learning_status == other.learning_status
 
+    def __setstate__(self, state):
+        _set_attributes(self, state)
+
+
+def _column_property(column_name):
+    def getter(self):
+        return getattr(self._columns, column_name)[self._columns.position(self._row_key)]
+
+    def setter(self, value):
+        getattr(self._columns, column_name)[self._columns.position(self._row_key)] = value
+
+    return property(getter, setter)
+
+
+class _BoundFlashcard(Flashcard):
+    """
+    Flashcard that reads and writes a row of _FlashcardColumns
+    """
+    __slots__ = ("_columns", "_row_key")
+
+    def __init__(self, columns: "_FlashcardColumns", row_key: int):
+        self._columns = columns
+        self._row_key = row_key
+
+    def __reduce__(self):
+        return _BoundFlashcard, (self._columns, self._row_key)
+
+    lang1 = _column_property("lang1_values")
+    lang2 = _column_property("lang2_values")
+    remarks = _column_property("remarks_values")
+
+    @property
+    def learning_status(self):
+        return self._columns.get_status(self._row_key)
+
+    @learning_status.setter
+    def learning_status(self, learning_status):
+        self._columns.change_status(self._row_key, learning_status)
+
+
+# Learning statuses that don't fit in the status column
+_NONE_STATUS = -128
+_OTHER_STATUS = -127
+
+
+class _FlashcardColumns(MutableMapping):
+    """
+    Flashcards of a word list (row key -> Flashcard) stored column-wise: sorted row keys, references to the strings
+    and the learning statuses in a signed char array.
+    The returned flashcards are bound to their rows, changing them changes the columns.
+    The changes of the learning statuses and of the rows are tracked by the word list the columns belong to
+    (its learning progress and dirty_rows).
+    """
+    __slots__ = ("row_keys", "lang1_values", "lang2_values", "remarks_values", "status_values", "other_statuses",
+                 "word_list")
+
+    def __init__(self, flashcards: Dict[int, Flashcard] = None):
+        # Set by the word list, None while the columns are being filled in
+        self.word_list: "WordList" = None
+        self.row_keys = array("q")
+        self.lang1_values = []
+        self.lang2_values = []
+        self.remarks_values = []
+        self.status_values = array("b")
+        # Learning statuses that aren't small integers (e. g. invalid values from the workbook) by row key
+        self.other_statuses = {}
+        if flashcards:
+            for row_key in sorted(flashcards.keys()):
+                self[row_key] = flashcards[row_key]
+
+    def position(self, row_key) -> int:
+        position = bisect_left(self.row_keys, row_key)
+        if position == len(self.row_keys) or self.row_keys[position] != row_key:
+            raise KeyError(row_key)
+        return position
+
+    def get_status(self, row_key):
+        status = self.status_values[self.position(row_key)]
+        if status == _NONE_STATUS:
+            return None
+        if status == _OTHER_STATUS:
+            return self.other_statuses[row_key]
+        return status
+
+    def set_status(self, row_key, learning_status):
+        """
+        Set the learning status of a row without tracking the change, it's used by the learning progress
+        """
+        self.status_values[self.position(row_key)] = self._encode_status(row_key, learning_status)
+
+    def change_status(self, row_key, learning_status):
+        """
+        Set the learning status of a row through the learning progress of the word list
+        """
+        if self.word_list is None:
+            self.set_status(row_key, learning_status)
+        else:
+            self.word_list.learning_progress[row_key] = learning_status
+
+    def _encode_status(self, row_key, learning_status) -> int:
+        self.other_statuses.pop(row_key, None)
+        if learning_status is None:
+            return _NONE_STATUS
+        if type(learning_status) is int and _OTHER_STATUS < learning_status < 128:
+            return learning_status
+        self.other_statuses[row_key] = learning_status
+        return _OTHER_STATUS
+
+    def __getitem__(self, row_key) -> Flashcard:
+        self.position(row_key)
+        return _BoundFlashcard(self, row_key)
+
+    def __setitem__(self, row_key, flashcard: Flashcard):
+        position = bisect_left(self.row_keys, row_key)
+        if position < len(self.row_keys) and self.row_keys[position] == row_key:
+            self.lang1_values[position] = flashcard.lang1
+            self.lang2_values[position] = flashcard.lang2
+            self.remarks_values[position] = flashcard.remarks
+            self.change_status(row_key, flashcard.learning_status)
+        else:
+            status = self._encode_status(row_key, flashcard.learning_status)
+            self.row_keys.insert(position, row_key)
+            self.lang1_values.insert(position, flashcard.lang1)
+            self.lang2_values.insert(position, flashcard.lang2)
+            self.remarks_values.insert(position, flashcard.remarks)
+            self.status_values.insert(position, status)
+            if self.word_list is not None:
+                self.word_list.learning_progress.invalidate_index()
+                self.word_list.dirty_rows.add(row_key)
+
+    def __delitem__(self, row_key):
+        position = self.position(row_key)
+        for column in (self.row_keys, self.lang1_values, self.lang2_values, self.remarks_values,
+                       self.status_values):
+            del column[position]
+        self.other_statuses.pop(row_key, None)
+        if self.word_list is not None:
+            self.word_list.learning_progress.invalidate_index()
+            self.word_list.dirty_rows.discard(row_key)
+
+    def __contains__(self, row_key):
+        try:
+            self.position(row_key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.row_keys)
+
+    def __len__(self):
+        return len(self.row_keys)
+
+
+class LearningProgress(MutableMapping):
+    """
+    Learning status of the rows (row key -> learning status) that can be read and updated in place.
+    The row keys are also indexed by learning status, the index is built when it's first used
+    and it's updated on every change made through this object in O(1) (O(log n) for the statuses whose rows
+    were picked in their original order, see first_rows_with_status).
+    """
+    __slots__ = ("progress", "_groups", "_positions", "_heaps", "_sorted_heaps")
 
-class LearningProgress:
     def __init__(self, progress):
         self.progress = progress
+        # Learning status -> row keys in no particular order, row key -> position in the list of its status
+        self._groups: Dict[int, List[int]] = None
+        self._positions: Dict[int, int] = None
+        # Learning status -> min-heap of its row keys, it may also hold rows that have another status since.
+        # The heaps of the statuses whose rows didn't change since the heap was built are sorted lists.
+        self._heaps: Dict[int, List[int]] = {}
+        self._sorted_heaps: Set[int] = set()
+
+    def __getitem__(self, row_key):
+        return self.progress[row_key]
+
+    def __setitem__(self, row_key, learning_status):
+        if self._groups is not None:
+            try:
+                old_status = self.progress[row_key]
+            except KeyError:
+                self._add_to_group(learning_status, row_key)
+            else:
+                if old_status != learning_status:
+                    self._remove_from_group(old_status, row_key)
+                    self._add_to_group(learning_status, row_key)
+        self.progress[row_key] = learning_status
+
+    def __delitem__(self, row_key):
+        if self._groups is not None:
+            self._remove_from_group(self.progress[row_key], row_key)
+        del self.progress[row_key]
+
+    def __iter__(self):
+        return iter(self.progress)
+
+    def __len__(self):
+        return len(self.progress)
+
+    def rows_with_status(self, learning_status) -> List[int]:
+        """
+        Get the row keys with the given learning status in no particular order.
+        The returned list is part of the index, it must not be modified.
+        """
+        return self._get_groups().get(learning_status, [])
+
+    def count_with_status(self, learning_status) -> int:
+        return len(self.rows_with_status(learning_status))
+
+    def first_rows_with_status(self, learning_status, count: int) -> List[int]:
+        """
+        Get the count lowest row keys with the given learning status in increasing order
+        """
+        if count >= self.count_with_status(learning_status):
+            return sorted(self.rows_with_status(learning_status))
+        return list(islice(self._rows_in_order(learning_status), count))
+
+    def sample_rows_with_status(self, learning_status, count: int, rng) -> List[int]:
+        """
+        Get count random row keys with the given learning status (all of them if there are fewer)
+        :param rng: random generator of the sample
+        """
+        rows = self.rows_with_status(learning_status)
+        return rng.sample(rows, min(count, len(rows)))
+
+    def invalidate_index(self):
+        """
+        Drop the status index, e. g. when the learning statuses were changed without using this object
+        """
+        self._groups = None
+        self._positions = None
+        self._heaps = {}
+        self._sorted_heaps = set()
+
+    def statuses(self) -> List:
+        """
+        Get the learning statuses that occur in the learning progress
+        """
+        return [status for status, rows in self._get_groups().items() if len(rows) > 0]
+
+    def _get_groups(self):
+        if self._groups is None:
+            groups = {}
+            positions = {}
+            for row_key, learning_status in self.progress.items():
+                rows = groups.setdefault(learning_status, [])
+                positions[row_key] = len(rows)
+                rows.append(row_key)
+            self._positions = positions
+            self._groups = groups
+        return self._groups
+
+    def _rows_in_order(self, learning_status) -> Iterator[int]:
+        """The row keys with the given learning status in increasing order"""
+        heap = self._heaps.get(learning_status)
+        if heap is None:
+            # A sorted list is a heap as well
+            heap = sorted(self._get_groups().get(learning_status, []))
+            self._heaps[learning_status] = heap
+            self._sorted_heaps.add(learning_status)
+        if learning_status in self._sorted_heaps:
+            return iter(heap)
+        return self._heap_rows_in_order(learning_status, heap)
+
+    def _heap_rows_in_order(self, learning_status, heap: List[int]) -> Iterator[int]:
+        # Best-first traversal of the heap, it yields the row keys in increasing order without changing the heap
+        frontier = [(heap[0], 0)] if len(heap) > 0 else []
+        previous = None
+        while len(frontier) > 0:
+            row_key, position = heappop(frontier)
+            # A row that left the group and came back is in the heap twice
+            if row_key != previous and self._in_group(learning_status, row_key):
+                previous = row_key
+                yield row_key
+            for child in (2 * position + 1, 2 * position + 2):
+                if child < len(heap):
+                    heappush(frontier, (heap[child], child))
+
+    def _in_group(self, learning_status, row_key) -> bool:
+        position = self._positions.get(row_key)
+        rows = self._groups.get(learning_status)
+        return position is not None and rows is not None and position < len(rows) and rows[position] == row_key
+
+    def _add_to_group(self, learning_status, row_key):
+        rows = self._groups.setdefault(learning_status, [])
+        self._positions[row_key] = len(rows)
+        rows.append(row_key)
+        heap = self._heaps.get(learning_status)
+        self._sorted_heaps.discard(learning_status)
+        if heap is not None:
+            if len(heap) > 2 * len(rows) + 16:
+                # Mostly rows that left the group, the heap is built again when it's used
+                del self._heaps[learning_status]
+            else:
+                heappush(heap, row_key)
+
+    def _remove_from_group(self, learning_status, row_key):
+        # The last row of the group takes the place of the removed one
+        rows = self._groups[learning_status]
+        position = self._positions.pop(row_key)
+        last_row_key = rows.pop()
+        if position < len(rows):
+            rows[position] = last_row_key
+            self._positions[last_row_key] = position
+        # The rows that left the group are only removed from the heap once they're at its top
+        heap = self._heaps.get(learning_status)
+        self._sorted_heaps.discard(learning_status)
+        while heap and not self._in_group(learning_status, heap[0]):
+            heappop(heap)
+
+
+class ProgressOverlay(LearningProgress):
+    """
+    Learning progress of a user on a word list shared by many users. Only the learning statuses that differ from
+    the ones of the word list are stored (row key -> learning status), the word list isn't changed.
+    The status index of the word list is shared, only the changed rows are indexed per user, so picking rows
+    doesn't copy the rows of the word list.
+    """
+    __slots__ = ("base", "_removed")
+
+    def __init__(self, base: LearningProgress, changes: Dict[int, int] = None):
+        """
+        :param base: learning progress of the shared word list, its learning statuses must not change
+        :param changes: learning statuses that differ from base, it's updated in place
+        """
+        super().__init__(changes if changes is not None else {})
+        self.base = base
+        # Learning status in base -> rows having another status in the overlay
+        self._removed: Dict[int, Set[int]] = None
+
+    def __getitem__(self, row_key):
+        try:
+            return self.progress[row_key]
+        except KeyError:
+            return self.base[row_key]
+
+    def __setitem__(self, row_key, learning_status):
+        base_status = self.base[row_key]
+        if base_status == learning_status:
+            if row_key in self.progress:
+                super().__delitem__(row_key)
+                if self._removed is not None:
+                    self._removed[base_status].discard(row_key)
+        else:
+            if self._removed is not None and row_key not in self.progress:
+                self._removed.setdefault(base_status, set()).add(row_key)
+            super().__setitem__(row_key, learning_status)
+
+    def __delitem__(self, row_key):
+        raise TypeError("Rows can't be removed from the learning progress of a word list")
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+    def rows_with_status(self, learning_status) -> List[int]:
+        """
+        Get the row keys with the given learning status in no particular order.
+        The list is built on every call if the overlay changed the status of any row, it takes O(rows of the
+        status in the word list), the rows are picked with first_rows_with_status and sample_rows_with_status.
+        """
+        rows = self.base.rows_with_status(learning_status)
+        removed = self._get_removed().get(learning_status)
+        added = super().rows_with_status(learning_status)
+        if not removed and len(added) == 0:
+            return rows
+        return [row_key for row_key in rows if row_key not in removed] + added if removed else rows + added
+
+    def count_with_status(self, learning_status) -> int:
+        return self.base.count_with_status(learning_status) - \
+            len(self._get_removed().get(learning_status, ())) + len(super().rows_with_status(learning_status))
+
+    def first_rows_with_status(self, learning_status, count: int) -> List[int]:
+        """
+        Get the count lowest row keys with the given learning status in increasing order.
+        It takes O(count + the rows changed by the overlay that have lower row keys).
+        """
+        removed = self._get_removed().get(learning_status)
+        base_rows = self.base._rows_in_order(learning_status)
+        if removed:
+            base_rows = (row_key for row_key in base_rows if row_key not in removed)
+        return list(islice(merge(base_rows, super()._rows_in_order(learning_status)), count))
+
+    def sample_rows_with_status(self, learning_status, count: int, rng) -> List[int]:
+        base_rows = self.base.rows_with_status(learning_status)
+        added = super().rows_with_status(learning_status)
+        removed = self._get_removed().get(learning_status, ())
+        # Positions in base_rows + added
+        size = len(base_rows) + len(added)
+        count = min(count, size - len(removed))
+        if len(removed) == 0:
+            positions = rng.sample(range(size), count)
+        elif (size - len(removed)) * 4 < size:
+            # Most rows of the word list were changed, the remaining ones are copied (O(changed rows))
+            return rng.sample(self.rows_with_status(learning_status), count)
+        else:
+            # The changed rows of the word list are rejected, less than 4 positions are drawn per row on average
+            positions = []
+            picked = set()
+            while len(positions) < count:
+                position = rng.randrange(size)
+                if position in picked or position < len(base_rows) and base_rows[position] in removed:
+                    continue
+                picked.add(position)
+                positions.append(position)
+        return [base_rows[position] if position < len(base_rows) else added[position - len(base_rows)]
+                for position in positions]
+
+    def invalidate_index(self):
+        super().invalidate_index()
+        self._removed = None
+
+    def statuses(self) -> List:
+        candidates = dict.fromkeys(self.base.statuses())
+        candidates.update(dict.fromkeys(super().statuses()))
+        return [status for status in candidates if self.count_with_status(status) > 0]
+
+    def _get_removed(self) -> Dict[int, Set[int]]:
+        if self._removed is None:
+            removed = {}
+            for row_key in self.progress:
+                removed.setdefault(self.base[row_key], set()).add(row_key)
+            self._removed = removed
+        return self._removed
+
+
+class _FlashcardStatuses(MutableMapping):
+    """
+    View of the learning statuses stored in the flashcards of a word list
+    """
+    __slots__ = ("word_list",)
+
+    def __init__(self, word_list: "WordList"):
+        self.word_list = word_list
+
+    def __getitem__(self, row_key):
+        return self.word_list.flashcards.get_status(row_key)
+
+    def __setitem__(self, row_key, learning_status):
+        flashcards = self.word_list.flashcards
+        if flashcards.get_status(row_key) != learning_status:
+            flashcards.set_status(row_key, learning_status)
+            self.word_list.dirty_rows.add(row_key)
+
+    def __delitem__(self, row_key):
+        raise TypeError("Rows can't be removed from the learning progress of a word list")
+
+    def __iter__(self):
+        return iter(self.word_list.flashcards)
+
+    def __len__(self):
+        return len(self.word_list.flashcards)
 
 
 class WordList:
+    __slots__ = ("name", "lang1", "lang2", "_flashcards", "dirty_rows", "learning_progress")
+
     def __init__(self, name, lang1: str, lang2:str, flashcards: Dict[int, Flashcard]):
         self.name = name
         self.lang1 = lang1
         self.lang2 = lang2
+        self.learning_progress = None
         self.flashcards = flashcards
+        # Rows whose learning status changed since the last save
+        self.dirty_rows: Set[int] = set()
+        # Learning statuses of the flashcards, the changes (also the ones made through the flashcards)
+        # are tracked in dirty_rows
+        self.learning_progress = LearningProgress(_FlashcardStatuses(self))
+
+    @property
+    def flashcards(self) -> _FlashcardColumns:
+        """
+        Flashcards by row key (integers), they are stored column-wise
+        """
+        return self._flashcards
+
+    @flashcards.setter
+    def flashcards(self, flashcards: Dict[int, Flashcard]):
+        if not isinstance(flashcards, _FlashcardColumns):
+            flashcards = _FlashcardColumns(flashcards)
+        flashcards.word_list = self
+        self._flashcards = flashcards
+        if self.learning_progress is not None:
+            self.learning_progress.invalidate_index()
+
+    def __setstate__(self, state):
+        # The word lists pickled before the flashcards were stored column-wise have a dictionary of Flashcard objects
+        attributes = _pickled_attributes(state)
+        flashcards = attributes["_flashcards"] if "_flashcards" in attributes else attributes["flashcards"]
+        self.__init__(attributes["name"], attributes["lang1"], attributes["lang2"], flashcards)
+        self.dirty_rows = set(attributes.get("dirty_rows", ()))
+
+
+class LazyWordLists(MutableMapping):
+    """
+    Word lists of a word collection (name -> WordList) that are loaded when they're first accessed.
+    The loading function returns None for the word lists that turn out to be invalid, these are removed,
+    like the ones whose loading raised an error.
+    """
+    __slots__ = ("_names", "_loaded", "_load_function", "_lock")
+
+    def __init__(self, names: List[str], load_function: Callable[[str], WordList]):
+        self._names: List[str] = list(names)
+        self._loaded: Dict[str, WordList] = {}
+        self._load_function = load_function
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name) -> WordList:
+        word_list = self._loaded.get(name)
+        if word_list is not None:
+            return word_list
+        with self._lock:
+            if name in self._loaded:
+                return self._loaded[name]
+            if name not in self._names:
+                raise KeyError(name)
+            try:
+                word_list = self._load_function(name)
+            except Exception:
+                # The error is raised once, the word list isn't loaded again
+                self._names.remove(name)
+                raise
+            if word_list is None:
+                self._names.remove(name)
+                raise KeyError(name)
+            self._loaded[name] = word_list
+            return word_list
+
+    def __setitem__(self, name, word_list: WordList):
+        with self._lock:
+            if name not in self._names:
+                self._names.append(name)
+            self._loaded[name] = word_list
+
+    def __delitem__(self, name):
+        with self._lock:
+            self._names.remove(name)
+            self._loaded.pop(name, None)
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def loaded(self) -> Dict[str, WordList]:
+        """
+        Get the word lists that are already loaded, in the original order
+        """
+        return {name: self._loaded[name] for name in list(self._names) if name in self._loaded}
+
+    def __reduce__(self):
+        # Saved as a dictionary of all the word lists
+        return dict, (dict(self.items()),)
 
 
 class WordCollection:
-    def __init__(self, lang1: str, lang2: str, word_lists: Dict[str, WordList]):
+    __slots__ = ("lang1", "lang2", "word_lists", "source_path")
+
+    def __init__(self, lang1: str, lang2: str, word_lists: Dict[str, WordList], source_path: str = None):
         self.lang1 = lang1
         self.lang2 = lang2
         self.word_lists = word_lists
+        # Path of the workbook the collection was loaded from, the dirty rows of the word lists are the changes
+        # since that workbook was saved
+        self.source_path = source_path
+
+    def __setstate__(self, state):
+        self.source_path = None
+        _set_attributes(self, state)
+
+
+def loaded_word_lists(word_collection: WordCollection) -> List[WordList]:
+    """
+    Get the word lists of the collection that are in memory, without loading the lazily loaded ones
+    """
+    if isinstance(word_collection.word_lists, LazyWordLists):
+        return list(word_collection.word_lists.loaded().values())
+    return list(word_collection.word_lists.values())
 
 
 class QuizPackage:
+    __slots__ = ("directives", "question", "flashcard")
+
     def __init__(self, directives: dict, question: Question, flashcard: Flashcard):
         self.directives = directives
         self.question = question
         self.flashcard = flashcard
 
+    def __setstate__(self, state):
+        _set_attributes(self, state)
+
@@ -0,0 +1,246 @@
+"""
+Registry of the word pools, shared by the Vocabulary instances that load the same word collection.
+
+The pools are keyed by the hash of the expressions of the word collection. A pool is kept as long as it's used
+by any Vocabulary instance (reference counting), the last few unused pools are kept as well (LRU eviction),
+so that loading a deck again doesn't rebuild its pools and similarity index.
+"""
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List
+
+from . import alternatives
+from .batchscoring import BatchScorer
+from .minhashindex import MinHashIndex
+from .models import WordCollection, WordList, loaded_word_lists
+from .similarityindex import SimilarityIndex
+from .snapshot import _MappedFlashcardColumns
+
+# Default number of unused pools kept in the registry
+MAX_UNUSED_POOLS = 16
+
+
+def content_hash(word_collection: WordCollection) -> str:
+    """
+    Hash of the expressions of the loaded word lists in both languages, the word pools only depend on these.
+    The word lists of mapped snapshots are hashed without decoding them, so their hash differs from the one of
+    the same word lists loaded otherwise.
+    """
+    hasher = hashlib.sha256()
+    for word_list in loaded_word_lists(word_collection):
+        if isinstance(word_list.flashcards, _MappedFlashcardColumns):
+            hasher.update(b"\1")
+            hasher.update(word_list.flashcards.content_digest())
+            continue
+        for lang1, lang2 in zip(word_list.flashcards.lang1_values, word_list.flashcards.lang2_values):
+            hasher.update(str(lang1).encode("utf-8"))
+            hasher.update(b"\0")
+            hasher.update(str(lang2).encode("utf-8"))
+            hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def _intern(word):
+    return sys.intern(word) if type(word) is str else word
+
+
+class SharedPool:
+    """
+    Deduplicated, interned word pools of a word collection and the similarity data of the lang1 pool
+    """
+
+    def __init__(self, key: str, word_pool_lang1: List[str], word_pool_lang2: List[str],
+                 word_pool_lang1_index: SimilarityIndex = None):
+        """
+        :param word_pool_lang1_index: index of word_pool_lang1 built earlier, it's built here if it's None
+        """
+        self.key = key
+        self.word_pool_lang1: List[str] = list(dict.fromkeys(_intern(word) for word in word_pool_lang1))
+        self.word_pool_lang2: List[str] = list(dict.fromkeys(_intern(word) for word in word_pool_lang2))
+        self.word_pool_lang1_index = word_pool_lang1_index if word_pool_lang1_index is not None \
+            else SimilarityIndex(self.word_pool_lang1)
+        self._word_pool_lang1_scorer: BatchScorer = None
+        self._word_pool_lang1_minhash: MinHashIndex = None
+        self._lock = threading.Lock()
+        self.ref_count = 0
+
+    def extend(self, key: str, word_pool_lang1: List[str], word_pool_lang2: List[str]):
+        """
+        Add the words of newly loaded word lists to the pools in place and index the new lang1 words,
+        the batch scorer and the approximate index are built again when they're used
+        """
+        self.key = key
+        for pool, words in ((self.word_pool_lang1, word_pool_lang1), (self.word_pool_lang2, word_pool_lang2)):
+            pooled = set(pool)
+            pool.extend(word for word in dict.fromkeys(_intern(word) for word in words) if word not in pooled)
+        self.word_pool_lang1_index.extend(self.word_pool_lang1)
+        with self._lock:
+            self._word_pool_lang1_scorer = None
+            self._word_pool_lang1_minhash = None
+
+    @property
+    def word_pool_lang1_scorer(self) -> BatchScorer:
+        """
+        Batch scorer of the lang1 pool, it's only built when it's first used
+        """
+        with self._lock:
+            if self._word_pool_lang1_scorer is None:
+                self._word_pool_lang1_scorer = BatchScorer(self.word_pool_lang1)
+            return self._word_pool_lang1_scorer
+
+    @property
+    def word_pool_lang1_minhash(self) -> MinHashIndex:
+        """
+        Approximate index of the lang1 pool, it's only built when it's first used
+        """
+        with self._lock:
+            if self._word_pool_lang1_minhash is None:
+                self._word_pool_lang1_minhash = MinHashIndex(self.word_pool_lang1)
+            return self._word_pool_lang1_minhash
+
+
+class PoolRegistry:
+    """
+    Thread-safe registry of SharedPool objects.
+    The pools are built outside the lock of the registry, the callers acquiring a pool that's being built wait for
+    that build, the others aren't blocked by it.
+    """
+
+    def __init__(self, max_unused: int = MAX_UNUSED_POOLS):
+        self.max_unused = max_unused
+        self._used: Dict[str, SharedPool] = {}
+        # Pools that aren't used by any Vocabulary, the least recently released one first
+        self._unused: "OrderedDict[str, SharedPool]" = OrderedDict()
+        # Pools being built (or extended) by key
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, word_collection: WordCollection) -> SharedPool:
+        """
+        Get the pool of the word collection, it's only built if there's no pool with the same content.
+        Every acquired pool must be released.
+        """
+        # Avoiding the circular import
+        from .vocabulary import _build_word_pool
+
+        key = content_hash(word_collection)
+        with self._lock:
+            pool = self._take(key)
+            if pool is not None:
+                return pool
+            pending = self._pending.get(key)
+            building = pending is None
+            if building:
+                pending = self._pending[key] = Future()
+
+        if not building:
+            pool = pending.result()
+            with self._lock:
+                # The pool may have been released (or even evicted and built again) since it was built
+                return self._take(key) or self._register(pool)
+
+        try:
+            pool = SharedPool(key, *_build_word_pool(word_collection))
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._register(pool)
+        pending.set_result(pool)
+        return pool
+
+    def _take(self, key: str) -> SharedPool:
+        """Acquire the pool with the given key if it's in the registry, the lock must be held"""
+        pool = self._used.get(key)
+        if pool is None:
+            pool = self._unused.pop(key, None)
+        if pool is not None:
+            pool.ref_count += 1
+            self._used[key] = pool
+        return pool
+
+    def _register(self, pool: SharedPool) -> SharedPool:
+        """Acquire a pool that isn't in the registry, the lock must be held"""
+        pool.ref_count += 1
+        self._used[pool.key] = pool
+        return pool
+
+    def extend(self, pool: SharedPool, word_collection: WordCollection, word_lists: List[WordList]) -> bool:
+        """
+        Extend an acquired pool in place with the words of word lists loaded or added to its word collection since
+        the pool was acquired, if no one else uses the pool and the extended content has no pool yet.
+        :return: whether the pool was extended, otherwise the pool of the changed collection must be acquired
+        """
+        key = content_hash(word_collection)
+        with self._lock:
+            if pool.ref_count != 1 or self._used.get(pool.key) is not pool or \
+                    key in self._used or key in self._unused or key in self._pending:
+                return False
+            # No one else can acquire the pool while it's extended, the callers acquiring the extended content
+            # wait for it
+            del self._used[pool.key]
+            pool.ref_count = 0
+            pending = self._pending[key] = Future()
+            # The cached shortlists of the previous content can't be used any more
+            alternatives.shortlist_cache.invalidate(pool.key)
+            alternatives.shortlist_cache.invalidate((pool.key, "minhash"))
+
+        try:
+            pool.extend(key, [word for word_list in word_lists for word in word_list.flashcards.lang1_values],
+                        [word for word_list in word_lists for word in word_list.flashcards.lang2_values])
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            pending.set_exception(e)
+            raise
+        with self._lock:
+            del self._pending[key]
+            self._register(pool)
+        pending.set_result(pool)
+        return True
+
+    def release(self, pool: SharedPool):
+        with self._lock:
+            pool.ref_count -= 1
+            if pool.ref_count > 0 or self._used.get(pool.key) is not pool:
+                # Still used, or not in the registry (e. g. extending it failed)
+                return
+            self._used.pop(pool.key, None)
+            self._unused[pool.key] = pool
+            self._evict_unused()
+
+    def add(self, pool: SharedPool):
+        """
+        Add a pool built elsewhere (e. g. loaded from a cache) as an unused one, unless its key is already known
+        """
+        with self._lock:
+            if pool.key in self._used or pool.key in self._unused or pool.key in self._pending:
+                return
+            self._unused[pool.key] = pool
+            self._evict_unused()
+
+    def _evict_unused(self):
+        while len(self._unused) > self.max_unused:
+            key, evicted = self._unused.popitem(last=False)
+            # The cached shortlists of the evicted pool can't be used any more
+            alternatives.shortlist_cache.invalidate(key)
+            alternatives.shortlist_cache.invalidate((key, "minhash"))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._used) + len(self._unused)
+
+    def __contains__(self, key: str):
+        with self._lock:
+            return key in self._used or key in self._unused
+
+
+# Registry shared by the Vocabulary instances of the process
+registry = PoolRegistry()
@@ -0,0 +1,128 @@
+"""
+Index of the alternative pool for finding the expressions that are the most similar to the correct answer
+without comparing it to every expression of the pool.
+
+The ranking is the same as the one of alternatives.calc_similarity: the n-gram term is only calculated for the
+expressions sharing at least one n-gram with the correct answer (it's 0 for all the others), the remaining terms
+only depend on the character count, the word count and the special characters, so they are calculated once per
+group of expressions with the same features.
+"""
+
+from collections import Counter
+from heapq import nlargest
+from ngram import NGram
+from typing import Dict, List, Tuple
+
+from .instrumentation import get_instrumentation
+
+_SPLITTER = NGram()
+
+
+def _features(expression: str) -> Tuple[int, int, bool, bool]:
+    """Character count, word count, whether the expression contains '?' and '!'"""
+    return len(expression), len(expression.split()), "?" in expression, "!" in expression
+
+
+def _unique(pool: List[str]) -> List[str]:
+    """The expressions of the pool without duplicates, the same way as in alternatives.most_similar"""
+    return list(dict.fromkeys(pool))
+
+
+def _length_terms(expr_features, alt_features) -> Tuple[float, float, int]:
+    """The wordcount, charcount and specchars terms of alternatives.calc_similarity"""
+    expr_chars, expr_words, expr_question, expr_exclamation = expr_features
+    alt_chars, alt_words, alt_question, alt_exclamation = alt_features
+    wordcount = 1 - abs(alt_words - expr_words) / (expr_words + alt_words)
+    charcount = 1 - abs(alt_chars - expr_chars) / (expr_chars + alt_chars)
+    specchars = int(expr_question and alt_question) + int(expr_exclamation and alt_exclamation)
+    return wordcount, charcount, specchars
+
+
+def _ngram_term(samegrams: int, expr_features, alt_features) -> float:
+    """The ngram term of alternatives.calc_similarity from the number of shared n-grams (as in NGram.compare)"""
+    return samegrams / (expr_features[0] + alt_features[0] + 4 - samegrams)
+
+
+def _score(ngram: float, length_terms) -> float:
+    """The score of alternatives.calc_similarity, the terms are added in the same order"""
+    wordcount, charcount, specchars = length_terms
+    return ngram + wordcount + charcount + specchars
+
+
+class SimilarityIndex:
+    """
+    Inverted n-gram index of a pool of expressions. Build it once per pool and use it for every question.
+    """
+
+    def __init__(self, pool: List[str]):
+        self.words: List[str] = []
+        self._features: List[tuple] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._groups: Dict[tuple, List[int]] = {}
+        self._add(_unique(pool))
+
+    def extend(self, pool: List[str]):
+        """
+        Add the expressions of pool that aren't indexed yet, only the new expressions are split into n-grams
+        """
+        indexed = set(self.words)
+        self._add([word for word in _unique(pool) if word not in indexed])
+
+    def _add(self, words: List[str]):
+        for word_id, word in enumerate(words, start=len(self.words)):
+            self.words.append(word)
+            word_str = str(word)
+            features = _features(word_str)
+            self._features.append(features)
+            self._groups.setdefault(features, []).append(word_id)
+            for gram, count in Counter(_SPLITTER.split(word_str)).items():
+                self._postings.setdefault(gram, []).append((word_id, count))
+
+    def __len__(self):
+        return len(self.words)
+
+    def shortlist(self, expression: str, shortlist_count: int) -> List[str]:
+        """
+        Find the shortlist_count expressions of the pool that are the most similar to expression
+        :param expression: correct answer, it's never part of the shortlist
+        :param shortlist_count:
+        :return: expressions in decreasing order of similarity
+        """
+        expr = str(expression)
+        expr_features = _features(expr)
+
+        # Number of n-grams shared with expression, only for the candidates having any
+        shared: Dict[int, int] = {}
+        for gram, count in Counter(_SPLITTER.split(expr)).items():
+            for word_id, word_count in self._postings.get(gram, ()):
+                shared[word_id] = shared.get(word_id, 0) + min(count, word_count)
+
+        terms = {features: _length_terms(expr_features, features) for features in self._groups}
+
+        candidates = []
+        for word_id, samegrams in shared.items():
+            if self.words[word_id] == expression:
+                continue
+            features = self._features[word_id]
+            candidates.append((_score(_ngram_term(samegrams, expr_features, features), terms[features]), word_id))
+
+        # Candidates without shared n-grams: their score only depends on the group they belong to
+        group_scores = sorted(((_score(0.0, group_terms), features) for features, group_terms in terms.items()),
+                              key=lambda v: v[0], reverse=True)
+        remaining = shortlist_count
+        for score, features in group_scores:
+            if remaining <= 0:
+                break
+            for word_id in self._groups[features]:
+                if word_id in shared or self.words[word_id] == expression:
+                    continue
+                candidates.append((score, word_id))
+                remaining -= 1
+                if remaining <= 0:
+                    break
+
+        instrumentation = get_instrumentation()
+        if instrumentation.enabled:
+            instrumentation.observe("candidate_count", len(candidates))
+        return [self.words[word_id] for score, word_id in nlargest(shortlist_count, candidates,
+                                                                    key=lambda v: v[0])]
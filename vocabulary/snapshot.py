@@ -0,0 +1,382 @@
+"""
+Binary columnar snapshot of a word collection.
+
+Layout of the file (little-endian):
+    magic (8 bytes), header size (uint64), JSON header padded to 8 bytes, column data.
+The header holds the languages of the collection and, per word list, the row count and the (offset, size) of every
+column relative to the start of the column data. Every column starts at an 8-byte boundary, so the file can be
+mapped into memory and the numeric columns used without copying them:
+    row_keys: int64 per row, in increasing order
+    statuses: int8 per row, with the encoding of models._FlashcardColumns
+    <column>_offsets: uint64 per row + 1, start of the values of <column> in <column>_text
+    <column>_types: int8 per row, type of the values of <column> (_STR, _NONE, ...)
+    <column>_text: UTF-8 text of the values of <column>, separated by NUL characters
+The learning statuses that don't fit in the status column are stored in the header.
+"""
+
+import contextlib
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from datetime import datetime
+from collections.abc import Sequence
+from copy import deepcopy
+from typing import Tuple
+
+from .models import WordCollection, WordList, _FlashcardColumns
+
+SNAPSHOT_MAGIC = b"VOCSNAP1"
+SNAPSHOT_VERSION = 1
+
+_ALIGNMENT = 8
+_HEADER_SIZE = struct.Struct("<Q")
+# Columns of strings (attribute of _FlashcardColumns -> column name in the snapshot)
+_TEXT_COLUMNS = (("lang1_values", "lang1"), ("lang2_values", "lang2"), ("remarks_values", "remarks"))
+
+# Types of the values in the text columns, cells of a workbook can hold any of these
+_STR = 0
+_NONE = 1
+_INT = 2
+_FLOAT = 3
+_BOOL = 4
+_DATETIME = 5
+_DATETIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def _encode_value(value):
+    """Type and text of a value"""
+    value_type = type(value)
+    if value_type is str:
+        return _STR, value
+    if value is None:
+        return _NONE, ""
+    if value_type is bool:
+        return _BOOL, "1" if value else ""
+    if value_type is int:
+        return _INT, str(value)
+    if value_type is float:
+        return _FLOAT, repr(value)
+    if value_type is datetime:
+        return _DATETIME, value.strftime(_DATETIME_FORMAT)
+    return _STR, str(value)
+
+
+def _decode_value(value_type, text):
+    if value_type == _STR:
+        return text
+    if value_type == _NONE:
+        return None
+    if value_type == _BOOL:
+        return text == "1"
+    if value_type == _INT:
+        return int(text)
+    if value_type == _FLOAT:
+        return float(text)
+    if value_type == _DATETIME:
+        return datetime.strptime(text, _DATETIME_FORMAT)
+    raise SnapshotFormatError(f"Unknown value type: {value_type}")
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _read_array(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def _encode_text_column(values):
+    types = array("b")
+    texts = []
+    for value in values:
+        value_type, text = _encode_value(value)
+        if "\0" in text:
+            raise ValueError(f"NUL characters can't be saved in a snapshot: {text!r}")
+        types.append(value_type)
+        texts.append(text)
+    offsets = array("Q", [0])
+    for text in texts:
+        offsets.append(offsets[-1] + len(text.encode("utf-8")) + 1)
+    return offsets, types, "\0".join(texts).encode("utf-8")
+
+
+def _decode_text_column(offsets: array, types: array, text: bytes, count: int) -> list:
+    if len(offsets) != count + 1 or len(types) != count:
+        raise SnapshotFormatError("Invalid text column")
+    if count == 0:
+        return []
+    # The whole column is decoded at once, only the values that aren't strings are converted one by one
+    values = text.decode("utf-8").split("\0")
+    if len(values) != count:
+        raise SnapshotFormatError("Invalid text column")
+    if types.count(_STR) != count:
+        values = [value if value_type == _STR else None if value_type == _NONE else _decode_value(value_type, value)
+                  for value, value_type in zip(values, types)]
+    return values
+
+
+class _ColumnWriter:
+    """Column data of a snapshot being written"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def add(self, data: bytes):
+        """Append a column, returns its (offset, size)"""
+        self.data.extend(b"\0" * (-len(self.data) % _ALIGNMENT))
+        offset = len(self.data)
+        self.data.extend(data)
+        return [offset, len(data)]
+
+
+def word_collection_to_snapshot(path: str, word_collection: WordCollection):
+    """
+    Save the word collection as a binary columnar snapshot
+    """
+    writer = _ColumnWriter()
+    word_lists = []
+    for word_list in word_collection.word_lists.values():
+        flashcards = word_list.flashcards
+        columns = {
+            "row_keys": writer.add(_little_endian(flashcards.row_keys)),
+            "statuses": writer.add(flashcards.status_values.tobytes()),
+        }
+        for attribute, name in _TEXT_COLUMNS:
+            offsets, types, text = _encode_text_column(getattr(flashcards, attribute))
+            columns[name + "_offsets"] = writer.add(_little_endian(offsets))
+            columns[name + "_types"] = writer.add(types.tobytes())
+            columns[name + "_text"] = writer.add(text)
+        word_lists.append({
+            "name": word_list.name,
+            "lang1": word_list.lang1,
+            "lang2": word_list.lang2,
+            "count": len(flashcards),
+            "columns": columns,
+            "other_statuses": [[row_key, *_encode_value(status)]
+                               for row_key, status in flashcards.other_statuses.items()],
+        })
+
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "lang1": word_collection.lang1,
+        "lang2": word_collection.lang2,
+        "word_lists": word_lists,
+    }).encode("utf-8")
+    header += b" " * (-len(header) % _ALIGNMENT)
+    # The file is replaced, not overwritten: processes that have mapped the previous snapshot keep reading it
+    _replace_file(path, [SNAPSHOT_MAGIC, _HEADER_SIZE.pack(len(header)), header, writer.data])
+
+
+def _replace_file(path: str, chunks):
+    """
+    Write the chunks to a temporary file of its own next to path, and then replace path with it
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+
+def _read_header(buffer) -> Tuple[dict, int]:
+    """
+    Parse the header of a snapshot
+    :param buffer: content of the snapshot file
+    :return: the header and the offset of the column data in the buffer
+    """
+    prefix_size = len(SNAPSHOT_MAGIC) + _HEADER_SIZE.size
+    if len(buffer) < prefix_size or bytes(buffer[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+        raise SnapshotFormatError("Not a word collection snapshot")
+    header_size, = _HEADER_SIZE.unpack(bytes(buffer[len(SNAPSHOT_MAGIC):prefix_size]))
+    data_start = prefix_size + header_size
+    if data_start > len(buffer):
+        raise SnapshotFormatError("Truncated snapshot")
+    try:
+        header = json.loads(bytes(buffer[prefix_size:data_start]).decode("utf-8"))
+    except ValueError as e:
+        raise SnapshotFormatError("Invalid snapshot header") from e
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise SnapshotFormatError(f"Unsupported snapshot version: {header.get('version')}")
+    return header, data_start
+
+
+def _column_data(buffer: memoryview, data_start: int, word_list_header: dict, name: str) -> memoryview:
+    """The bytes of a column of a word list (a slice of buffer)"""
+    try:
+        offset, size = word_list_header["columns"][name]
+    except (KeyError, TypeError, ValueError) as e:
+        raise SnapshotFormatError(f"Missing column: {name}") from e
+    start = data_start + offset
+    if offset < 0 or size < 0 or start + size > len(buffer):
+        raise SnapshotFormatError(f"Truncated column: {name}")
+    return buffer[start:start + size]
+
+
+def _mapped_array(typecode: str, data: memoryview):
+    """The column as a read-only view of the mapped file, or as a copy if the byte order isn't the same"""
+    if sys.byteorder != "little":
+        return _read_array(typecode, data)
+    try:
+        return data.cast(typecode)
+    except TypeError as e:
+        raise SnapshotFormatError("Invalid column size") from e
+
+
+def _decode_other_statuses(word_list_header: dict) -> dict:
+    return {row_key: _decode_value(value_type, text)
+            for row_key, value_type, text in word_list_header.get("other_statuses", [])}
+
+
+class _TextColumn(Sequence):
+    """
+    Values of a text column of a mapped snapshot, they're decoded when they're read
+    """
+    __slots__ = ("_offsets", "_types", "_text")
+
+    def __init__(self, offsets, types, text: memoryview):
+        self._offsets = offsets
+        self._types = types
+        self._text = text
+
+    def __len__(self):
+        return len(self._types)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        value_type = self._types[position]
+        # IndexError is raised by the line above for the invalid positions
+        text = str(self._text[self._offsets[position]:self._offsets[position + 1] - 1], "utf-8")
+        return text if value_type == _STR else _decode_value(value_type, text)
+
+
+class _MappedFlashcardColumns(_FlashcardColumns):
+    """
+    Flashcards of a word list of a mapped snapshot. The row keys and the texts are read from the file,
+    the learning statuses are copied, so they're the only values that can be changed.
+    """
+    __slots__ = ("_content_digest",)
+
+    def __init__(self):
+        super().__init__()
+        self._content_digest: bytes = None
+
+    def content_digest(self) -> bytes:
+        """
+        Digest of the lang1 and lang2 values, the bytes of the mapped file are hashed without decoding the texts
+        """
+        if self._content_digest is None:
+            hasher = hashlib.sha256()
+            for column in (self.lang1_values, self.lang2_values):
+                # The values are separated by NUL characters, the types tell the values that aren't strings
+                for data in (column._types, column._text):
+                    hasher.update(_HEADER_SIZE.pack(len(data)))
+                    hasher.update(data)
+            self._content_digest = hasher.digest()
+        return self._content_digest
+
+    def __setitem__(self, row_key, flashcard):
+        raise TypeError("The flashcards of a mapped word collection are read-only")
+
+    def __delitem__(self, row_key):
+        raise TypeError("The flashcards of a mapped word collection are read-only")
+
+    def __deepcopy__(self, memo):
+        # The read-only columns are shared by the copies
+        flashcards = _MappedFlashcardColumns()
+        flashcards.row_keys = self.row_keys
+        flashcards.lang1_values = self.lang1_values
+        flashcards.lang2_values = self.lang2_values
+        flashcards.remarks_values = self.remarks_values
+        flashcards.status_values = array("b", self.status_values)
+        flashcards.other_statuses = deepcopy(self.other_statuses, memo)
+        flashcards._content_digest = self._content_digest
+        return flashcards
+
+
+def _load_word_list(buffer: memoryview, data_start: int, word_list_header: dict, mapped: bool) -> WordList:
+    count = word_list_header["count"]
+    if mapped:
+        flashcards = _MappedFlashcardColumns()
+        flashcards.row_keys = _mapped_array("q", _column_data(buffer, data_start, word_list_header, "row_keys"))
+    else:
+        flashcards = _FlashcardColumns()
+        flashcards.row_keys = _read_array("q", _column_data(buffer, data_start, word_list_header, "row_keys"))
+    flashcards.status_values = _read_array("b", _column_data(buffer, data_start, word_list_header, "statuses"))
+    flashcards.other_statuses = _decode_other_statuses(word_list_header)
+    if len(flashcards.row_keys) != count or len(flashcards.status_values) != count:
+        raise SnapshotFormatError(f"Invalid word list: {word_list_header['name']}")
+
+    for attribute, name in _TEXT_COLUMNS:
+        text = _column_data(buffer, data_start, word_list_header, name + "_text")
+        if mapped:
+            offsets = _mapped_array("Q", _column_data(buffer, data_start, word_list_header, name + "_offsets"))
+            types = _mapped_array("b", _column_data(buffer, data_start, word_list_header, name + "_types"))
+            if len(offsets) != count + 1 or len(types) != count or offsets[count] != len(text) + (count > 0):
+                raise SnapshotFormatError("Invalid text column")
+            values = _TextColumn(offsets, types, text)
+        else:
+            offsets = _read_array("Q", _column_data(buffer, data_start, word_list_header, name + "_offsets"))
+            types = _read_array("b", _column_data(buffer, data_start, word_list_header, name + "_types"))
+            values = _decode_text_column(offsets, types, bytes(text), count)
+        setattr(flashcards, attribute, values)
+
+    return WordList(word_list_header["name"], word_list_header["lang1"], word_list_header["lang2"],
+                    flashcards=flashcards)
+
+
+def _load_word_collection(buffer: memoryview, mapped: bool) -> WordCollection:
+    header, data_start = _read_header(buffer)
+    word_lists = {}
+    for word_list_header in header["word_lists"]:
+        word_list = _load_word_list(buffer, data_start, word_list_header, mapped)
+        word_lists[word_list.name] = word_list
+    return WordCollection(header["lang1"], header["lang2"], word_lists)
+
+
+def word_collection_from_snapshot(path: str) -> WordCollection:
+    """
+    Load a word collection saved by word_collection_to_snapshot
+    """
+    with open(path, "rb") as f:
+        buffer = memoryview(f.read())
+    return _load_word_collection(buffer, mapped=False)
+
+
+def map_word_collection(path: str) -> WordCollection:
+    """
+    Map a snapshot saved by word_collection_to_snapshot into memory read-only.
+    The row keys and the texts aren't copied, the texts are decoded when they're read, so the processes mapping
+    the same file share its pages. Only the learning statuses are copied, they can be changed and saved
+    as usual, changing anything else raises TypeError.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise SnapshotFormatError("Not a word collection snapshot")
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # The mapping is closed when none of the columns refer to it any more
+    return _load_word_collection(memoryview(mapping), mapped=True)
@@ -1,161 +1,410 @@
-"""
-Vocabulary main module
-
-"""
-import logging
-
-from . import dataaccess
-
-import random
-from . import alternatives, learningprogress
-from typing import Callable, Dict
-from .models import Question, Flashcard, QuizPackage
-from .models import WordCollection, WordList
-from .vocabulary import _choice_quiz, _check_answer, _build_word_pool, _update_learning_progress
-from .vocabulary import _get_learning_progress
-from .learningprogress import submit_answer, pick_words, Progress, PickOrder
-from pdb import set_trace
-
-VSTATUS_LOAD_FILE = 1
-VSTATUS_CHOOSE_SHEET = 2
-VSTATUS_READY_FOR_QUIZ = 3
-
-SHOW_FLASHCARD_KEY_NAME = "showFlashcard"
-
-
-def _build_quiz(word_list: WordList, row_key: int, alternatives_pool, flashcard_only: bool) -> QuizPackage:
-
-    flashcard = Flashcard(
-        lang1=word_list.flashcards[row_key].lang1,
-        lang2=word_list.flashcards[row_key].lang2,
-        remarks=word_list.flashcards[row_key].remarks,
-        learning_status=word_list.flashcards[row_key].learning_status
-    )
-
-    if flashcard_only:
-        question = None
-    else:
-        incorrect_alternatives = alternatives.most_similar(flashcard.lang1, alternatives_pool, 50, 4,
-                                                           alternatives.calc_similarity)
-
-        question = Question(row_key=row_key,
-                            text=flashcard.lang2,
-                            options=[flashcard.lang1] + incorrect_alternatives)
-        random.shuffle(question.options)
-
-    quiz_package = QuizPackage(directives={SHOW_FLASHCARD_KEY_NAME: flashcard_only},
-                               question=question,
-                               flashcard=flashcard)
-    return quiz_package
-
-
-
-class Vocabulary:
-    """
-    Provide the Vocabulary library functionalities: e. g. loading word list, picking and answering questions,
-    getting and resetting learning progress.
-
-    """
-
-    def __init__(self):
-        self.status = VSTATUS_LOAD_FILE
-        self.word_collection: WordCollection = None
-        self.word_pool_lang1 = None
-        self.word_pool_lang2 = None
-        self.selected_word_list_name = None
-
-    def load(self, path: str, load_function: Callable[[str], WordCollection]):
-
-        self.word_collection= load_function(path)
-        self.word_pool_lang1, self.word_pool_lang2 = _build_word_pool(self.word_collection)
-
-    def save(self, path: str, save_function: Callable[[str, WordCollection], None]):
-        save_function(path, self.word_collection)
-
-    def get_word_sheet_list(self) -> list:
-        return list(self.word_collection.word_lists.keys())  # It only returns valid worksheets
-
-    def choice_quiz(self, word_list_name: str, quiz_strategy: str) -> (bool, Question, Flashcard):
-        """
-        Fetch a question from the given word sheet. Generate one correct and several incorrect answer options.
-        Return the text of the question (e. g. pick the correct answer) and the answer options for the question.
-
-        :return: whether to show the flashcard (instead of the question), Question, Flashcard
-        """
-
-        # Pick 5 expressions, get flashcards and alternatives
-        learning_progress_dict: Dict[int, str] = _get_learning_progress(self._get_word_list(word_list_name))
-        row_keys_new = pick_words(learning_progress_dict=learning_progress_dict,
-                                  filter_by_progress=lambda p: p == Progress.NEW,
-                                  order=PickOrder.ORIGINAL,
-                                  max_count_from_size=lambda v:  5)
-
-        row_keys_recent = pick_words(learning_progress_dict=learning_progress_dict,
-                                     filter_by_progress=lambda p: p == Progress.RECENT,
-                                     order=PickOrder.SHUFFLED,
-                                     max_count_from_size=lambda v:  5)
-
-        row_keys_learned = pick_words(learning_progress_dict=learning_progress_dict,
-                                      filter_by_progress=lambda p: p == Progress.LEARNED,
-                                      order=PickOrder.SHUFFLED,
-                                      max_count_from_size=lambda size:  3 if size > 10 else 0)
-
-        flashcards_only = [_build_quiz(word_list=self._get_word_list(word_list_name),
-                           row_key=row_key,
-                        alternatives_pool=None,
-                         flashcard_only=True) for row_key in row_keys_new]
-        new_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
-                           row_key=row_key,
-                           alternatives_pool=self.word_pool_lang1,
-                           flashcard_only=False) for row_key in row_keys_new]
-        random.shuffle(new_questions)
-
-        recent_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
-                                     row_key=row_key,
-                                     alternatives_pool=self.word_pool_lang1,
-                                     flashcard_only=False) for row_key in row_keys_recent]
-        random.shuffle(recent_questions)
-
-        learned_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
-                                        row_key=row_key,
-                                        alternatives_pool=self.word_pool_lang1,
-                                        flashcard_only=False) for row_key in row_keys_learned]
-        random.shuffle(learned_questions)
-
-        quiz_packages = flashcards_only + new_questions + recent_questions + learned_questions
-
-        return quiz_packages
-
-    def update_progress(self, word_list_name: str, row_key, q_correctly_answered: bool):
-        """
-        Check the given answer if it's correct or not correct. Update the learning progress based on the answer.
-        :return:
-        """
-
-        word_list = self._get_word_list(word_list_name)
-        learning_progress_mod = submit_answer(_get_learning_progress(word_list),
-                                              row_key, q_correctly_answered)
-        word_list_mod = _update_learning_progress(word_list, learning_progress_mod)
-
-        self._set_word_list(word_list_name, word_list_mod)
-
-    # Calculates the learning progress
-    def get_progress(self, word_list_name):
-        return learningprogress.calculate_learning_progress(
-            _get_learning_progress(self._get_word_list(word_list_name)))
-
-    def reset_progress(self, word_list_name: str):
-        word_list = self._get_word_list(word_list_name)
-        learning_progress_dict = learningprogress.reset_progress(
-            _get_learning_progress(word_list)
-        )
-        self._set_word_list(word_list_name, _update_learning_progress(word_list, learning_progress_dict))
-
-    def _get_word_list(self, word_list_name: str) -> WordList:
-        return self.word_collection.word_lists[word_list_name]
-
-    def _set_word_list(self, word_list_name: str, word_list: WordList):
-        self.word_collection.word_lists[word_list_name] = word_list
-
-
-
+"""
+Vocabulary main module
+
+"""
+import logging
+
+from . import dataaccess
+
+import random
+import weakref
+from . import alternatives, learningprogress
+from typing import Callable, Dict, List, Set, Tuple
+from .models import Question, Flashcard, QuizPackage, LearningProgress, ProgressOverlay
+from .models import WordCollection, WordList, loaded_word_lists
+from .distractorworkers import DistractorWorkers
+from .instrumentation import get_instrumentation
+from .similarityindex import SimilarityIndex
+from .poolregistry import PoolRegistry, SharedPool
+from . import poolregistry
+from .vocabulary import _choice_quiz, _check_answer, _build_word_pool, _update_learning_progress
+from .vocabulary import _get_learning_progress
+from .learningprogress import submit_answer, pick_words, pick_words_with_status, Progress, PickOrder
+from .learningprogress import _random, _validate_in_place
+from pdb import set_trace
+
+VSTATUS_LOAD_FILE = 1
+VSTATUS_CHOOSE_SHEET = 2
+VSTATUS_READY_FOR_QUIZ = 3
+
+SHOW_FLASHCARD_KEY_NAME = "showFlashcard"
+
+# Number of alternatives in the shortlist and in the question
+SHORTLIST_COUNT = 50
+ALTERNATIVES_COUNT = 4
+
+
+def _build_quiz(word_list: WordList, row_key: int, alternatives_pool, flashcard_only: bool,
+                alternatives_index: SimilarityIndex = None, pool_version=None,
+                learning_progress: LearningProgress = None, rng: random.Random = None) -> QuizPackage:
+    rng = _random(rng)
+    with get_instrumentation().timer("build_quiz"):
+        flashcard = Flashcard(
+            lang1=word_list.flashcards[row_key].lang1,
+            lang2=word_list.flashcards[row_key].lang2,
+            remarks=word_list.flashcards[row_key].remarks,
+            learning_status=word_list.flashcards[row_key].learning_status if learning_progress is None
+            else learning_progress[row_key]
+        )
+
+        if flashcard_only:
+            question = None
+        else:
+            incorrect_alternatives = alternatives.most_similar(flashcard.lang1, alternatives_pool,
+                                                               SHORTLIST_COUNT, ALTERNATIVES_COUNT,
+                                                               alternatives.calc_similarity, alternatives_index,
+                                                               pool_version, rng)
+
+            question = Question(row_key=row_key,
+                                text=flashcard.lang2,
+                                options=[flashcard.lang1] + incorrect_alternatives)
+            rng.shuffle(question.options)
+
+        quiz_package = QuizPackage(directives={SHOW_FLASHCARD_KEY_NAME: flashcard_only},
+                                   question=question,
+                                   flashcard=flashcard)
+        return quiz_package
+
+
+class _PrecomputedShortlists:
+    """
+    Shortlists computed in advance, with the same interface as SimilarityIndex
+    """
+
+    def __init__(self, shortlists: Dict[str, List[str]]):
+        self.shortlists = shortlists
+
+    def shortlist(self, expression: str, shortlist_count: int) -> List[str]:
+        return list(self.shortlists[expression][:shortlist_count])
+
+
+def _precomputed_shortlists(pool_version, expressions: List[str],
+                            shortlist_many: Callable[[List[str], int], List[List[str]]]) -> _PrecomputedShortlists:
+    """
+    Shortlists of the expressions, only the ones that aren't in the shortlist cache are calculated by shortlist_many
+    """
+    instrumentation = get_instrumentation()
+    shortlists = {}
+    for expression in expressions:
+        shortlist = alternatives.shortlist_cache.get(pool_version, expression, SHORTLIST_COUNT)
+        if instrumentation.enabled:
+            instrumentation.count("shortlist_cache_hits" if shortlist is not None else "shortlist_cache_misses")
+        if shortlist is not None:
+            shortlists[expression] = shortlist
+    missing = [expression for expression in expressions if expression not in shortlists]
+    if len(missing) > 0:
+        for expression, shortlist in zip(missing, shortlist_many(missing, SHORTLIST_COUNT)):
+            alternatives.shortlist_cache.put(pool_version, expression, SHORTLIST_COUNT, shortlist)
+            shortlists[expression] = shortlist
+    return _PrecomputedShortlists(shortlists)
+
+
+def choice_quiz_batch(requests: List[Tuple["Vocabulary", str, str]]) -> List[List[QuizPackage]]:
+    """
+    Generate the quizzes for many (vocabulary, word_list_name, quiz_strategy) requests, e. g. for many users.
+    The rows are picked for every request first, then the expressions that need alternatives are deduplicated
+    and scored in one pass per word pool (and per way of scoring, see Vocabulary.approximate_alternatives and
+    Vocabulary.distractor_workers). The shortlists that are in the shortlist cache aren't scored again.
+    :return: the quiz packages of every request, in the order of the requests
+    """
+    picked_row_keys = [vocabulary._pick_row_keys(word_list_name) for vocabulary, word_list_name, _ in requests]
+
+    # Expressions that need alternatives, grouped by the pool version of their shortlists
+    shortlisters: Dict[object, Callable[[List[str], int], List[List[str]]]] = {}
+    pool_versions = []
+    expressions: Dict[object, Dict[str, None]] = {}
+    for (vocabulary, word_list_name, _), row_keys in zip(requests, picked_row_keys):
+        flashcards = vocabulary._get_word_list(word_list_name).flashcards
+        pool_version, shortlist_many = vocabulary._shortlister()
+        shortlisters.setdefault(pool_version, shortlist_many)
+        pool_versions.append(pool_version)
+        pool_expressions = expressions.setdefault(pool_version, {})
+        for row_key in [row_key for rows in row_keys for row_key in rows]:
+            pool_expressions[flashcards[row_key].lang1] = None
+
+    shortlists = {pool_version: _precomputed_shortlists(pool_version, list(pool_expressions),
+                                                        shortlisters[pool_version])
+                  for pool_version, pool_expressions in expressions.items()}
+
+    return [vocabulary._build_quiz_packages(word_list_name, *row_keys, shortlists[pool_version])
+            for (vocabulary, word_list_name, _), row_keys, pool_version in zip(requests, picked_row_keys,
+                                                                               pool_versions)]
+
+
+class SharedDeck:
+    """
+    Word collection shared by the Vocabulary objects of many users (see Vocabulary.use_deck) and its word pools.
+    The learning statuses of the collection are the starting statuses of every user, the invalid ones are replaced
+    by the default status.
+    """
+
+    def __init__(self, word_collection: WordCollection, pool_registry: PoolRegistry = None):
+        pool_registry = pool_registry if pool_registry is not None else poolregistry.registry
+        for word_list in word_collection.word_lists.values():
+            _validate_in_place(word_list.learning_progress)
+        self.word_collection = word_collection
+        self.shared_pool: SharedPool = pool_registry.acquire(word_collection)
+        self._release_shared_pool = weakref.finalize(self, pool_registry.release, self.shared_pool)
+
+    def close(self):
+        """
+        Release the shared word pools, they are also released when the object is garbage collected
+        """
+        self._release_shared_pool()
+
+
+class Vocabulary:
+    """
+    Provide the Vocabulary library functionalities: e. g. loading word list, picking and answering questions,
+    getting and resetting learning progress.
+
+    """
+
+    def __init__(self, pool_registry: PoolRegistry = None, approximate_alternatives: bool = False,
+                 distractor_workers: DistractorWorkers = None, rng: random.Random = None):
+        """
+        :param pool_registry: registry of the word pools, the registry of the process by default
+        :param approximate_alternatives: find the alternatives with the MinHash index of the word pool instead of
+            the exact similarity index, it's faster for very large word pools but it may miss similar expressions
+        :param distractor_workers: worker processes computing the alternatives of all the questions of a quiz in
+            parallel (with the exact similarity index), they must be closed by the caller
+        :param rng: random generator picking the rows, the alternatives and the order of the questions and options,
+            pass a seeded one to replay the same quizzes. Every instance has its own generator by default.
+        """
+        self.status = VSTATUS_LOAD_FILE
+        self.word_collection: WordCollection = None
+        self.word_pool_lang1 = None
+        self.word_pool_lang2 = None
+        self.word_pool_lang1_index: SimilarityIndex = None
+        self.selected_word_list_name = None
+        self.approximate_alternatives = approximate_alternatives
+        self.distractor_workers = distractor_workers
+        self.random = rng if rng is not None else random.Random()
+        # Instances loading the same word collection share the word pools from the registry
+        self.pool_registry = pool_registry if pool_registry is not None else poolregistry.registry
+        self.shared_pool: SharedPool = None
+        self._release_shared_pool = None
+        # Set by use_deck: the shared deck and the learning statuses of the user that differ from the deck's
+        self.deck: SharedDeck = None
+        self.user_progress: Dict[str, Dict[int, int]] = None
+        self._progress_overlays: Dict[str, ProgressOverlay] = {}
+        # Word lists whose words are in the word pools (ids), the pools are extended when a lazily loaded word list
+        # is loaded
+        self._pooled_word_lists: Set[int] = set()
+
+    def load(self, path: str, load_function: Callable[[str], WordCollection]):
+        with get_instrumentation().timer("load"):
+            self.word_collection= load_function(path)
+            self._set_shared_pool(self.pool_registry.acquire(self.word_collection))
+
+    def use_deck(self, deck: SharedDeck, user_progress: Dict[str, Dict[int, int]] = None):
+        """
+        Use a word collection shared with other users instead of loading one, the deck is never changed.
+        The learning progress of the user is kept in user_progress: the learning statuses that differ from the ones
+        of the deck by word list name and row key. It's updated in place, so its size only depends on the progress
+        of the user, and it can be stored by the caller and passed here again later.
+        """
+        self.close()
+        self.word_collection = deck.word_collection
+        self._use_pools(deck.shared_pool)
+        self.deck = deck
+        self.user_progress = user_progress if user_progress is not None else {}
+        self._progress_overlays = {}
+
+    def close(self):
+        """
+        Release the shared word pools, they are also released when the object is garbage collected
+        """
+        if self._release_shared_pool is not None:
+            self._release_shared_pool()
+            self._release_shared_pool = None
+
+    def _set_shared_pool(self, shared_pool: SharedPool):
+        self.close()
+        self._use_pools(shared_pool)
+        self.deck = None
+        self.user_progress = None
+        self._progress_overlays = {}
+        self._release_shared_pool = weakref.finalize(self, self.pool_registry.release, shared_pool)
+
+    def _use_pools(self, shared_pool: SharedPool):
+        self.shared_pool = shared_pool
+        self._pooled_word_lists = {id(word_list) for word_list in loaded_word_lists(self.word_collection)}
+        self.word_pool_lang1 = shared_pool.word_pool_lang1
+        self.word_pool_lang2 = shared_pool.word_pool_lang2
+        self.word_pool_lang1_index = shared_pool.word_pool_lang1_index
+
+    def save(self, path: str, save_function: Callable[[str, WordCollection], None]):
+        save_function(path, self.word_collection)
+
+    def get_word_sheet_list(self) -> list:
+        return list(self.word_collection.word_lists.keys())  # It only returns valid worksheets
+
+    def choice_quiz(self, word_list_name: str, quiz_strategy: str) -> (bool, Question, Flashcard):
+        """
+        Fetch a question from the given word sheet. Generate one correct and several incorrect answer options.
+        Return the text of the question (e. g. pick the correct answer) and the answer options for the question.
+
+        :return: whether to show the flashcard (instead of the question), Question, Flashcard
+        """
+        instrumentation = get_instrumentation()
+        with instrumentation.timer("choice_quiz"):
+            with instrumentation.timer("pick_rows"):
+                row_keys_new, row_keys_recent, row_keys_learned = self._pick_row_keys(word_list_name)
+            if self.distractor_workers is not None:
+                shortlists = self._worker_shortlists(word_list_name,
+                                                     row_keys_new + row_keys_recent + row_keys_learned)
+                return self._build_quiz_packages(word_list_name, row_keys_new, row_keys_recent, row_keys_learned,
+                                                 shortlists)
+            if self.approximate_alternatives:
+                # The approximate shortlists are cached separately from the exact ones
+                return self._build_quiz_packages(word_list_name, row_keys_new, row_keys_recent, row_keys_learned,
+                                                 self.shared_pool.word_pool_lang1_minhash,
+                                                 (self.shared_pool.key, "minhash"))
+            return self._build_quiz_packages(word_list_name, row_keys_new, row_keys_recent, row_keys_learned,
+                                             self.word_pool_lang1_index, self.shared_pool.key)
+
+    def choice_quiz_batch(self, requests: List[Tuple[str, str]]) -> List[List[QuizPackage]]:
+        """
+        Same as calling choice_quiz for every (word_list_name, quiz_strategy) request,
+        but the alternatives of all the questions are generated at once
+        """
+        return choice_quiz_batch([(self, word_list_name, quiz_strategy)
+                                  for word_list_name, quiz_strategy in requests])
+
+    def _pick_row_keys(self, word_list_name: str) -> (List[int], List[int], List[int]):
+        # Pick 5 expressions, get flashcards and alternatives
+        learning_progress: LearningProgress = self._get_learning_progress(word_list_name)
+        row_keys_new = pick_words_with_status(learning_progress=learning_progress,
+                                              learning_status=Progress.NEW,
+                                              order=PickOrder.ORIGINAL,
+                                              max_count_from_size=lambda v:  5,
+                                              rng=self.random)
+
+        row_keys_recent = pick_words_with_status(learning_progress=learning_progress,
+                                                 learning_status=Progress.RECENT,
+                                                 order=PickOrder.SHUFFLED,
+                                                 max_count_from_size=lambda v:  5,
+                                                 rng=self.random)
+
+        row_keys_learned = pick_words_with_status(learning_progress=learning_progress,
+                                                  learning_status=Progress.LEARNED,
+                                                  order=PickOrder.SHUFFLED,
+                                                  max_count_from_size=lambda size:  3 if size > 10 else 0,
+                                                  rng=self.random)
+        return row_keys_new, row_keys_recent, row_keys_learned
+
+    def _worker_shortlists(self, word_list_name: str, row_keys: List[int]) -> _PrecomputedShortlists:
+        flashcards = self._get_word_list(word_list_name).flashcards
+        expressions = list(dict.fromkeys(flashcards[row_key].lang1 for row_key in row_keys))
+        pool_version, shortlist_many = self._shortlister()
+        return _precomputed_shortlists(pool_version, expressions, shortlist_many)
+
+    def _shortlister(self) -> Tuple[object, Callable[[List[str], int], List[List[str]]]]:
+        """
+        Get the pool version of the shortlists of this object and the function computing many shortlists at once,
+        following approximate_alternatives and distractor_workers
+        """
+        if self.distractor_workers is not None:
+            # The workers are restarted when the word pool changes
+            self.distractor_workers.start(self.word_pool_lang1, self.shared_pool.key)
+            return self.shared_pool.key, self.distractor_workers.shortlist_many
+        if self.approximate_alternatives:
+            # The approximate shortlists are cached separately from the exact ones
+            minhash = self.shared_pool.word_pool_lang1_minhash
+            return (self.shared_pool.key, "minhash"), \
+                lambda expressions, shortlist_count: [minhash.shortlist(expression, shortlist_count)
+                                                      for expression in expressions]
+        return self.shared_pool.key, self.shared_pool.word_pool_lang1_scorer.shortlist_many
+
+    def _build_quiz_packages(self, word_list_name: str, row_keys_new: List[int], row_keys_recent: List[int],
+                             row_keys_learned: List[int], alternatives_index,
+                             pool_version=None) -> List[QuizPackage]:
+        rng = self.random
+        learning_progress = self._get_learning_progress(word_list_name)
+        flashcards_only = [_build_quiz(word_list=self._get_word_list(word_list_name),
+                           row_key=row_key,
+                        alternatives_pool=None,
+                         flashcard_only=True,
+                         learning_progress=learning_progress) for row_key in row_keys_new]
+        new_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
+                           row_key=row_key,
+                           alternatives_pool=self.word_pool_lang1,
+                           flashcard_only=False,
+                           alternatives_index=alternatives_index,
+                           pool_version=pool_version,
+                           learning_progress=learning_progress,
+                           rng=rng) for row_key in row_keys_new]
+        rng.shuffle(new_questions)
+
+        recent_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
+                                     row_key=row_key,
+                                     alternatives_pool=self.word_pool_lang1,
+                                     flashcard_only=False,
+                                     alternatives_index=alternatives_index,
+                                     pool_version=pool_version,
+                                     learning_progress=learning_progress,
+                                     rng=rng) for row_key in row_keys_recent]
+        rng.shuffle(recent_questions)
+
+        learned_questions = [_build_quiz(word_list=self._get_word_list(word_list_name),
+                                        row_key=row_key,
+                                        alternatives_pool=self.word_pool_lang1,
+                                        flashcard_only=False,
+                                        alternatives_index=alternatives_index,
+                                        pool_version=pool_version,
+                                        learning_progress=learning_progress,
+                                        rng=rng) for row_key in row_keys_learned]
+        rng.shuffle(learned_questions)
+
+        quiz_packages = flashcards_only + new_questions + recent_questions + learned_questions
+
+        return quiz_packages
+
+    def update_progress(self, word_list_name: str, row_key, q_correctly_answered: bool):
+        """
+        Check the given answer if it's correct or not correct. Update the learning progress based on the answer.
+        :return:
+        """
+
+        # The learning progress of the word list is updated in place
+        with get_instrumentation().timer("update_progress"):
+            submit_answer(self._get_learning_progress(word_list_name), row_key, q_correctly_answered)
+
+    # Calculates the learning progress
+    def get_progress(self, word_list_name):
+        return learningprogress.calculate_learning_progress(self._get_learning_progress(word_list_name))
+
+    def reset_progress(self, word_list_name: str):
+        learningprogress.reset_progress(self._get_learning_progress(word_list_name))
+
+    def _get_learning_progress(self, word_list_name: str) -> LearningProgress:
+        if self.user_progress is None:
+            return _get_learning_progress(self._get_word_list(word_list_name))
+        overlay = self._progress_overlays.get(word_list_name)
+        if overlay is None:
+            overlay = ProgressOverlay(self._get_word_list(word_list_name).learning_progress,
+                                      self.user_progress.setdefault(word_list_name, {}))
+            self._progress_overlays[word_list_name] = overlay
+        return overlay
+
+    def _get_word_list(self, word_list_name: str) -> WordList:
+        word_list = self.word_collection.word_lists[word_list_name]
+        if self.deck is not None:
+            return word_list
+        new_word_lists = [word_list for word_list in loaded_word_lists(self.word_collection)
+                          if id(word_list) not in self._pooled_word_lists]
+        if len(new_word_lists) > 0:
+            # A word list was loaded or added: its words are added to the pools if they aren't shared,
+            # otherwise the pools of the changed collection are acquired
+            if self.pool_registry.extend(self.shared_pool, self.word_collection, new_word_lists):
+                self._use_pools(self.shared_pool)
+            else:
+                self._set_shared_pool(self.pool_registry.acquire(self.word_collection))
+        return word_list
+
+    def _set_word_list(self, word_list_name: str, word_list: WordList):
+        self.word_collection.word_lists[word_list_name] = word_list
+
+
+
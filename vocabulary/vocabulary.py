@@ -10,21 +10,24 @@ import random
 from . import alternatives, learningprogress
 from .models import Question, Flashcard
 from typing import Dict
-from .models import WordCollection, WordList
+from .models import WordCollection, WordList, LearningProgress, loaded_word_lists
+from .similarityindex import SimilarityIndex
 
 VSTATUS_LOAD_FILE = 1
 VSTATUS_CHOOSE_SHEET = 2
 VSTATUS_READY_FOR_QUIZ = 3
 
 
-def _choice_quiz(word_list: WordList, word_pool: list) -> (bool, dict, dict):
+def _choice_quiz(word_list: WordList, word_pool: list, word_pool_index: SimilarityIndex = None,
+                 rng: random.Random = None) -> (bool, dict, dict):
+    rng = learningprogress._random(rng)
     active_limit = 5
     recent_limit = 50
 
     learning_progress_dict: Dict[int, str] = _get_learning_progress(word_list)
 
     new_progress_dict, row_key, show_flashcard = \
-        learningprogress.pick_word(learning_progress_dict, active_limit, recent_limit)
+        learningprogress.pick_word(learning_progress_dict, active_limit, recent_limit, rng)
     new_word_list = _update_learning_progress(word_list, new_progress_dict)
 
     flashcard = Flashcard(
@@ -35,12 +38,12 @@ def _choice_quiz(word_list: WordList, word_pool: list) -> (bool, dict, dict):
     )
 
     incorrect_alternatives = alternatives.most_similar(flashcard.lang1, word_pool, 50, 4,
-                                                       alternatives.calc_similarity)
+                                                       alternatives.calc_similarity, word_pool_index, rng=rng)
 
     question = Question(row_key=row_key,
                         text=flashcard.lang2,
                         options=[flashcard.lang1] + incorrect_alternatives)
-    random.shuffle(question.options)
+    rng.shuffle(question.options)
 
     # If the word is seen for the first time, a flashcard will be shown instead of the question
     return new_word_list, show_flashcard, question, flashcard
@@ -63,13 +66,10 @@ def _check_answer(question: Question, answer: str, word_list: WordList) -> (bool
     else:
         is_correct = False
 
-    # Modify word_dict accordingly
-    learning_progress_mod = learningprogress.submit_answer(_get_learning_progress(word_list),
-                                                           question.row_key, is_correct)
+    # Modify the learning status of the row in place
+    learningprogress.submit_answer(_get_learning_progress(word_list), question.row_key, is_correct)
 
-    word_list_mod = _update_learning_progress(word_list, learning_progress_mod)
-
-    return is_correct, flashcard, word_list_mod
+    return is_correct, flashcard, word_list
 
 
 def _build_word_pool(word_collection: WordCollection) -> (list, list):
@@ -83,29 +83,34 @@ def _build_word_pool(word_collection: WordCollection) -> (list, list):
     word_pool_lang1 = []
     word_pool_lang2 = []
 
-    for sheet_name in word_collection.word_lists:
-        for flashcard in word_collection.word_lists[sheet_name].flashcards.values():
-            word_pool_lang1.append(flashcard.lang1)
-            word_pool_lang2.append(flashcard.lang2)
+    # The lazily loaded word lists are only added to the pools once they're loaded
+    for word_list in loaded_word_lists(word_collection):
+        flashcards = word_list.flashcards
+        word_pool_lang1.extend(flashcards.lang1_values)
+        word_pool_lang2.extend(flashcards.lang2_values)
 
     return word_pool_lang1, word_pool_lang2
 
 
 def _update_learning_progress(word_list: WordList, learning_progress_dict: Dict[int, str]):
+    """
+    Copy the learning statuses to the word list, only the changed rows are updated
+    """
+    if learning_progress_dict is word_list.learning_progress:
+        return word_list
 
-    new_flashcards = {row: Flashcard(lang1=flashcard.lang1,
-                                     lang2=flashcard.lang2,
-                                     remarks=flashcard.remarks,
-                                     learning_status=learning_progress_dict[row])
-                      for row, flashcard in word_list.flashcards.items()}
-
-    word_list.flashcards = new_flashcards
+    learning_progress = word_list.learning_progress
+    for row, learning_status in learning_progress_dict.items():
+        if learning_progress[row] != learning_status:
+            learning_progress[row] = learning_status
     return word_list
 
 
-def _get_learning_progress(word_list: WordList) -> Dict[int, str]:
-    return {key: flashcard.learning_status for key, flashcard
-            in word_list.flashcards.items()}
+def _get_learning_progress(word_list: WordList) -> LearningProgress:
+    """
+    Get the learning progress of the word list, it's a view: changing it changes the word list
+    """
+    return word_list.learning_progress
 
 
 class Vocabulary:
@@ -115,7 +120,11 @@ class Vocabulary:
 
     """
 
-    def __init__(self):
+    def __init__(self, rng: random.Random = None):
+        """
+        :param rng: random generator picking the words, the alternatives and the order of the options,
+            pass a seeded one to replay the same quizzes. Every instance has its own generator by default.
+        """
         self.status = VSTATUS_LOAD_FILE
         self.wb_path: str = None
         self.workbook = None
@@ -123,18 +132,28 @@ class Vocabulary:
         self._current_question = None
         self.word_pool_lang1 = None
         self.word_pool_lang2 = None
+        self.word_pool_lang1_index: SimilarityIndex = None
         self.selected_word_list_name = None
+        self.random = rng if rng is not None else random.Random()
 
     def load(self, wb_path: str):
 
         self.word_collection = dataaccess.load_wordlist_book(wb_path)
         self.word_pool_lang1, self.word_pool_lang2 = _build_word_pool(self.word_collection)
+        self.word_pool_lang1_index = SimilarityIndex(self.word_pool_lang1)
         self.wb_path = wb_path
         self.status = VSTATUS_CHOOSE_SHEET
 
     def save(self):
         dataaccess.save_wordlist_book(self.wb_path, self.word_collection)
 
+    def save_progress(self):
+        """
+        Save only the changed learning statuses, they're appended to the progress file of the workbook
+        (see dataaccess.save_learning_progress). Use save to write the workbook itself.
+        """
+        dataaccess.save_learning_progress(self.wb_path, self.word_collection)
+
     def get_word_sheet_list(self) -> list:
         return list(self.word_collection.word_lists.keys())  # It only returns valid worksheets
 
@@ -161,7 +180,9 @@ class Vocabulary:
             logging.warning("choice_quiz was called again without answering the question from the previous call")
 
         new_word_list, show_flashcard, question, flashcard = _choice_quiz(self.get_current_word_list(),
-                                                           self.word_pool_lang1)
+                                                           self.word_pool_lang1,
+                                                           self.word_pool_lang1_index,
+                                                           self.random)
         self.set_current_word_list(new_word_list)
 
         self._current_question = question
@@ -195,8 +216,4 @@ class Vocabulary:
             _get_learning_progress(self.get_current_word_list()))
 
     def reset_progress(self):
-        word_list = self.get_current_word_list()
-        learning_progress_dict = learningprogress.reset_progress(
-            _get_learning_progress(word_list)
-        )
-        self.set_current_word_list(_update_learning_progress(word_list, learning_progress_dict))
+        learningprogress.reset_progress(_get_learning_progress(self.get_current_word_list()))